@@ -0,0 +1,171 @@
+"""
+Benchmarks for the bank system simulation.
+============================================================
+Run from this directory:
+    python benchmark.py top-spenders
+    python benchmark.py top-spenders --accounts 1000000 --n 3
+    python benchmark.py merge --accounts 10000 --pending 1000000
+    python benchmark.py scheduler --events 2000000
+    python benchmark.py standing-orders --orders 500000
+"""
+import argparse
+import random
+import time
+
+from scheduler import Scheduler
+from simulation_solution import Simulation
+
+
+def populate(simulation: Simulation, accounts: int) -> list[str]:
+    """Create `accounts` funded accounts at timestamp 1."""
+    ids = [f"acc{i}" for i in range(accounts)]
+    for account_id in ids:
+        simulation.create_account(1, account_id)
+        simulation.deposit(1, account_id, 10**9)
+    return ids
+
+
+def bench_top_spenders(accounts: int, n: int, rounds: int) -> None:
+    """
+    Cost of one payment followed by top_spenders(n): the ranking against
+    re-sorting every account by (-outgoing, account_id) on each call.
+    """
+    rng = random.Random(0)
+    simulation = Simulation()
+    start = time.perf_counter()
+    ids = populate(simulation, accounts)
+    print(f"{accounts} accounts created in {time.perf_counter() - start:.1f}s")
+
+    def sort_all(simulation: Simulation, n: int) -> list[str]:
+        top = sorted(simulation.accounts, key=lambda acc: (-simulation.accounts[acc].outgoing, acc))
+        return [f"{acc}({simulation.accounts[acc].outgoing})" for acc in top[:n]]
+
+    ts = 1
+    for label, top_spenders in (("full sort", sort_all),
+                                ("ranking", lambda simulation, n: simulation.top_spenders(ts, n))):
+        elapsed = 0.0
+        for _ in range(rounds):
+            ts += 1
+            begin = time.perf_counter()
+            simulation.pay(ts, rng.choice(ids), rng.randrange(1, 1000))
+            result = top_spenders(simulation, n)
+            elapsed += time.perf_counter() - begin
+        print(f"{label:<10} {elapsed / rounds * 1e6:12.1f} us per pay + top_spenders({n})  {result}")
+
+
+def bench_merge(accounts: int, pending: int, merges: int) -> None:
+    """Cost of merge_accounts while `pending` cashbacks are waiting."""
+    rng = random.Random(0)
+    simulation = Simulation()
+    ids = populate(simulation, accounts)
+    ts = 1
+    for _ in range(pending):
+        ts += 1
+        simulation.pay(ts, rng.choice(ids), 100)
+    elapsed = 0.0
+    for _ in range(merges):
+        ts += 1
+        first, second = rng.sample(list(simulation.accounts), 2)
+        begin = time.perf_counter()
+        simulation.merge_accounts(ts, first, second)
+        elapsed += time.perf_counter() - begin
+    print(f"{accounts} accounts, {len(simulation.scheduler)} pending cashbacks")
+    print(f"merge_accounts: {elapsed / merges * 1e6:.1f} us")
+
+
+def bench_scheduler(events: int, max_delay: int, steps: int) -> None:
+    """Per-event cost of scheduling `events` arbitrary-delay events and firing them."""
+    rng = random.Random(0)
+    scheduler = Scheduler()
+    delays = [rng.randrange(max_delay) for _ in range(events)]
+
+    def callback(timestamp: int) -> None:
+        pass
+
+    start = time.perf_counter()
+    for delay in delays:
+        scheduler.schedule(delay, callback)
+    scheduled = time.perf_counter() - start
+    start = time.perf_counter()
+    fired = sum(scheduler.run_until(max_delay * step // steps) for step in range(1, steps + 1))
+    elapsed = time.perf_counter() - start
+    print(f"{events} events, delays up to {max_delay}, drained in {steps} steps")
+    print(f"schedule: {scheduled / events * 1e9:.0f} ns/event   fire: {elapsed / fired * 1e9:.0f} ns/event")
+
+
+def bench_standing_orders(accounts: int, orders: int, runs: int, operations: int) -> None:
+    """
+    Cost of scheduling, cancelling and running recurring payments, and of
+    ordinary operations while they are pending.
+    """
+    rng = random.Random(0)
+    simulation = Simulation()
+    ids = populate(simulation, accounts)
+    interval = 60_000
+    start = time.perf_counter()
+    schedules = [simulation.schedule_recurring_payment(2, rng.choice(ids), 1, interval, runs)
+                 for _ in range(orders)]
+    scheduled = time.perf_counter() - start
+    cancelled = schedules[::10]
+    start = time.perf_counter()
+    for schedule_id in cancelled:
+        simulation.cancel_schedule(3, schedule_id)
+    cancelling = time.perf_counter() - start
+
+    # Ordinary deposits spread over the window in which every run fires
+    end = 2 + interval * runs
+    ts = 3
+    elapsed = 0.0
+    for i in range(operations):
+        ts = max(ts, 3 + end * i // operations)
+        start = time.perf_counter()
+        simulation.deposit(ts, rng.choice(ids), 1)
+        elapsed += time.perf_counter() - start
+    start = time.perf_counter()
+    simulation.top_spenders(end, 3)
+    elapsed += time.perf_counter() - start
+    fired = (orders - len(cancelled)) * runs
+    print(f"{orders} standing orders x {runs} runs over {accounts} accounts")
+    print(f"schedule: {scheduled / orders * 1e6:.1f} us   cancel: {cancelling / len(cancelled) * 1e6:.1f} us")
+    print(f"{operations} deposits running {fired} payments: "
+          f"{elapsed / fired * 1e6:.1f} us per payment run")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = sub.add_parser("top-spenders", help="top_spenders cost, full sort vs ranking")
+    p.add_argument("--accounts", type=int, default=1_000_000)
+    p.add_argument("--n", type=int, default=3)
+    p.add_argument("--rounds", type=int, default=5)
+
+    p = sub.add_parser("merge", help="merge_accounts cost with many pending cashbacks")
+    p.add_argument("--accounts", type=int, default=10_000)
+    p.add_argument("--pending", type=int, default=1_000_000)
+    p.add_argument("--merges", type=int, default=1_000)
+
+    p = sub.add_parser("scheduler", help="cost per event of the delayed-event scheduler")
+    p.add_argument("--events", type=int, default=2_000_000)
+    p.add_argument("--max-delay", type=int, default=30 * 24 * 60 * 60 * 1000)
+    p.add_argument("--steps", type=int, default=1_000)
+
+    p = sub.add_parser("standing-orders", help="recurring payments: schedule, cancel and run")
+    p.add_argument("--accounts", type=int, default=10_000)
+    p.add_argument("--orders", type=int, default=500_000)
+    p.add_argument("--runs", type=int, default=4)
+    p.add_argument("--operations", type=int, default=10_000)
+
+    args = parser.parse_args()
+    if args.benchmark == "top-spenders":
+        bench_top_spenders(args.accounts, args.n, args.rounds)
+    elif args.benchmark == "merge":
+        bench_merge(args.accounts, args.pending, args.merges)
+    elif args.benchmark == "scheduler":
+        bench_scheduler(args.events, args.max_delay, args.steps)
+    elif args.benchmark == "standing-orders":
+        bench_standing_orders(args.accounts, args.orders, args.runs, args.operations)
+
+
+if __name__ == "__main__":
+    main()
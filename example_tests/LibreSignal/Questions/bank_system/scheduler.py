@@ -0,0 +1,90 @@
+"""
+Delayed events for the bank system simulation.
+============================================================
+Operations carry a logical timestamp, and anything due at or before it
+(a cashback, a scheduled transfer, the next run of a recurring payment)
+must take effect first. A Scheduler holds those events in a binary heap
+keyed by (due timestamp, scheduling order), so events fire in timestamp
+order and events due at the same time fire in the order they were
+scheduled, whatever their delays.
+
+Scheduling and firing cost O(log P) for P pending events, with no
+per-account or per-operation scans. The heap holds one int per event,
+the due timestamp and the event id packed together, which compares about
+twice as fast as a tuple; callbacks live in a dict by event id.
+Cancelling is O(1): the event leaves the dict, and its heap entry is
+dropped when it reaches the top.
+
+Usage:
+    scheduler = Scheduler()
+    event_id = scheduler.schedule(ts + delay, callback, arg)
+    scheduler.run_until(now)    # calls callback(due, arg) for every due event
+    scheduler.cancel(event_id)
+"""
+import heapq
+import itertools
+from collections.abc import Callable
+
+# Heap keys are due << _ID_BITS | event id: ordered by due timestamp, then
+# by event id, which increases with every schedule() call.
+_ID_BITS = 40
+_ID_MASK = (1 << _ID_BITS) - 1
+
+
+class Scheduler:
+    def __init__(self):
+        self._heap: list[int] = []  # packed (due, event id) keys
+        self._pending: dict[int, tuple[Callable[..., None], tuple]] = {}  # {event_id: (callback, args)}
+        self._ids = itertools.count(1)
+
+    def __len__(self) -> int:
+        """Number of events scheduled and neither fired nor cancelled."""
+        return len(self._pending)
+
+    def __contains__(self, event_id: int) -> bool:
+        return event_id in self._pending
+
+    def schedule(self, timestamp: int, callback: Callable[..., None], *args) -> int:
+        """
+        Call callback(timestamp, *args) once run_until() reaches timestamp.
+
+        Returns:
+            An event id for cancel().
+        """
+        event_id = next(self._ids)
+        self._pending[event_id] = (callback, args)
+        heapq.heappush(self._heap, timestamp << _ID_BITS | event_id)
+        return event_id
+
+    def cancel(self, event_id: int) -> bool:
+        """Drop a pending event. Returns False if it already fired or was cancelled."""
+        return self._pending.pop(event_id, None) is not None
+
+    def next_due(self) -> int | None:
+        """Timestamp of the earliest pending event, or None."""
+        heap, pending = self._heap, self._pending
+        while heap and heap[0] & _ID_MASK not in pending:
+            heapq.heappop(heap)
+        return heap[0] >> _ID_BITS if heap else None
+
+    def run_until(self, timestamp: int) -> int:
+        """
+        Fire every event due at or before timestamp, in order, including
+        events that callbacks schedule within the window.
+
+        Returns:
+            The number of events fired.
+        """
+        heap, pending = self._heap, self._pending
+        fired = 0
+        # Keys of events due at or before timestamp are below this bound
+        bound = timestamp + 1 << _ID_BITS
+        while heap and heap[0] < bound:
+            key = heapq.heappop(heap)
+            event = pending.pop(key & _ID_MASK, None)
+            if event is None:  # cancelled
+                continue
+            callback, args = event
+            callback(key >> _ID_BITS, *args)
+            fired += 1
+        return fired
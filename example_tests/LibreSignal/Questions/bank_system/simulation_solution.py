@@ -2,28 +2,55 @@
 A solution for the bank system simulation problem.
 ============================================================
 This implementation includes account creation, deposits, transfers,
-top spenders tracking, payments with cashback, account merging, and
-historical balance retrieval.
+top spenders tracking, payments with cashback, account merging,
+historical balance retrieval, and scheduled and recurring operations.
 
 Author: Eric Zheng
 Date: Jan 2026
 """
-from collections import deque
+from array import array
+import bisect
+import heapq
+
+from scheduler import Scheduler
+
+
 class Account:
     def __init__(self, account_id: str, created_at: int):
         self.account_id = account_id
         self.balance = 0
         self.outgoing = 0  # Total outgoing transactions (transfers out, payments)
-        self.payments: dict[str, str] = {}  # {payment_id: status}
         self.created_at = created_at
-        # Balance history: list of (timestamp, balance). 
-        # Records balance AFTER each operation
-        self.balance_history: list[tuple[int, int]] = [(created_at, 0)]
-    
+        # The account this one was merged into, if any; a union-find parent
+        # pointer, so everything that refers to this account follows it
+        self.merged_into: Account | None = None
+        # Balance history: parallel columns of timestamps (sorted) and the
+        # balance AFTER the operation at that timestamp. Machine integers in
+        # arrays take 16 bytes per entry instead of a tuple of two ints.
+        self.history_times = array("q", [created_at])
+        self.history_balances = array("q", [0])
+
+    @property
+    def balance_history(self) -> list[tuple[int, int]]:
+        """The history as (timestamp, balance) pairs."""
+        return list(zip(self.history_times, self.history_balances))
+
     def record_balance(self, timestamp: int) -> None:
         """Record current balance at this timestamp."""
-        self.balance_history.append((timestamp, self.balance))
-    
+        self.history_times.append(timestamp)
+        self.history_balances.append(self.balance)
+
+    def merge_history(self, other: "Account") -> None:
+        """Merge other's history into this one in linear time; both are sorted."""
+        times, balances = array("q"), array("q")
+        merged = heapq.merge(zip(self.history_times, self.history_balances),
+                             zip(other.history_times, other.history_balances),
+                             key=lambda entry: entry[0])
+        for ts, balance in merged:
+            times.append(ts)
+            balances.append(balance)
+        self.history_times, self.history_balances = times, balances
+
     def deposit(self, amount: int) -> int:
         self.balance += amount
         return self.balance
@@ -40,14 +67,65 @@ class Account:
         """Get balance at a specific timestamp. Returns None if account didn't exist."""
         if time_at < self.created_at:
             return None
-        # Find the latest balance at or before time_at
-        # You could use binary search for efficiency
-        result = None
-        for ts, balance in self.balance_history:
-            if ts <= time_at:
-                result = balance
-            else:
+        # Binary search for the latest balance at or before time_at
+        i = bisect.bisect_right(self.history_times, time_at)
+        return self.history_balances[i - 1] if i else None
+
+
+class Ranking:
+    """
+    A sorted multiset of (-outgoing, account_id) keys, kept as a list of
+    sorted buckets, so the first n keys are the top n spenders.
+
+    Adding or removing a key bisects the bucket maxima and then one bucket
+    of at most 2 * LOAD keys, so an update is O(log A) comparisons plus a
+    short memmove instead of re-sorting all A accounts; first(n) is O(n).
+    """
+    LOAD = 512
+
+    def __init__(self):
+        self._buckets: list[list[tuple[int, str]]] = []
+        self._maxes: list[tuple[int, str]] = []  # last key of every bucket
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self._buckets)
+
+    def add(self, key: tuple[int, str]) -> None:
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            return
+        i = bisect.bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+            bucket = self._buckets[i]
+            bucket.append(key)
+            self._maxes[i] = key
+        else:
+            bucket = self._buckets[i]
+            bisect.insort(bucket, key)
+        if len(bucket) > 2 * self.LOAD:
+            self._buckets.insert(i + 1, bucket[self.LOAD:])
+            del bucket[self.LOAD:]
+            self._maxes.insert(i, bucket[-1])
+
+    def remove(self, key: tuple[int, str]) -> None:
+        i = bisect.bisect_left(self._maxes, key)
+        bucket = self._buckets[i]
+        del bucket[bisect.bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+
+    def first(self, n: int) -> list[tuple[int, str]]:
+        """The n smallest keys, in order."""
+        result = []
+        for bucket in self._buckets:
+            if len(result) >= n:
                 break
+            result.extend(bucket[:n - len(result)])
         return result
 
 
@@ -58,20 +136,30 @@ class Simulation:
         # Use a dictionary to store accounts: {account_id: Account}
         self.accounts: dict[str, Account] = {}
         self.payment_counter = 0  # Global counter for payment IDs
-        # Pending cashbacks: list of (timestamp, account_id, amount, payment_id)
-        self.pending_cashbacks: deque[tuple[int, str, int, str]] = deque()
+        # Delayed events (cashbacks, scheduled operations), fired before
+        # every operation
+        self.scheduler = Scheduler()
+        self.schedule_counter = 0  # Global counter for schedule IDs
+        # Scheduled operations still to run: {schedule_id: pending event id}
+        self.schedules: dict[str, int] = {}
+        # Every payment: {payment_id: (account that paid, status)}
+        self.payments: dict[str, tuple[Account, str]] = {}
+        # Every account ranked by (-outgoing, account_id), updated whenever
+        # an outgoing total changes
+        self.ranking = Ranking()
 
     def create_account(self, timestamp: int, account_id: str) -> bool:
-        self._process_cashbacks(timestamp)
+        self._process_events(timestamp)
         # Check if account already exists
         if account_id in self.accounts:
             return False
         # Create new account
         self.accounts[account_id] = Account(account_id, timestamp)
+        self.ranking.add((0, account_id))
         return True
 
     def deposit(self, timestamp: int, account_id: str, amount: int) -> int | None:
-        self._process_cashbacks(timestamp)
+        self._process_events(timestamp)
         # Check if account exists
         if account_id not in self.accounts:
             return None
@@ -82,7 +170,7 @@ class Simulation:
         return result
 
     def transfer(self, timestamp: int, source_account_id: str, target_account_id: str, amount: int) -> int | None:
-        self._process_cashbacks(timestamp)
+        self._process_events(timestamp)
         # Check if both accounts exist
         if source_account_id not in self.accounts or target_account_id not in self.accounts:
             return None
@@ -90,11 +178,12 @@ class Simulation:
         if source_account_id == target_account_id:
             return None
         
-        source = self.accounts[source_account_id]
-        target = self.accounts[target_account_id]
-        
+        return self._transfer(timestamp, self.accounts[source_account_id], self.accounts[target_account_id], amount)
+
+    def _transfer(self, timestamp: int, source: Account, target: Account, amount: int) -> int | None:
+        """Move amount from source to target if source has sufficient funds."""
         # Check if source has sufficient funds and perform withdrawal
-        if not source.withdraw(amount):
+        if not self._withdraw(source, amount):
             return None
         
         # Deposit to target
@@ -105,36 +194,56 @@ class Simulation:
         return source.balance
     
     def top_spenders(self, timestamp: int, n: int) -> list[str]:
-        self._process_cashbacks(timestamp)
-        # Sort accounts by outgoing (descending), then by account_id (ascending) for ties
-        sorted_accounts = sorted(
-            self.accounts.keys(),
-            key=lambda acc: (-self.accounts[acc].outgoing, acc)
-        )
-        # Take top n accounts and format the result
-        return [f"{acc}({self.accounts[acc].outgoing})" for acc in sorted_accounts[:n]]
-
-    def _process_cashbacks(self, timestamp: int) -> None:
-        """Process all cashbacks that are due at or before the given timestamp."""
-        while self.pending_cashbacks and self.pending_cashbacks[0][0] <= timestamp:
-            cb_timestamp, account_id, amount, payment_id = self.pending_cashbacks.popleft()
-            if account_id in self.accounts:
-                account = self.accounts[account_id]
-                account.deposit(amount)
-                account.payments[payment_id] = "CASHBACK_RECEIVED"
-                account.record_balance(cb_timestamp)
+        self._process_events(timestamp)
+        # The ranking is ordered by outgoing (descending), then by account_id
+        # (ascending) for ties, so the top n are its first n entries
+        return [f"{acc}({-neg_outgoing})" for neg_outgoing, acc in self.ranking.first(n)]
+
+    def _withdraw(self, account: Account, amount: int) -> bool:
+        """Withdraw from account, moving it in the ranking if outgoing changed."""
+        old_key = (-account.outgoing, account.account_id)
+        if not account.withdraw(amount):
+            return False
+        if amount:
+            self.ranking.remove(old_key)
+            self.ranking.add((-account.outgoing, account.account_id))
+        return True
+
+    @staticmethod
+    def _find(account: Account) -> Account:
+        """The account that account was (transitively) merged into, or itself."""
+        root = account
+        while root.merged_into is not None:
+            root = root.merged_into
+        # Path compression: point every account on the way straight at root
+        while account is not root:
+            account.merged_into, account = root, account.merged_into
+        return root
+
+    def _process_events(self, timestamp: int) -> None:
+        """Fire all scheduled events that are due at or before the given timestamp."""
+        self.scheduler.run_until(timestamp)
+
+    def _cashback(self, timestamp: int, payer: Account, amount: int, payment_id: str) -> None:
+        """Refund a payment's cashback to payer, or the account it was merged into."""
+        account = self._find(payer)
+        account.deposit(amount)
+        self.payments[payment_id] = (payer, "CASHBACK_RECEIVED")
+        account.record_balance(timestamp)
 
     def pay(self, timestamp: int, account_id: str, amount: int) -> str | None:
-        self._process_cashbacks(timestamp)
+        self._process_events(timestamp)
         # Check if account exists
         if account_id not in self.accounts:
             return None
         
-        account = self.accounts[account_id]
-        
+        return self._pay(timestamp, self.accounts[account_id], amount)
+
+    def _pay(self, timestamp: int, account: Account, amount: int) -> str | None:
+        """Withdraw a payment from account and schedule its cashback."""
         # Check if account has sufficient funds
         # Outgoing is accounted in withdraw method
-        if not account.withdraw(amount):
+        if not self._withdraw(account, amount):
             return None
         
         # Generate payment ID
@@ -142,7 +251,7 @@ class Simulation:
         payment_id = f"payment{self.payment_counter}"
         
         # Store payment status
-        account.payments[payment_id] = "IN_PROGRESS"
+        self.payments[payment_id] = (account, "IN_PROGRESS")
         
         # Record balance after payment
         account.record_balance(timestamp)
@@ -150,26 +259,105 @@ class Simulation:
         # Schedule cashback (2% rounded down) for 24 hours later
         cashback_amount = amount * 2 // 100
         cashback_timestamp = timestamp + self.CASHBACK_DELAY
-        self.pending_cashbacks.append((cashback_timestamp, account_id, cashback_amount, payment_id))
+        self.scheduler.schedule(cashback_timestamp, self._cashback, account, cashback_amount, payment_id)
         
         return payment_id
 
+    def schedule_transfer(self, timestamp: int, source_account_id: str, target_account_id: str,
+                          amount: int, delay: int) -> str | None:
+        """
+        Transfer amount from source to target at timestamp + delay. Returns a
+        schedule ID, or None if either account does not exist, they are the
+        same, or delay is negative.
+
+        The transfer runs before any other operation at its timestamp, like
+        a transfer() call, and is skipped if the source cannot cover it
+        then. Merged accounts are followed to the account they merged into.
+        """
+        self._process_events(timestamp)
+        if source_account_id not in self.accounts or target_account_id not in self.accounts:
+            return None
+        if source_account_id == target_account_id or delay < 0:
+            return None
+        schedule_id = self._new_schedule_id()
+        self.schedules[schedule_id] = self.scheduler.schedule(
+            timestamp + delay, self._scheduled_transfer, schedule_id,
+            self.accounts[source_account_id], self.accounts[target_account_id], amount)
+        return schedule_id
+
+    def schedule_recurring_payment(self, timestamp: int, account_id: str, amount: int,
+                                   interval: int, times: int) -> str | None:
+        """
+        Pay amount from account_id every interval milliseconds, times times,
+        the first at timestamp + interval. Returns a schedule ID, or None if
+        the account does not exist, interval is not positive or times is
+        less than 1.
+
+        Each run is a pay() with its own payment ID and cashback; a run the
+        account cannot cover is skipped, and later runs still happen.
+        """
+        self._process_events(timestamp)
+        if account_id not in self.accounts or interval <= 0 or times < 1:
+            return None
+        schedule_id = self._new_schedule_id()
+        self.schedules[schedule_id] = self.scheduler.schedule(
+            timestamp + interval, self._recurring_payment, schedule_id,
+            self.accounts[account_id], amount, interval, times)
+        return schedule_id
+
+    def cancel_schedule(self, timestamp: int, schedule_id: str) -> bool:
+        """
+        Cancel the remaining runs of a scheduled operation. Returns False if
+        the schedule does not exist or has no runs left.
+        """
+        self._process_events(timestamp)
+        if schedule_id not in self.schedules:
+            return False
+        self.scheduler.cancel(self.schedules.pop(schedule_id))
+        return True
+
+    def _new_schedule_id(self) -> str:
+        self.schedule_counter += 1
+        return f"schedule{self.schedule_counter}"
+
+    def _scheduled_transfer(self, timestamp: int, schedule_id: str, source: Account,
+                            target: Account, amount: int) -> None:
+        del self.schedules[schedule_id]
+        source, target = self._find(source), self._find(target)
+        # Merging one account into the other turns this into a self-transfer
+        if source is not target:
+            self._transfer(timestamp, source, target, amount)
+
+    def _recurring_payment(self, timestamp: int, schedule_id: str, account: Account,
+                           amount: int, interval: int, remaining: int) -> None:
+        self._pay(timestamp, self._find(account), amount)
+        if remaining > 1:
+            # Only the next run is ever pending, so a standing order costs one
+            # scheduler event however many times it repeats
+            self.schedules[schedule_id] = self.scheduler.schedule(
+                timestamp + interval, self._recurring_payment, schedule_id,
+                account, amount, interval, remaining - 1)
+        else:
+            del self.schedules[schedule_id]
+
     def get_payment_status(self, timestamp: int, account_id: str, payment: str) -> str | None:
-        self._process_cashbacks(timestamp)
+        self._process_events(timestamp)
         # Check if account exists
         if account_id not in self.accounts:
             return None
         
-        account = self.accounts[account_id]
-        
-        # Check if payment exists for this account
-        if payment not in account.payments:
+        # Check if payment exists for this account, or for an account that
+        # was merged into it
+        if payment not in self.payments:
+            return None
+        payer, status = self.payments[payment]
+        if self._find(payer) is not self.accounts[account_id]:
             return None
         
-        return account.payments[payment]
+        return status
     
     def merge_accounts(self, timestamp: int, account_id_1: str, account_id_2: str) -> bool:
-        self._process_cashbacks(timestamp)
+        self._process_events(timestamp)
         # Check if both accounts are different
         if account_id_1 == account_id_2:
             return False
@@ -184,14 +372,13 @@ class Simulation:
         account1.balance += account2.balance
         
         # Merge outgoing transactions
+        self.ranking.remove((-account1.outgoing, account_id_1))
+        self.ranking.remove((-account2.outgoing, account_id_2))
         account1.outgoing += account2.outgoing
+        self.ranking.add((-account1.outgoing, account_id_1))
         
-        # Merge payments (account1 inherits account2's payment statuses)
-        account1.payments.update(account2.payments)
-        
-        # Merge balance history: combine and sort by timestamp
-        account1.balance_history.extend(account2.balance_history)
-        account1.balance_history.sort(key=lambda x: x[0])
+        # Merge balance history, keeping it sorted by timestamp
+        account1.merge_history(account2)
         
         # Update created_at to the earlier of the two
         account1.created_at = min(account1.created_at, account2.created_at)
@@ -199,10 +386,9 @@ class Simulation:
         # Record the merged balance
         account1.record_balance(timestamp)
         
-        # Redirect pending cashbacks from account2 to account1
-        for i, (cb_ts, acc_id, amount, payment_id) in enumerate(self.pending_cashbacks):
-            if acc_id == account_id_2:
-                self.pending_cashbacks[i] = (cb_ts, account_id_1, amount, payment_id)
+        # Alias account2 to account1: its scheduled cashbacks and payment
+        # statuses now resolve to account1 when they are used
+        account2.merged_into = account1
         
         # Remove account2 from the system
         del self.accounts[account_id_2]
@@ -210,7 +396,7 @@ class Simulation:
         return True
     
     def get_balance(self, timestamp: int, account_id: str, time_at: int) -> int | None:
-        self._process_cashbacks(timestamp)
+        self._process_events(timestamp)
         # Check if account exists
         if account_id not in self.accounts:
             return None
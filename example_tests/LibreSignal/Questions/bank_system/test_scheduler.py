@@ -0,0 +1,112 @@
+"""
+Tests for the delayed-event scheduler of the bank system.
+
+Run from LibreSignal root directory:
+    pytest Questions/bank_system/test_scheduler.py -v
+    SLOW_TESTS=1 pytest Questions/bank_system/test_scheduler.py -v   # with millions pending
+"""
+import os
+import random
+
+import pytest
+from scheduler import Scheduler
+
+
+def recorder():
+    fired = []
+
+    def callback(timestamp, *args):
+        fired.append((timestamp, *args))
+
+    return fired, callback
+
+
+class TestScheduler:
+    def test_fires_in_timestamp_order_whatever_the_delay(self):
+        scheduler = Scheduler()
+        fired, callback = recorder()
+        scheduler.schedule(30, callback, "long")
+        scheduler.schedule(10, callback, "short")
+        scheduler.schedule(20, callback, "medium")
+        assert scheduler.run_until(25) == 2
+        assert fired == [(10, "short"), (20, "medium")]
+        assert len(scheduler) == 1
+        assert scheduler.next_due() == 30
+
+    def test_same_timestamp_fires_in_scheduling_order(self):
+        scheduler = Scheduler()
+        fired, callback = recorder()
+        for i in range(5):
+            scheduler.schedule(7, callback, i)
+        scheduler.run_until(7)
+        assert fired == [(7, i) for i in range(5)]
+
+    def test_cancel(self):
+        scheduler = Scheduler()
+        fired, callback = recorder()
+        first = scheduler.schedule(1, callback, "a")
+        second = scheduler.schedule(2, callback, "b")
+        assert scheduler.cancel(first)
+        assert not scheduler.cancel(first)
+        assert first not in scheduler and second in scheduler
+        assert scheduler.next_due() == 2
+        scheduler.run_until(5)
+        assert fired == [(2, "b")]
+        assert not scheduler.cancel(second)
+        assert len(scheduler) == 0
+
+    def test_events_scheduled_while_running_fire_in_the_same_window(self):
+        scheduler = Scheduler()
+        fired = []
+
+        def repeat(timestamp, remaining):
+            fired.append(timestamp)
+            if remaining:
+                scheduler.schedule(timestamp + 10, repeat, remaining - 1)
+
+        scheduler.schedule(5, repeat, 3)
+        scheduler.run_until(30)
+        assert fired == [5, 15, 25]
+        scheduler.run_until(100)
+        assert fired == [5, 15, 25, 35]
+
+    def test_many_pending_events(self):
+        rng = random.Random(0)
+        scheduler = Scheduler()
+        fired = []
+
+        def callback(timestamp, i):
+            fired.append((timestamp, i))
+
+        events = [(rng.randrange(10**9), i) for i in range(10_000)]
+        ids = [scheduler.schedule(due, callback, i) for due, i in events]
+        for event_id in ids[::10]:
+            scheduler.cancel(event_id)
+        assert len(scheduler) == 9_000
+        for now in range(0, 10**9 + 1, 10**8):
+            scheduler.run_until(now)
+        kept = [event for i, event in enumerate(events) if i % 10]
+        assert fired == sorted(kept)  # by due timestamp, then scheduling order
+        assert len(scheduler) == 0
+
+    @pytest.mark.skipif(not os.environ.get("SLOW_TESTS"), reason="takes seconds; set SLOW_TESTS=1")
+    def test_millions_pending_events(self):
+        rng = random.Random(0)
+        scheduler = Scheduler()
+        count = 0
+        last = (-1, -1)
+
+        def callback(timestamp, i):
+            nonlocal count, last
+            assert (timestamp, i) > last
+            count += 1
+            last = (timestamp, i)
+
+        ids = [scheduler.schedule(rng.randrange(10**9), callback, i) for i in range(2_000_000)]
+        for event_id in ids[::10]:
+            scheduler.cancel(event_id)
+        assert len(scheduler) == 1_800_000
+        for now in range(0, 10**9 + 1, 10**8):
+            scheduler.run_until(now)
+        assert count == 1_800_000
+        assert len(scheduler) == 0
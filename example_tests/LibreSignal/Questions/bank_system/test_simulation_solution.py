@@ -0,0 +1,274 @@
+"""
+Tests for the reference solution of the bank system simulation.
+============================================================
+Runs every test of test_bank_system.py against simulation_solution, plus
+tests for the solution's own data structures.
+"""
+import random
+from array import array
+
+import pytest
+
+import simulation_solution
+import test_bank_system
+from simulation_solution import Account, Ranking, Simulation
+
+
+@pytest.fixture(autouse=True)
+def use_solution(monkeypatch):
+    monkeypatch.setattr(test_bank_system, "Simulation", Simulation)
+
+
+class TestLevel1(test_bank_system.TestLevel1):
+    pass
+
+
+class TestLevel2(test_bank_system.TestLevel2):
+    pass
+
+
+class TestLevel3(test_bank_system.TestLevel3):
+    pass
+
+
+class TestLevel4(test_bank_system.TestLevel4):
+    pass
+
+
+class TestBalanceHistory:
+    def test_history_is_columnar(self):
+        account = Account("acc", 1)
+        account.deposit(100)
+        account.record_balance(5)
+        assert isinstance(account.history_times, array)
+        assert account.balance_history == [(1, 0), (5, 100)]
+
+    def test_balance_at(self):
+        account = Account("acc", 10)
+        for ts in range(20, 1000, 10):
+            account.deposit(1)
+            account.record_balance(ts)
+        assert account.get_balance_at(9) is None
+        assert account.get_balance_at(10) == 0
+        assert account.get_balance_at(19) == 0
+        assert account.get_balance_at(20) == 1
+        assert account.get_balance_at(555) == 54
+        assert account.get_balance_at(10**9) == 98
+
+    def test_last_entry_at_a_timestamp_wins(self):
+        simulation = Simulation()
+        simulation.create_account(1, "a")
+        simulation.create_account(1, "b")
+        simulation.deposit(2, "a", 100)
+        simulation.transfer(2, "a", "b", 40)
+        assert simulation.get_balance(3, "a", 2) == 60
+
+    def test_merged_history_stays_sorted(self):
+        simulation = Simulation()
+        simulation.create_account(1, "a")
+        simulation.create_account(2, "b")
+        simulation.deposit(3, "b", 50)
+        simulation.deposit(4, "a", 70)
+        simulation.merge_accounts(5, "a", "b")
+        account = simulation.accounts["a"]
+        assert list(account.history_times) == sorted(account.history_times)
+        assert simulation.get_balance(6, "a", 5) == 120
+        assert simulation.get_balance(6, "a", 4) == 70
+
+
+class TestRanking:
+    def test_matches_sorted_list(self):
+        rng = random.Random(0)
+        ranking = Ranking()
+        ranking.LOAD = 4  # force many splits
+        keys = []
+        for step in range(3000):
+            if keys and rng.random() < 0.4:
+                key = keys.pop(rng.randrange(len(keys)))
+                ranking.remove(key)
+            else:
+                key = (-rng.randrange(50), f"acc{rng.randrange(200)}")
+                keys.append(key)
+                ranking.add(key)
+            if step % 100 == 0:
+                assert ranking.first(len(keys) + 1) == sorted(keys)
+        assert len(ranking) == len(keys)
+        assert ranking.first(7) == sorted(keys)[:7]
+
+    def test_top_spenders_follow_every_update(self):
+        simulation = Simulation()
+        for i, account_id in enumerate(["a", "b", "c", "d"]):
+            simulation.create_account(i, account_id)
+            simulation.deposit(i, account_id, 1000)
+        simulation.transfer(10, "a", "b", 100)
+        simulation.pay(11, "c", 300)
+        simulation.pay(12, "b", 150)
+        assert simulation.top_spenders(13, 3) == ["c(300)", "b(150)", "a(100)"]
+        simulation.merge_accounts(14, "a", "b")
+        assert simulation.top_spenders(15, 4) == ["c(300)", "a(250)", "d(0)"]
+        # A failed withdrawal leaves the ranking alone
+        assert simulation.pay(16, "d", 10**6) is None
+        assert simulation.top_spenders(17, 1) == ["c(300)"]
+
+    def test_ranking_matches_full_sort(self):
+        rng = random.Random(1)
+        simulation = Simulation()
+        ids = [f"acc{i}" for i in range(300)]
+        for account_id in ids:
+            simulation.create_account(1, account_id)
+            simulation.deposit(1, account_id, 10**6)
+        for ts in range(2, 2000):
+            source, target = rng.sample(ids, 2)
+            if ts % 3:
+                simulation.transfer(ts, source, target, rng.randrange(1000))
+            else:
+                simulation.pay(ts, source, rng.randrange(1000))
+        expected = sorted(simulation.accounts.values(), key=lambda acc: (-acc.outgoing, acc.account_id))
+        assert simulation.top_spenders(2000, 50) == [
+            f"{acc.account_id}({acc.outgoing})" for acc in expected[:50]]
+
+
+class TestMergeAliases:
+    DAY = Simulation.CASHBACK_DELAY
+
+    def test_chained_merges_route_cashbacks_to_the_survivor(self):
+        simulation = Simulation()
+        for account_id in ["a", "b", "c"]:
+            simulation.create_account(1, account_id)
+            simulation.deposit(1, account_id, 1000)
+        payment = simulation.pay(2, "c", 500)
+        simulation.merge_accounts(3, "b", "c")
+        simulation.merge_accounts(4, "a", "b")
+        assert simulation.get_payment_status(5, "a", payment) == "IN_PROGRESS"
+        assert simulation.get_payment_status(5, "b", payment) is None
+        assert simulation.get_balance(2 + self.DAY, "a", 2 + self.DAY) == 2510
+        assert simulation.get_payment_status(3 + self.DAY, "a", payment) == "CASHBACK_RECEIVED"
+
+    def test_find_compresses_paths(self):
+        accounts = [Account(f"acc{i}", 1) for i in range(5)]
+        for child, parent in zip(accounts[1:], accounts):
+            child.merged_into = parent
+        assert Simulation._find(accounts[-1]) is accounts[0]
+        assert all(account.merged_into is accounts[0] for account in accounts[1:])
+
+    def test_recreated_id_does_not_inherit_old_payments(self):
+        simulation = Simulation()
+        simulation.create_account(1, "a")
+        simulation.create_account(1, "b")
+        simulation.deposit(2, "b", 100)
+        payment = simulation.pay(3, "b", 100)
+        simulation.merge_accounts(4, "a", "b")
+        assert simulation.create_account(5, "b")
+        assert simulation.get_payment_status(6, "b", payment) is None
+        assert simulation.get_payment_status(6, "a", payment) == "IN_PROGRESS"
+        simulation.deposit(3 + self.DAY, "b", 0)
+        assert simulation.accounts["a"].balance == 2
+        assert simulation.accounts["b"].balance == 0
+
+    def test_merge_leaves_scheduled_cashbacks_alone(self):
+        simulation = Simulation()
+        simulation.create_account(1, "a")
+        simulation.create_account(1, "b")
+        simulation.deposit(2, "b", 10**6)
+        for ts in range(3, 1003):
+            simulation.pay(ts, "b", 100)
+        before = list(simulation.scheduler._heap), dict(simulation.scheduler._pending)
+        simulation.merge_accounts(1004, "a", "b")
+        assert (simulation.scheduler._heap, simulation.scheduler._pending) == before
+
+
+class TestScheduledOperations:
+    def funded(self, *account_ids, amount=1000):
+        simulation = Simulation()
+        for account_id in account_ids:
+            simulation.create_account(1, account_id)
+            simulation.deposit(1, account_id, amount)
+        return simulation
+
+    def test_scheduled_transfer_runs_before_operations_at_its_timestamp(self):
+        simulation = self.funded("a", "b")
+        assert simulation.schedule_transfer(2, "a", "b", 300, 8) == "schedule1"
+        assert simulation.get_balance(9, "a", 9) == 1000
+        assert simulation.deposit(10, "b", 0) == 1300
+        assert simulation.get_balance(11, "a", 10) == 700
+        assert simulation.top_spenders(11, 2) == ["a(300)", "b(0)"]
+        assert not simulation.cancel_schedule(12, "schedule1")
+
+    def test_scheduled_transfer_is_validated_now_and_skipped_without_funds(self):
+        simulation = self.funded("a", "b")
+        assert simulation.schedule_transfer(2, "a", "missing", 10, 5) is None
+        assert simulation.schedule_transfer(2, "a", "a", 10, 5) is None
+        assert simulation.schedule_transfer(2, "a", "b", 10, -1) is None
+        simulation.schedule_transfer(2, "a", "b", 5000, 5)
+        assert simulation.deposit(7, "a", 0) == 1000
+        assert simulation.top_spenders(8, 1) == ["a(0)"]
+
+    def test_cancel(self):
+        simulation = self.funded("a", "b")
+        schedule_id = simulation.schedule_transfer(2, "a", "b", 300, 8)
+        assert simulation.cancel_schedule(3, schedule_id)
+        assert not simulation.cancel_schedule(4, schedule_id)
+        assert not simulation.cancel_schedule(4, "schedule99")
+        assert simulation.deposit(100, "a", 0) == 1000
+        assert len(simulation.scheduler) == 0
+
+    def test_recurring_payment(self):
+        day = Simulation.CASHBACK_DELAY
+        simulation = self.funded("a")
+        assert simulation.schedule_recurring_payment(2, "a", 100, 10, 3) == "schedule1"
+        assert simulation.schedule_recurring_payment(2, "a", 100, 0, 3) is None
+        assert simulation.schedule_recurring_payment(2, "a", 100, 10, 0) is None
+        assert simulation.get_balance(40, "a", 12) == 900
+        assert simulation.get_balance(40, "a", 22) == 800
+        assert simulation.get_balance(40, "a", 32) == 700
+        assert simulation.top_spenders(40, 1) == ["a(300)"]
+        assert simulation.get_payment_status(41, "a", "payment3") == "IN_PROGRESS"
+        assert simulation.get_payment_status(32 + day, "a", "payment3") == "CASHBACK_RECEIVED"
+        assert simulation.deposit(33 + day, "a", 0) == 706
+        assert not simulation.cancel_schedule(34 + day, "schedule1")
+
+    def test_cancel_stops_remaining_runs(self):
+        simulation = self.funded("a")
+        schedule_id = simulation.schedule_recurring_payment(2, "a", 100, 10, 5)
+        simulation.deposit(25, "a", 0)
+        assert simulation.cancel_schedule(25, schedule_id)
+        assert simulation.deposit(1000, "a", 0) == 800
+        assert simulation.top_spenders(1000, 1) == ["a(200)"]
+
+    def test_runs_that_cannot_be_covered_are_skipped(self):
+        simulation = self.funded("a", amount=150)
+        simulation.schedule_recurring_payment(2, "a", 100, 10, 3)
+        simulation.deposit(25, "a", 50)
+        assert simulation.deposit(100, "a", 0) == 0
+        assert simulation.get_payment_status(100, "a", "payment2") == "IN_PROGRESS"
+        assert simulation.get_payment_status(100, "a", "payment3") is None
+
+    def test_scheduled_operations_follow_merges(self):
+        simulation = self.funded("a", "b", "c")
+        simulation.schedule_transfer(2, "b", "c", 100, 10)
+        simulation.schedule_transfer(2, "a", "b", 100, 10)
+        simulation.schedule_recurring_payment(2, "b", 50, 10, 1)
+        simulation.merge_accounts(3, "a", "b")
+        assert simulation.deposit(20, "c", 0) == 1100
+        # a -> b became a self-transfer and was skipped
+        assert simulation.deposit(20, "a", 0) == 2000 - 100 - 50
+        assert simulation.top_spenders(20, 1) == ["a(150)"]
+
+    def test_many_standing_orders(self):
+        simulation = Simulation()
+        ids = [f"acc{i}" for i in range(1000)]
+        for account_id in ids:
+            simulation.create_account(1, account_id)
+            simulation.deposit(1, account_id, 10**6)
+        schedules = [simulation.schedule_recurring_payment(2, ids[i % 1000], 1, 100 + i % 7, 4)
+                     for i in range(20_000)]
+        for schedule_id in schedules[::2]:
+            simulation.cancel_schedule(3, schedule_id)
+        assert len(simulation.scheduler) == 10_000
+        simulation.deposit(10**4, "acc0", 0)
+        assert sum(acc.outgoing for acc in simulation.accounts.values()) == 10_000 * 4
+        assert not simulation.schedules
+
+
+def test_module_is_the_solution():
+    assert test_bank_system.Simulation is simulation_solution.Simulation
@@ -0,0 +1,415 @@
+"""
+Benchmarks for the in-memory database simulation.
+============================================================
+Run from this directory:
+    python benchmark.py backup-memory
+    python benchmark.py backup-memory --fields 100000 --backups 5
+    python benchmark.py backup-memory --delta-chain 32
+    python benchmark.py wal-throughput --fsync batch
+    python benchmark.py executor --queries 1000000
+    python benchmark.py memory --fields 1000000 --ttl-ratio 0.1
+    python benchmark.py threads --threads 8 --shards 16
+    python benchmark.py batch --fields-per-call 50
+    python benchmark.py bgsave --fields 1000000
+    python benchmark.py key-index --keys 1000000
+"""
+import argparse
+import bisect
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+from executor import QueryExecutor
+from persistence import WriteAheadLog
+from sharded import ShardedSimulation
+from simulation import Simulation
+
+
+def populate(db: Simulation, fields: int, keys: int) -> None:
+    """Spread `fields` fields evenly over `keys` records, timestamps 1..fields."""
+    per_key = max(1, fields // keys)
+    ts = 0
+    for k in range(keys):
+        key = f"key{k}"
+        for f in range(per_key):
+            ts += 1
+            db.set_at(key, f"field{f}", str(ts), ts)
+
+
+def bench_backup_memory(fields: int, keys: int, backups: int, writes: int, delta_chain: int = 0) -> None:
+    """
+    Memory retained and time taken per backup when only `writes` fields
+    change between consecutive backups. The time includes the writes, as
+    copy-on-write moves part of a backup's cost onto the first write after it.
+    """
+    rng = random.Random(0)
+    db = Simulation(delta_chain=delta_chain)
+    populate(db, fields, keys)
+    ts = fields + 1
+    per_key = max(1, fields // keys)
+
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    elapsed = 0.0
+    for _ in range(backups):
+        start = time.perf_counter()
+        for _ in range(writes):
+            ts += 1
+            db.set_at(f"key{rng.randrange(keys)}", f"field{rng.randrange(per_key)}", "x", ts)
+        ts += 1
+        db.backup(ts)
+        elapsed += time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"dataset: {fields} fields in {keys} records, {writes} writes between backups")
+    print(f"backup mode: {f'deltas, chains of {delta_chain}' if delta_chain else 'full copy-on-write'}")
+    print(f"backups: {backups}")
+    print(f"memory per backup: {(current - base) / backups / 1024:.1f} KiB")
+    print(f"peak over baseline: {(peak - base) / 1024 / 1024:.1f} MiB")
+    print(f"mean time per backup cycle (writes + backup): {elapsed / backups * 1e6:.1f} us")
+
+
+def bench_wal_throughput(ops: int, fsync: str, batch_size: int) -> None:
+    """set_at throughput in memory versus with a write-ahead log attached."""
+    def run(db: Simulation) -> float:
+        start = time.perf_counter()
+        for ts in range(1, ops + 1):
+            db.set_at(f"key{ts % 1000}", f"field{ts}", "value", ts)
+        if db.wal is not None:
+            db.wal.close()
+        return ops / (time.perf_counter() - start)
+
+    in_memory = run(Simulation())
+    with tempfile.TemporaryDirectory() as directory:
+        logged = run(Simulation(wal=WriteAheadLog(directory, fsync=fsync, batch_size=batch_size)))
+    print(f"ops: {ops}, fsync: {fsync}, batch size: {batch_size}")
+    print(f"in memory: {in_memory:,.0f} ops/s")
+    print(f"with WAL:  {logged:,.0f} ops/s ({logged / in_memory:.0%})")
+
+
+def _traced_bytes(build) -> int:
+    """Bytes still allocated after build() returns (its result is kept alive)."""
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    kept = build()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def bench_memory(fields: int, keys: int, ttl_ratio: float) -> None:
+    """
+    Bytes per field of the original layout (parallel defaultdict(dict) maps
+    for values and expiries) against the current Record representation.
+    Every record uses the same field names, built as fresh strings per
+    record the way parsed queries would arrive.
+    """
+    per_key = max(1, fields // keys)
+    rng = random.Random(0)
+    ttl_fields = {f for f in range(per_key) if rng.random() < ttl_ratio}
+
+    def original():
+        data, expire = defaultdict(dict), defaultdict(dict)
+        for k in range(keys):
+            key = f"key{k}"
+            for f in range(per_key):
+                data[key][f"field{f}"] = "v"
+                expire[key]  # *_at calls touched self.expire[key] for every record
+                if f in ttl_fields:
+                    expire[key][f"field{f}"] = 10**9
+        return data, expire
+
+    def current():
+        db = Simulation()
+        for k in range(keys):
+            key = f"key{k}"
+            for f in range(per_key):
+                if f in ttl_fields:
+                    db.set_at_with_ttl(key, f"field{f}", "v", 1, 10**9)
+                else:
+                    db.set_at(key, f"field{f}", "v", 1)
+        return db
+
+    total = per_key * keys
+    before = _traced_bytes(original)
+    after = _traced_bytes(current)
+    print(f"{total} fields in {keys} records, {len(ttl_fields) / per_key:.0%} with ttl")
+    print(f"original layout: {before / total:.1f} bytes/field")
+    print(f"Record layout:   {after / total:.1f} bytes/field ({after / before:.0%})")
+
+
+def generate_queries(count: int, keys: int, seed: int = 0):
+    """A lazy stream of mixed level 3 queries with string arguments."""
+    rng = random.Random(seed)
+    for ts in range(1, count + 1):
+        key = f"key{rng.randrange(keys)}"
+        field = f"field{rng.randrange(100)}"
+        r = rng.random()
+        if r < 0.3:
+            yield ["SET_AT", key, field, "value", str(ts)]
+        elif r < 0.4:
+            yield ["SET_AT_WITH_TTL", key, field, "value", str(ts), str(rng.randrange(1, 1000))]
+        elif r < 0.8:
+            yield ["GET_AT", key, field, str(ts)]
+        elif r < 0.9:
+            yield ["DELETE_AT", key, field, str(ts)]
+        else:
+            yield ["SCAN_BY_PREFIX_AT", key, "field1", str(ts)]
+
+
+def bench_executor(queries: int, keys: int) -> None:
+    """Queries per second through QueryExecutor.stream, streamed end to end."""
+    executor = QueryExecutor()
+    start = time.perf_counter()
+    count = sum(1 for _ in executor.stream(generate_queries(queries, keys)))
+    elapsed = time.perf_counter() - start
+    print(f"{count} queries over {keys} keys in {elapsed:.2f}s: {count / elapsed:,.0f} queries/s")
+
+
+class _LockedSimulation:
+    """A single Simulation behind one global lock: the unsharded baseline."""
+
+    def __init__(self):
+        self.db = Simulation()
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        method = getattr(self.db, name)
+
+        def locked(*args):
+            with self.lock:
+                return method(*args)
+        return locked
+
+
+def _run_threads(db, threads: int, ops: int, keys: int, backup_every: int) -> float:
+    """Each thread runs ops mixed reads/writes; one thread also backs up."""
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(t: int) -> None:
+        rng = random.Random(t)
+        barrier.wait()
+        for i in range(ops):
+            key = f"key{rng.randrange(keys)}"
+            if t == 0 and backup_every and i % backup_every == 0:
+                db.backup(i)
+            elif rng.random() < 0.5:
+                db.set(key, f"field{rng.randrange(100)}", "v")
+            else:
+                db.get(key, f"field{rng.randrange(100)}")
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    return threads * ops / (time.perf_counter() - start)
+
+
+def bench_threads(threads: int, shards: int, ops: int, keys: int, backup_every: int) -> None:
+    """Multi-threaded throughput: one globally locked Simulation vs shards."""
+    baseline = _run_threads(_LockedSimulation(), threads, ops, keys, backup_every)
+    with ShardedSimulation(shards=shards) as db:
+        sharded = _run_threads(db, threads, ops, keys, backup_every)
+    print(f"{threads} threads x {ops} ops over {keys} keys, backup every {backup_every} ops")
+    print(f"global lock:        {baseline:,.0f} ops/s")
+    print(f"{shards:>2} shards:          {sharded:,.0f} ops/s")
+
+
+def bench_batch(records: int, fields_per_call: int, rounds: int) -> None:
+    """Per-field cost of single-field *_at calls against the batch operations."""
+    names = [f"field{f}" for f in range(fields_per_call)]
+    pairs = {name: "v" for name in names}
+
+    def run(write, read, delete) -> tuple[float, float, float]:
+        db = Simulation()
+        times = [0.0, 0.0, 0.0]
+        ts = 0
+        for _ in range(rounds):
+            for phase, op in enumerate((write, read, delete)):
+                start = time.perf_counter()
+                for k in range(records):
+                    ts += 1
+                    op(db, f"key{k}", ts)
+                times[phase] += time.perf_counter() - start
+        per_field = rounds * records * fields_per_call
+        return tuple(t / per_field * 1e9 for t in times)
+
+    def set_each(db, key, ts):
+        for name in names:
+            db.set_at_with_ttl(key, name, "v", ts, 10**9)
+
+    def get_each(db, key, ts):
+        for name in names:
+            db.get_at(key, name, ts)
+
+    def delete_each(db, key, ts):
+        for name in names:
+            db.delete_at(key, name, ts)
+
+    single = run(set_each, get_each, delete_each)
+    batch = run(lambda db, key, ts: db.mset_at_with_ttl(key, pairs, ts, 10**9),
+                lambda db, key, ts: db.mget_at(key, names, ts),
+                lambda db, key, ts: db.mdelete_at(key, names, ts))
+    print(f"{records} records x {fields_per_call} fields per call, {rounds} rounds")
+    for label, one, many in zip(("set_at_with_ttl", "get_at", "delete_at"), single, batch):
+        print(f"{label:<16} {one:7.0f} ns/field   batch: {many:7.0f} ns/field ({many / one:.0%})")
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def bench_bgsave(fields: int, keys: int, ops: int) -> None:
+    """Latency of parent-side operations while a forked child saves the dataset."""
+    rng = random.Random(0)
+    db = Simulation()
+    populate(db, fields, keys)
+    per_key = max(1, fields // keys)
+    ts = fields
+
+    def run(count: int) -> list[float]:
+        nonlocal ts
+        latencies = []
+        for _ in range(count):
+            ts += 1
+            key, field = f"key{rng.randrange(keys)}", f"field{rng.randrange(per_key)}"
+            start = time.perf_counter()
+            if ts % 2:
+                db.set_at(key, field, "x", ts)
+            else:
+                db.get_at(key, field, ts)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    idle = sorted(run(ops))
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        db.bgsave(f"{directory}/dump.snap")
+        fork = time.perf_counter() - start
+        during = []
+        while db.last_save_status()["status"] == "in_progress":
+            during += run(1000)
+        status = db.last_save_status()
+    during.sort()
+    print(f"dataset: {fields} fields in {keys} records; save {status['status']} in {status['duration']:.2f}s")
+    print(f"fork: {fork * 1e3:.1f} ms")
+    for label, lat in (("idle", idle), ("during save", during)):
+        print(f"{label:<12} {len(lat):>8} ops  p50 {_percentile(lat, 0.5) * 1e6:6.1f} us"
+              f"  p99 {_percentile(lat, 0.99) * 1e6:6.1f} us  max {lat[-1] * 1e6:8.1f} us")
+
+
+def bench_key_index(keys: int, steps: int, sample: int) -> None:
+    """
+    Cost of creating and dropping a record as the key count grows, with
+    random key order. Each step adds keys // steps records; at the end of a
+    step, `sample` records are created and then dropped again and timed,
+    and the same inserts and removals on a flat sorted list are shown for
+    comparison.
+    """
+    rng = random.Random(0)
+    names = [f"key{rng.getrandbits(64):016x}" for _ in range(keys + sample)]
+    db = Simulation()
+    flat: list[str] = []
+    per_step = keys // steps
+    start = time.perf_counter()
+    for step in range(1, steps + 1):
+        for name in names[(step - 1) * per_step:step * per_step]:
+            db.set(name, "f", "v")
+        extra = names[keys:]
+        begin = time.perf_counter()
+        for name in extra:
+            db.set(name, "f", "v")
+        created = time.perf_counter() - begin
+        begin = time.perf_counter()
+        for name in extra:
+            db.delete(name, "f")
+        dropped = time.perf_counter() - begin
+
+        flat[:] = db.keys
+        begin = time.perf_counter()
+        for name in extra:
+            bisect.insort(flat, name)
+        for name in extra:
+            del flat[bisect.bisect_left(flat, name)]
+        flat_cost = time.perf_counter() - begin
+        print(f"{len(db.keys):>9} keys  create {created / sample * 1e6:6.2f} us  drop {dropped / sample * 1e6:6.2f} us"
+              f"   flat list insert+remove {flat_cost / sample * 1e6:8.2f} us")
+    print(f"loaded {keys} keys in {time.perf_counter() - start:.1f}s (including the samples)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = sub.add_parser("backup-memory", help="memory retained per backup")
+    p.add_argument("--fields", type=int, default=1_000_000)
+    p.add_argument("--keys", type=int, default=1_000)
+    p.add_argument("--backups", type=int, default=10)
+    p.add_argument("--writes", type=int, default=100, help="writes between backups")
+    p.add_argument("--delta-chain", type=int, default=0, help="delta backups, folded every N (0: full)")
+
+    p = sub.add_parser("wal-throughput", help="write throughput with a write-ahead log")
+    p.add_argument("--ops", type=int, default=200_000)
+    p.add_argument("--fsync", choices=["always", "batch", "never"], default="batch")
+    p.add_argument("--batch-size", type=int, default=256)
+
+    p = sub.add_parser("executor", help="query throughput of the batched executor")
+    p.add_argument("--queries", type=int, default=1_000_000)
+    p.add_argument("--keys", type=int, default=10_000)
+
+    p = sub.add_parser("memory", help="bytes per field, original layout vs Record")
+    p.add_argument("--fields", type=int, default=1_000_000)
+    p.add_argument("--keys", type=int, default=10_000)
+    p.add_argument("--ttl-ratio", type=float, default=0.1)
+
+    p = sub.add_parser("threads", help="multi-threaded load, global lock vs shards")
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--shards", type=int, default=16)
+    p.add_argument("--ops", type=int, default=50_000, help="operations per thread")
+    p.add_argument("--keys", type=int, default=10_000)
+    p.add_argument("--backup-every", type=int, default=5_000)
+
+    p = sub.add_parser("batch", help="per-field cost of single-field vs batch operations")
+    p.add_argument("--records", type=int, default=1_000)
+    p.add_argument("--fields-per-call", type=int, default=50)
+    p.add_argument("--rounds", type=int, default=5)
+
+    p = sub.add_parser("bgsave", help="parent latency during a fork-based background save")
+    p.add_argument("--fields", type=int, default=1_000_000)
+    p.add_argument("--keys", type=int, default=10_000)
+    p.add_argument("--ops", type=int, default=100_000, help="operations measured while idle")
+
+    p = sub.add_parser("key-index", help="record create/drop cost as the key count grows")
+    p.add_argument("--keys", type=int, default=1_000_000)
+    p.add_argument("--steps", type=int, default=5)
+    p.add_argument("--sample", type=int, default=10_000)
+
+    args = parser.parse_args()
+    if args.benchmark == "backup-memory":
+        bench_backup_memory(args.fields, args.keys, args.backups, args.writes, args.delta_chain)
+    elif args.benchmark == "wal-throughput":
+        bench_wal_throughput(args.ops, args.fsync, args.batch_size)
+    elif args.benchmark == "executor":
+        bench_executor(args.queries, args.keys)
+    elif args.benchmark == "memory":
+        bench_memory(args.fields, args.keys, args.ttl_ratio)
+    elif args.benchmark == "threads":
+        bench_threads(args.threads, args.shards, args.ops, args.keys, args.backup_every)
+    elif args.benchmark == "batch":
+        bench_batch(args.records, args.fields_per_call, args.rounds)
+    elif args.benchmark == "bgsave":
+        bench_bgsave(args.fields, args.keys, args.ops)
+    elif args.benchmark == "key-index":
+        bench_key_index(args.keys, args.steps, args.sample)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Batched query executor for the in-memory database simulation.
+============================================================
+Runs queries in the format used by the level descriptions, e.g.
+["SET_AT_WITH_TTL", "A", "B", "C", "1", "10"], and produces their string
+results.
+
+Usage:
+    execute_batch([["SET", "A", "B", "E"], ["GET", "A", "B"]])  # ["", "E"]
+    for result in QueryExecutor(db).stream(queries): ...
+
+Replay a file with one JSON query per line and report the throughput:
+    python executor.py queries.jsonl [--output results.txt]
+"""
+import argparse
+import json
+import sys
+import time
+from collections.abc import Callable, Iterable, Iterator
+
+from simulation import Simulation
+
+# Query name -> (Simulation method, argument types). Every method returns a
+# string except SCAN_KEYS_BY_PREFIX*, which return (next_cursor, keys), and
+# MGET*/MDELETE*, which return a list. The batch operations take a variable
+# number of arguments after the key: field names (list) or field-value
+# pairs (dict), e.g. ["MSET_AT", "A", "B", "1", "C", "2", "5"].
+OPCODES = {
+    "SET": ("set", (str, str, str)),
+    "GET": ("get", (str, str)),
+    "DELETE": ("delete", (str, str)),
+    "SCAN": ("scan", (str,)),
+    "SCAN_BY_PREFIX": ("scan_by_prefix", (str, str)),
+    "SET_AT": ("set_at", (str, str, str, int)),
+    "SET_AT_WITH_TTL": ("set_at_with_ttl", (str, str, str, int, int)),
+    "GET_AT": ("get_at", (str, str, int)),
+    "DELETE_AT": ("delete_at", (str, str, int)),
+    "SCAN_AT": ("scan_at", (str, int)),
+    "SCAN_BY_PREFIX_AT": ("scan_by_prefix_at", (str, str, int)),
+    "BACKUP": ("backup", (int,)),
+    "RESTORE": ("restore", (int, int)),
+    "SCAN_KEYS_BY_PREFIX": ("scan_keys_by_prefix", (str, str, int)),
+    "SCAN_KEYS_BY_PREFIX_AT": ("scan_keys_by_prefix_at", (str, str, int, int)),
+    "GET_AS_OF": ("get_as_of", (str, str, int)),
+    "SCAN_AS_OF": ("scan_as_of", (str, int)),
+    "MSET": ("mset", (str, dict)),
+    "MGET": ("mget", (str, list)),
+    "MDELETE": ("mdelete", (str, list)),
+    "MSET_AT": ("mset_at", (str, dict, int)),
+    "MSET_AT_WITH_TTL": ("mset_at_with_ttl", (str, dict, int, int)),
+    "MGET_AT": ("mget_at", (str, list, int)),
+    "MDELETE_AT": ("mdelete_at", (str, list, int)),
+}
+
+
+def _compile(method: Callable[..., str], types: tuple) -> Callable[[list[str]], str]:
+    """
+    Build a handler taking the whole query list. Argument conversion is
+    specialised once per opcode, so the hot path does no type inspection.
+    Integer arguments (timestamps, ttls) always come last in a query.
+    """
+    if dict in types or list in types:
+        return _compile_batch(method, types)
+    arity = len(types) + 1
+    split = arity - types.count(int)
+
+    def reject(query):
+        raise ValueError(f"{query[0]} takes {arity - 1} arguments, got {len(query) - 1}: {query!r}")
+
+    if split == arity:
+        def handler(query):
+            if len(query) != arity:
+                reject(query)
+            return method(*query[1:])
+    else:
+        def handler(query):
+            if len(query) != arity:
+                reject(query)
+            return method(*query[1:split], *map(int, query[split:]))
+    return handler
+
+
+def _compile_batch(method: Callable[..., object], types: tuple) -> Callable[[list[str]], object]:
+    """Handler for a batch operation: key, field names or pairs, then integers."""
+    ints = types.count(int)
+    pairs = dict in types
+
+    def handler(query):
+        end = len(query) - ints
+        fields = query[2:end]
+        if end < 2 or (pairs and len(fields) % 2):
+            expected = "field-value pairs" if pairs else "field names"
+            raise ValueError(f"{query[0]} takes a key, {expected} and {ints} integer arguments: {query!r}")
+        if pairs:
+            fields = dict(zip(fields[::2], fields[1::2]))
+        return method(query[1], fields, *map(int, query[end:]))
+    return handler
+
+
+def _invalid(query: object) -> ValueError:
+    """The error for a query with no handler."""
+    if not isinstance(query, (list, tuple)) or not query:
+        return ValueError(f"a query must be a non-empty list, got {query!r}")
+    return ValueError(f"unknown operation {query[0]!r}")
+
+
+class QueryExecutor:
+    """Dispatches queries to a Simulation through a precompiled table."""
+
+    def __init__(self, db: Simulation | None = None):
+        self.db = db if db is not None else Simulation()
+        self.dispatch = {
+            name: _compile(getattr(self.db, method), types)
+            for name, (method, types) in OPCODES.items()
+        }
+
+    def execute(self, query: list[str]) -> str:
+        handler = None
+        if isinstance(query, (list, tuple)) and query and type(query[0]) is str:
+            handler = self.dispatch.get(query[0])
+        if handler is None:
+            raise _invalid(query)
+        return handler(query)
+
+    def stream(self, queries: Iterable[list[str]]) -> Iterator[str]:
+        """Yield results one by one; nothing is materialised."""
+        dispatch = self.dispatch
+        for query in queries:
+            handler = None
+            if isinstance(query, (list, tuple)) and query and type(query[0]) is str:
+                handler = dispatch.get(query[0])
+            if handler is None:
+                raise _invalid(query)
+            yield handler(query)
+
+    def execute_batch(self, queries: Iterable[list[str]]) -> list[str]:
+        return list(self.stream(queries))
+
+
+def execute_batch(queries: Iterable[list[str]], db: Simulation | None = None) -> list[str]:
+    """Run queries against db (a fresh Simulation by default)."""
+    return QueryExecutor(db).execute_batch(queries)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a query file against a Simulation.")
+    parser.add_argument("path", help="file with one JSON query list per line")
+    parser.add_argument("--output", help="write one JSON-encoded result per line here")
+    args = parser.parse_args()
+
+    executor = QueryExecutor()
+    out = open(args.output, "w") if args.output else None
+    count = 0
+    start = time.perf_counter()
+    with open(args.path) as f:
+        queries = (json.loads(line) for line in f if line.strip())
+        for result in executor.stream(queries):
+            count += 1
+            if out is not None:
+                out.write(json.dumps(result) + "\n")
+    elapsed = time.perf_counter() - start
+    if out is not None:
+        out.close()
+    print(f"{count} queries in {elapsed:.2f}s: {count / elapsed:,.0f} queries/s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
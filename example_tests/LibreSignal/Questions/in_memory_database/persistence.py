@@ -0,0 +1,352 @@
+"""
+Write-ahead log and checkpoints for the in-memory database simulation.
+============================================================
+Every mutating operation is appended to a log as it is applied,
+and the whole state is periodically written to a binary checkpoint.
+Recovery loads the latest checkpoint and replays the log written after it.
+
+Files inside the persistence directory:
+    checkpoint.bin   latest checkpoint, replaced atomically
+    wal-<gen>.log    operations logged since checkpoint generation <gen>
+
+Usage:
+    wal = WriteAheadLog("data", fsync="batch", checkpoint_every=100_000)
+    db = Simulation(wal=wal)
+    ...
+    db = recover("data")   # after a restart
+"""
+import heapq
+import marshal
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from simulation import BackupTimeline, Record, Simulation, Snapshot, SortedKeys
+
+# Logged operations and the Simulation methods that replay them.
+LOGGED_OPS = {
+    "SET": "set",
+    "DELETE": "delete",
+    "SET_AT": "set_at",
+    "SET_AT_WITH_TTL": "set_at_with_ttl",
+    "DELETE_AT": "delete_at",
+    "MSET": "mset",
+    "MDELETE": "mdelete",
+    "MSET_AT": "mset_at",
+    "MSET_AT_WITH_TTL": "mset_at_with_ttl",
+    "MDELETE_AT": "mdelete_at",
+    "BACKUP": "backup",
+    "RESTORE": "restore",
+}
+
+FSYNC_POLICIES = ("always", "batch", "never")
+
+CHECKPOINT_FILE = "checkpoint.bin"
+CHECKPOINT_MAGIC = b"IMDBCKP1"
+
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_FRAME_HEADER = struct.Struct("<II")  # payload length, crc32 of payload
+
+
+def _log_path(directory: str, generation: int) -> str:
+    return os.path.join(directory, f"wal-{generation}.log")
+
+
+def _encode_frame(entries: list[tuple]) -> bytes:
+    """
+    One group commit: header, then the marshalled list of (op, *args)
+    tuples. Entries hold only str and int (and the dicts and lists of
+    batch operations, copied when logged), so marshal encodes the whole
+    batch in C instead of packing each argument separately.
+    """
+    payload = marshal.dumps(entries)
+    return _FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_log(path: str):
+    """
+    Yield (method, args, end_offset) for every entry of every intact frame.
+
+    The file is memory-mapped and frames are decoded straight from it.
+    Reading stops at the first torn or corrupt frame, which is what a crash
+    mid-write leaves; end_offset is the end of the entry's frame.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos, size = 0, len(mm)
+        while pos + _FRAME_HEADER.size <= size:
+            length, crc = _FRAME_HEADER.unpack_from(mm, pos)
+            start = pos + _FRAME_HEADER.size
+            end = start + length
+            if end > size:
+                return
+            with memoryview(mm)[start:end] as payload:
+                if zlib.crc32(payload) != crc:
+                    return
+                entries = marshal.loads(payload)
+            for op, *args in entries:
+                yield LOGGED_OPS[op], args, end
+            pos = end
+
+
+class WriteAheadLog:
+    """
+    Append-only operation log with group commit.
+
+    Entries are buffered and written out as one frame once batch_size of
+    them are pending. The fsync policy decides durability:
+        "always": write and fsync every entry before returning.
+        "batch":  fsync once per group commit (at most batch_size - 1
+                  acknowledged operations can be lost in a crash).
+        "never":  leave flushing to the operating system.
+    If checkpoint_every is set, the owning Simulation writes a checkpoint
+    after that many logged operations.
+    """
+
+    def __init__(self, directory: str, fsync: str = "batch", batch_size: int = 256,
+                 checkpoint_every: int | None = None, generation: int | None = None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fsync = fsync
+        self.batch_size = 1 if fsync == "always" else batch_size
+        self.checkpoint_every = checkpoint_every
+        if generation is None:
+            generation = read_checkpoint_generation(directory)
+        self.generation = generation
+        self._file = open(_log_path(directory, generation), "ab")
+        self._pending: list[tuple] = []
+        self.since_checkpoint = 0
+
+    def append(self, entry: tuple) -> bool:
+        """
+        Log an (op, *args) entry. Returns True when a checkpoint is due.
+        """
+        pending = self._pending
+        pending.append(entry)
+        if len(pending) >= self.batch_size:
+            self.flush()
+        self.since_checkpoint += 1
+        return self.checkpoint_every is not None and self.since_checkpoint >= self.checkpoint_every
+
+    def flush(self) -> None:
+        """Write out all buffered entries (one group commit)."""
+        if not self._pending:
+            return
+        self._file.write(_encode_frame(self._pending))
+        self._pending.clear()
+        self._file.flush()
+        if self.fsync != "never":
+            os.fsync(self._file.fileno())
+
+    def checkpoint(self, db: Simulation) -> None:
+        """
+        Write db to a new checkpoint and start a fresh log.
+
+        The checkpoint names the log generation that follows it, so a crash
+        at any point leaves either the old checkpoint and its complete log,
+        or the new checkpoint and an empty (or missing) log.
+        """
+        self.flush()
+        write_checkpoint(db, self.directory, self.generation + 1)
+        old = _log_path(self.directory, self.generation)
+        self._file.close()
+        self.generation += 1
+        self._file = open(_log_path(self.directory, self.generation), "ab")
+        os.remove(old)
+        self.since_checkpoint = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
+
+# ==================== Checkpoints ====================
+
+class _Writer:
+    def __init__(self, f):
+        self.f = f
+
+    def u32(self, n: int) -> None:
+        self.f.write(_U32.pack(n))
+
+    def i64(self, n: int) -> None:
+        self.f.write(_I64.pack(n))
+
+    def str(self, s: str) -> None:
+        data = s.encode()
+        self.f.write(_U32.pack(len(data)))
+        self.f.write(data)
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.view = memoryview(data)
+        self.pos = 0
+
+    def u32(self) -> int:
+        (n,) = _U32.unpack_from(self.view, self.pos)
+        self.pos += _U32.size
+        return n
+
+    def i64(self) -> int:
+        (n,) = _I64.unpack_from(self.view, self.pos)
+        self.pos += _I64.size
+        return n
+
+    def str(self) -> str:
+        n = self.u32()
+        s = str(self.view[self.pos:self.pos + n], "utf-8")
+        self.pos += n
+        return s
+
+
+def _write_map(w: _Writer, pairs: list[tuple[str, int]]) -> None:
+    w.u32(len(pairs))
+    for key, rid in pairs:
+        w.str(key)
+        w.u32(rid)
+
+
+def write_checkpoint(db: Simulation, directory: str, generation: int) -> None:
+    """
+    Checkpoint layout (little endian):
+        magic, generation:i64
+        record count, then per record: field count, then per field
+            name, value, expiry:i64 (-1 when the field never expires)
+        live map: count, then (key, record id) pairs
+        backups: count, then per backup: timestamp:i64, count, (key, record id)
+    Records shared between the live map and backups are written once.
+    """
+    ids: dict[int, int] = {}
+    records: list[Record] = []
+
+    def record_id(rec: Record) -> int:
+        if id(rec) not in ids:
+            ids[id(rec)] = len(records)
+            records.append(rec)
+        return ids[id(rec)]
+
+    db._rebase_all()  # expiries are written as absolute times
+    maps = [db.data] + [snap.materialize() for snap in db.back.snapshots]
+    refs = [[(key, record_id(rec)) for key, rec in m.items()] for m in maps]
+
+    tmp = os.path.join(directory, CHECKPOINT_FILE + ".tmp")
+    with open(tmp, "wb") as f:
+        w = _Writer(f)
+        f.write(CHECKPOINT_MAGIC)
+        w.i64(generation)
+        w.u32(len(records))
+        for rec in records:
+            w.u32(len(rec))
+            for field in rec.index:
+                w.str(field)
+                w.str(rec.values[field])
+                expiry = rec.expiry(field)
+                w.i64(-1 if expiry is None else expiry)
+        _write_map(w, refs[0])
+        w.u32(len(refs) - 1)
+        for snap, pairs in zip(db.back.snapshots, refs[1:]):
+            w.i64(snap.timestamp)
+            _write_map(w, pairs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(directory, CHECKPOINT_FILE))
+
+
+def read_checkpoint_generation(directory: str) -> int:
+    path = os.path.join(directory, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb") as f:
+        header = f.read(len(CHECKPOINT_MAGIC) + _I64.size)
+    return _I64.unpack_from(header, len(CHECKPOINT_MAGIC))[0]
+
+
+def load_checkpoint(directory: str, timeline: BackupTimeline | None = None,
+                    **options) -> tuple[Simulation, int]:
+    """
+    Rebuild a Simulation from the checkpoint. Returns (db, generation).
+
+    Options (history_limit, maxmemory, delta_chain, ...) are passed on to
+    Simulation; they are not stored in the checkpoint.
+    """
+    db = Simulation(timeline, **options)
+    path = os.path.join(directory, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return db, 0
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(CHECKPOINT_MAGIC):
+        raise ValueError(f"{path} is not a checkpoint")
+    r = _Reader(data)
+    r.pos = len(CHECKPOINT_MAGIC)
+    generation = r.i64()
+
+    # Loaded records may be shared by several maps, so they all start out
+    # as belonging to a snapshot (version 0) and are copied on first write.
+    records = []
+    for _ in range(r.u32()):
+        rec = Record(0)
+        expire = {}
+        for _ in range(r.u32()):
+            field, value, expiry = sys.intern(r.str()), r.str(), r.i64()
+            rec.values[field] = value
+            rec.index.append(field)  # written in sorted order
+            if expiry >= 0:
+                expire[field] = expiry
+        rec.expire = expire or None
+        rec.measure()
+        records.append(rec)
+
+    def read_map() -> dict[str, Record]:
+        return {r.str(): records[r.u32()] for _ in range(r.u32())}
+
+    db.data = read_map()
+    db.keys = SortedKeys(sorted(db.data))
+    for _ in range(r.u32()):
+        ts = r.i64()
+        backup = read_map()
+        db.back.add(Snapshot(ts, backup, used_memory=sum(rec.nbytes for rec in backup.values())))
+    db.version = 1
+    db.expiry_heap = [
+        (expiry, key, field)
+        for key, rec in db.data.items()
+        if rec.expire
+        for field, expiry in rec.expire.items()
+    ]
+    heapq.heapify(db.expiry_heap)
+    db._reset_memory()
+    return db, generation
+
+
+def recover(directory: str, timeline: BackupTimeline | None = None, fsync: str = "batch",
+            batch_size: int = 256, checkpoint_every: int | None = None, **options) -> Simulation:
+    """
+    Load the latest checkpoint, replay the log tail, and return a Simulation
+    that keeps logging to the same directory. A torn final entry is cut off.
+
+    fsync, batch_size and checkpoint_every configure the new WriteAheadLog;
+    other options are passed on to Simulation and should match the ones
+    the database was logged with.
+    """
+    db, generation = load_checkpoint(directory, timeline, **options)
+    # Evictions are logged, so replay must not evict on its own.
+    maxmemory, db.maxmemory = db.maxmemory, 0
+    path = _log_path(directory, generation)
+    good = 0
+    for method, args, end in read_log(path):
+        getattr(db, method)(*args)
+        good = end
+    if os.path.exists(path) and os.path.getsize(path) != good:
+        with open(path, "r+b") as f:
+            f.truncate(good)
+    db.maxmemory = maxmemory
+    db.wal = WriteAheadLog(directory, fsync=fsync, batch_size=batch_size,
+                           checkpoint_every=checkpoint_every, generation=generation)
+    return db
@@ -0,0 +1,209 @@
+"""
+Local asyncio TCP server and client for the in-memory database simulation.
+============================================================
+Protocol: newline-delimited JSON. Every request line is a query list
+exactly as in the level descriptions, e.g. ["SET_AT", "A", "B", "C", "4"].
+Every reply line is the JSON-encoded result string, or {"error": "..."} if
+the query could not be run. Replies come back in request order.
+
+Clients may pipeline: send any number of request lines without waiting.
+The server runs every complete line it has received and answers them with
+one write. A request line longer than REQUEST_LIMIT gets an error reply,
+and the connection is closed.
+
+Usage:
+    python server.py --port 7379
+
+    async with await DatabaseClient.connect("127.0.0.1", 7379) as client:
+        await client.execute(["SET", "A", "B", "C"])
+        results = await client.pipeline(queries)
+"""
+import argparse
+import asyncio
+import json
+from collections.abc import Iterable
+
+from executor import QueryExecutor
+from simulation import Simulation
+
+READ_CHUNK = 1 << 16
+REQUEST_LIMIT = 1 << 26  # longest request line the server accepts
+REPLY_LIMIT = 1 << 26  # longest reply line the client accepts (a huge SCAN)
+
+
+class DatabaseServer:
+    """Serves one Simulation to any number of connections."""
+
+    def __init__(self, db: Simulation | None = None, host: str = "127.0.0.1", port: int = 0,
+                 expire_interval: float = 0):
+        self.executor = QueryExecutor(db)
+        self.host = host
+        self.port = port
+        # Seconds between background expiry slices (0 disables them).
+        self.expire_interval = expire_interval
+        self._server: asyncio.Server | None = None
+        self._expirer: asyncio.Task | None = None
+        self._clients: set[asyncio.Task] = set()  # one _handle() task per connection
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.expire_interval:
+            self._expirer = asyncio.create_task(self._expire_forever())
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        """Stop accepting connections, then cancel and wait for every task."""
+        self._server.close()
+        tasks = list(self._clients)
+        if self._expirer is not None:
+            tasks.append(self._expirer)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def _expire_forever(self) -> None:
+        """
+        Reclaim expired fields, and fold one delta backup chain, while the
+        server is idle. Each step is bounded (an expiry slice, the changes
+        in one chain), so it delays a waiting request by very little.
+        """
+        db = self.executor.db
+        while True:
+            await asyncio.sleep(self.expire_interval)
+            db.expire_cycle()
+            db.compact_backups()
+
+    def _run(self, line: bytes) -> bytes:
+        # Any failure is reported on its own line: the other lines of the
+        # batch still run and get their replies.
+        try:
+            result = json.dumps(self.executor.execute(json.loads(line)))
+        except Exception as e:
+            result = json.dumps({"error": str(e) or type(e).__name__})
+        return result.encode() + b"\n"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._clients.add(task)
+        partial = bytearray()  # the start of a line whose newline has not arrived
+        try:
+            while True:
+                chunk = await reader.read(READ_CHUNK)
+                if not chunk:
+                    break
+                # Only the new chunk is searched for newlines, so a line
+                # spanning many reads costs O(length) and not O(length^2).
+                end = chunk.rfind(b"\n")
+                if end < 0:
+                    lines = []
+                    partial += chunk
+                else:
+                    lines = chunk[:end].split(b"\n")
+                    if partial:
+                        partial += lines[0]
+                        lines[0] = bytes(partial)
+                        partial.clear()
+                    partial += chunk[end + 1:]
+                too_long = len(partial) > REQUEST_LIMIT
+                if lines and len(lines[0]) > REQUEST_LIMIT:
+                    lines, too_long = [], True
+                # Queries run synchronously, so each batch is atomic with
+                # respect to other connections.
+                replies = [self._run(line) for line in lines if line.strip()]
+                if too_long:
+                    error = {"error": f"request line longer than {REQUEST_LIMIT} bytes"}
+                    replies.append(json.dumps(error).encode() + b"\n")
+                if replies:
+                    writer.write(b"".join(replies))
+                    await writer.drain()
+                if too_long:
+                    break
+        except ConnectionError:
+            pass
+        except asyncio.CancelledError:
+            # close() is shutting down; finish normally, since asyncio's
+            # stream callback would report a cancelled task as an error.
+            pass
+        finally:
+            self._clients.discard(task)
+            writer.close()
+
+
+class DatabaseError(Exception):
+    """The server rejected a query."""
+
+
+class DatabaseClient:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = 7379) -> "DatabaseClient":
+        reader, writer = await asyncio.open_connection(host, port, limit=REPLY_LIMIT)
+        return cls(reader, writer)
+
+    async def close(self) -> None:
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def __aenter__(self) -> "DatabaseClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def execute(self, query: list[str]) -> str:
+        return (await self.pipeline([query]))[0]
+
+    async def pipeline(self, queries: Iterable[list[str]]) -> list[str]:
+        """
+        Send every query without waiting for replies, then collect them.
+        Sending and receiving run concurrently so neither side's socket
+        buffer can fill up and stall the other.
+        """
+        payload = b"".join(json.dumps(q).encode() + b"\n" for q in queries)
+        count = payload.count(b"\n")
+
+        async def send():
+            self.writer.write(payload)
+            await self.writer.drain()
+
+        async def receive():
+            return [await self.reader.readline() for _ in range(count)]
+
+        _, lines = await asyncio.gather(send(), receive())
+        results = []
+        for line in lines:
+            if not line:
+                raise ConnectionError("server closed the connection")
+            reply = json.loads(line)
+            if isinstance(reply, dict):
+                raise DatabaseError(reply["error"])
+            results.append(reply)
+        return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve an in-memory database on localhost.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7379)
+    parser.add_argument("--expire-effort", type=int, default=20,
+                        help="expiry heap entries reaped per slice (0 reaps everything due on every call)")
+    parser.add_argument("--expire-interval", type=float, default=0.1,
+                        help="seconds between background expiry slices (0 disables them)")
+    args = parser.parse_args()
+    db = Simulation(active_expire_effort=args.expire_effort)
+    server = DatabaseServer(db, host=args.host, port=args.port, expire_interval=args.expire_interval)
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Key-hash sharded, thread-safe variant of the in-memory database simulation.
+============================================================
+Keys are partitioned by hash over independent Simulation shards, each with
+its own lock, so threads working on keys in different shards never wait for
+each other. Every operation on a key touches only that key's shard, which
+also owns the key's ttls. BACKUP and RESTORE lock all shards to get a
+consistent cut and then run on the shards in parallel on a thread pool.
+
+The public API is the same as Simulation's, and Simulation's keyword
+options apply to every shard; maxmemory is the total, split evenly.
+"""
+import heapq
+import itertools
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from simulation import BackupTimeline, Simulation
+
+
+class ShardedSimulation:
+    def __init__(self, shards: int = 16, workers: int | None = None,
+                 timeline_factory: Callable[[], BackupTimeline] | None = None, **simulation_options):
+        if "wal" in simulation_options:
+            raise ValueError("shards cannot share a write-ahead log")
+        if simulation_options.get("maxmemory"):
+            simulation_options["maxmemory"] = max(1, simulation_options["maxmemory"] // shards)
+        self.shards = [
+            Simulation(timeline_factory() if timeline_factory else None, **simulation_options)
+            for _ in range(shards)
+        ]
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.pool = ThreadPoolExecutor(max_workers=workers or shards, thread_name_prefix="shard")
+
+    def close(self) -> None:
+        self.pool.shutdown()
+
+    def __enter__(self) -> "ShardedSimulation":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _call(self, key: str, method: str, *args) -> str:
+        i = hash(key) % len(self.shards)
+        with self.locks[i]:
+            return getattr(self.shards[i], method)(key, *args)
+
+    def _call_all(self, method: str, *args) -> list[str]:
+        """Run method on every shard in parallel while holding every lock."""
+        for lock in self.locks:
+            lock.acquire()
+        try:
+            futures = [self.pool.submit(getattr(shard, method), *args) for shard in self.shards]
+            return [f.result() for f in futures]
+        finally:
+            for lock in reversed(self.locks):
+                lock.release()
+
+    # ==================== LEVEL 1: Basic Operations ====================
+
+    def set(self, key: str, field: str, value: str) -> str:
+        return self._call(key, "set", field, value)
+
+    def get(self, key: str, field: str) -> str:
+        return self._call(key, "get", field)
+
+    def delete(self, key: str, field: str) -> str:
+        return self._call(key, "delete", field)
+
+    # ==================== LEVEL 2: Scan Operations ====================
+
+    def scan(self, key: str) -> str:
+        return self._call(key, "scan")
+
+    def scan_by_prefix(self, key: str, prefix: str) -> str:
+        return self._call(key, "scan_by_prefix", prefix)
+
+    # ==================== LEVEL 3: Timestamp & TTL ====================
+
+    def set_at(self, key: str, field: str, value: str, timestamp: int) -> str:
+        return self._call(key, "set_at", field, value, timestamp)
+
+    def set_at_with_ttl(self, key: str, field: str, value: str, timestamp: int, ttl: int) -> str:
+        return self._call(key, "set_at_with_ttl", field, value, timestamp, ttl)
+
+    def get_at(self, key: str, field: str, timestamp: int) -> str:
+        return self._call(key, "get_at", field, timestamp)
+
+    def delete_at(self, key: str, field: str, timestamp: int) -> str:
+        return self._call(key, "delete_at", field, timestamp)
+
+    def scan_at(self, key: str, timestamp: int) -> str:
+        return self._call(key, "scan_at", timestamp)
+
+    def scan_by_prefix_at(self, key: str, prefix: str, timestamp: int) -> str:
+        return self._call(key, "scan_by_prefix_at", prefix, timestamp)
+
+    # ==================== LEVEL 4: Backup & Restore ====================
+
+    def backup(self, timestamp: int) -> str:
+        return str(sum(int(count) for count in self._call_all("backup", timestamp)))
+
+    def restore(self, timestamp: int, timestamp_to_restore: int) -> str:
+        self._call_all("restore", timestamp, timestamp_to_restore)
+        return ""
+
+    def compact_backups(self) -> bool:
+        return any(self._call_each("compact_backups"))
+
+    # ==================== Memory & Expiry ====================
+
+    def stats(self) -> dict[str, int | str]:
+        """Simulation.stats() summed over the shards."""
+        total: dict[str, int | str] = {}
+        for info in self._call_each("stats"):
+            for name, value in info.items():
+                total[name] = total.get(name, 0) + value if isinstance(value, int) else value
+        return total
+
+    def expire_cycle(self, budget: int | None = None) -> int:
+        return sum(self._call_each("expire_cycle", budget))
+
+    # ==================== Batch Operations ====================
+
+    def mset(self, key: str, fields: dict[str, str]) -> str:
+        return self._call(key, "mset", fields)
+
+    def mget(self, key: str, fields: list[str]) -> list[str]:
+        return self._call(key, "mget", fields)
+
+    def mdelete(self, key: str, fields: list[str]) -> list[str]:
+        return self._call(key, "mdelete", fields)
+
+    def mset_at(self, key: str, fields: dict[str, str], timestamp: int) -> str:
+        return self._call(key, "mset_at", fields, timestamp)
+
+    def mset_at_with_ttl(self, key: str, fields: dict[str, str], timestamp: int, ttl: int) -> str:
+        return self._call(key, "mset_at_with_ttl", fields, timestamp, ttl)
+
+    def mget_at(self, key: str, fields: list[str], timestamp: int) -> list[str]:
+        return self._call(key, "mget_at", fields, timestamp)
+
+    def mdelete_at(self, key: str, fields: list[str], timestamp: int) -> list[str]:
+        return self._call(key, "mdelete_at", fields, timestamp)
+
+    # ==================== History: Time-Travel Reads ====================
+
+    def get_as_of(self, key: str, field: str, timestamp: int) -> str:
+        return self._call(key, "get_as_of", field, timestamp)
+
+    def scan_as_of(self, key: str, timestamp: int) -> str:
+        return self._call(key, "scan_as_of", timestamp)
+
+    # ==================== Key Namespace: Cursor Iteration ====================
+
+    def scan_keys_by_prefix(self, prefix: str, cursor: str = "0", count: int = 10) -> tuple[str, list[str]]:
+        return self._merge_key_pages(
+            self._call_each("scan_keys_by_prefix", prefix, cursor, count), count)
+
+    def scan_keys_by_prefix_at(self, prefix: str, cursor: str, count: int, timestamp: int) -> tuple[str, list[str]]:
+        return self._merge_key_pages(
+            self._call_each("scan_keys_by_prefix_at", prefix, cursor, count, timestamp), count)
+
+    def _call_each(self, method: str, *args) -> list:
+        """Run method on every shard in turn, locking one shard at a time."""
+        results = []
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                results.append(getattr(shard, method)(*args))
+        return results
+
+    @staticmethod
+    def _merge_key_pages(pages: list[tuple[str, list[str]]], count: int) -> tuple[str, list[str]]:
+        """
+        Every shard returned up to count keys after the same cursor; the
+        first count of their merge form the page. Key cursors make the
+        next page continue correctly in every shard.
+        """
+        merged = list(itertools.islice(heapq.merge(*(keys for _, keys in pages)), count + 1))
+        page = merged[:count]
+        more = len(merged) > count or any(cursor != "0" for cursor, _ in pages)
+        return ("@" + page[-1] if more else "0"), page
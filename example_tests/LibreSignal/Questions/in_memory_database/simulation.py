@@ -1,15 +1,628 @@
 """
 All your implementation code for the in-memory database simulation goes here.
 """
-from collections import defaultdict
+from array import array
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator, Mapping, MutableMapping
 import bisect
-import copy
+import heapq
+import itertools
+import os
+import random
+import sys
+import time
+
+# Content generations for records. A record gets a fresh number when it is
+# created and whenever it is modified; copies keep their original's number,
+# so equal numbers always mean equal contents, even across snapshots.
+_generations = itertools.count(1)
+
+# Approximate memory accounting (64-bit CPython): the fixed cost of a record
+# (object, values dict, index list, slot in the database dict and key index)
+# and of a field (values dict entry and index list slot) or ttl on top of the
+# sizes of the strings themselves.
+RECORD_OVERHEAD = 360
+FIELD_OVERHEAD = 48
+EXPIRY_OVERHEAD = 72
+
+MAXMEMORY_POLICIES = ("allkeys-lru", "volatile-ttl", "allkeys-random")
+
+
+class Record:
+    """
+    The fields of a single record, plus a lexicographically sorted index of
+    the field names so that scans never have to sort the whole record.
+
+    Records are shared between the live database and its backups. A record
+    may only be modified while its version matches Simulation.version;
+    otherwise it belongs to a snapshot and must be copied first.
+
+    Field names are interned, so records sharing a schema share the name
+    strings, and the expiry dict is only allocated once a field gets a ttl.
+    """
+
+    __slots__ = ("values", "index", "expire", "version", "gen", "nbytes")
+
+    def __init__(self, version: int = 0):
+        self.values: dict[str, str] = {}
+        self.index: list[str] = []  # field names, kept sorted
+        self.expire: dict[str, int] | None = None  # field -> absolute expiry
+        self.version = version
+        self.gen = next(_generations)
+        self.nbytes = RECORD_OVERHEAD  # approximate memory footprint
+
+    def measure(self) -> int:
+        """Recompute nbytes from scratch (for records built field by field)."""
+        size = sys.getsizeof
+        self.nbytes = RECORD_OVERHEAD + sum(
+            size(field) + size(value) + FIELD_OVERHEAD for field, value in self.values.items())
+        if self.expire:
+            self.nbytes += EXPIRY_OVERHEAD * len(self.expire)
+        return self.nbytes
+
+    def copy(self, version: int) -> "Record":
+        rec = Record(version)
+        rec.gen = self.gen
+        rec.nbytes = self.nbytes
+        rec.values = self.values.copy()
+        rec.index = self.index.copy()
+        if self.expire:
+            rec.expire = self.expire.copy()
+        return rec
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.values
+
+    def get(self, field: str) -> str:
+        return self.values.get(field, "")
+
+    def set(self, field: str, value: str, expiry: int | None = None) -> None:
+        """Store value; expiry is absolute, None means the field never expires."""
+        old = self.values.get(field)
+        if old is None:
+            field = sys.intern(field)
+            bisect.insort(self.index, field)
+            self.nbytes += sys.getsizeof(field) + sys.getsizeof(value) + FIELD_OVERHEAD
+        else:
+            self.nbytes += sys.getsizeof(value) - sys.getsizeof(old)
+        self.values[field] = value
+        if expiry is not None:
+            if self.expire is None:
+                self.expire = {}
+            if field not in self.expire:
+                self.nbytes += EXPIRY_OVERHEAD
+            self.expire[field] = expiry
+        elif self.expire and self.expire.pop(field, None) is not None:
+            self.nbytes -= EXPIRY_OVERHEAD
+
+    def expiry(self, field: str) -> int | None:
+        """Absolute expiry of field, None if it never expires."""
+        return self.expire.get(field) if self.expire else None
+
+    def delete(self, field: str) -> bool:
+        """Remove field. Returns True if it existed."""
+        if field not in self.values:
+            return False
+        value = self.values.pop(field)
+        del self.index[bisect.bisect_left(self.index, field)]
+        self.nbytes -= sys.getsizeof(field) + sys.getsizeof(value) + FIELD_OVERHEAD
+        if self.expire and self.expire.pop(field, None) is not None:
+            self.nbytes -= EXPIRY_OVERHEAD
+        return True
+
+    def scan(self, prefix: str = "") -> str:
+        """
+        Format the fields starting with prefix as "<field>(<value>), ...".
+        Seeks to the prefix with a bisect, then walks only the matching range.
+        """
+        index = self.index
+        values = self.values
+        res = []
+        for i in range(bisect.bisect_left(index, prefix), len(index)):
+            field = index[i]
+            if not field.startswith(prefix):
+                break
+            res.append(f"{field}({values[field]})")
+        return ", ".join(res)
+
+
+class SortedKeys:
+    """
+    The sorted index of record keys: a list of sorted buckets of at most
+    2 * LOAD keys plus the last key of every bucket. Adding or removing a
+    key bisects the bucket maxima and then shifts one short bucket, rather
+    than every key after it in one flat list.
+
+    Buckets are shared copy-on-write: copy() costs one pointer per bucket,
+    and whichever side modifies a shared bucket copies it first. A bucket
+    can also be a range of positions in a sorted source (see lazy()), read
+    the first time the bucket is needed.
+    """
+
+    LOAD = 512
+
+    __slots__ = ("_buckets", "_maxes", "_owned", "_len", "_source")
+
+    def __init__(self, keys: Iterable[str] = ()):
+        """keys must already be sorted."""
+        keys = list(keys)
+        load = self.LOAD
+        self._buckets: list[list[str] | range] = [keys[i:i + load] for i in range(0, len(keys), load)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._owned = [True] * len(self._buckets)  # False: shared with a copy
+        self._len = len(keys)
+        self._source: Callable[[int], str] | None = None
+
+    @classmethod
+    def lazy(cls, count: int, key_at: Callable[[int], str]) -> "SortedKeys":
+        """An index over count sorted keys, key_at(i) being the i-th."""
+        keys = cls()
+        load = cls.LOAD
+        keys._buckets = [range(i, min(i + load, count)) for i in range(0, count, load)]
+        keys._maxes = [key_at(bucket[-1]) for bucket in keys._buckets]
+        keys._owned = [True] * len(keys._buckets)
+        keys._len = count
+        keys._source = key_at
+        return keys
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self._buckets)):
+            yield from self._bucket(i)
+
+    def __getitem__(self, i: int) -> str:
+        """The i-th key (0 <= i < len); walks the bucket sizes."""
+        for b, bucket in enumerate(self._buckets):
+            if i < len(bucket):
+                return self._bucket(b)[i]
+            i -= len(bucket)
+        raise IndexError("key index out of range")
+
+    def _bucket(self, i: int) -> list[str]:
+        bucket = self._buckets[i]
+        if isinstance(bucket, range):
+            bucket = self._buckets[i] = [self._source(j) for j in bucket]
+            self._owned[i] = True
+        return bucket
+
+    def _mutable(self, i: int) -> list[str]:
+        bucket = self._bucket(i)
+        if not self._owned[i]:
+            bucket = self._buckets[i] = bucket.copy()
+            self._owned[i] = True
+        return bucket
+
+    def copy(self) -> "SortedKeys":
+        keys = SortedKeys()
+        keys._buckets = self._buckets.copy()
+        keys._maxes = self._maxes.copy()
+        keys._owned = [False] * len(self._buckets)
+        self._owned = [False] * len(self._buckets)
+        keys._len = self._len
+        keys._source = self._source
+        return keys
+
+    def add(self, key: str) -> None:
+        """Insert key, which must not be present."""
+        self._len += 1
+        maxes = self._maxes
+        if not maxes:
+            self._buckets.append([key])
+            self._owned.append(True)
+            maxes.append(key)
+            return
+        i = bisect.bisect_left(maxes, key)
+        if i == len(maxes):
+            i -= 1
+            bucket = self._mutable(i)
+            bucket.append(key)
+            maxes[i] = key
+        else:
+            bucket = self._mutable(i)
+            bisect.insort(bucket, key)
+        if len(bucket) > 2 * self.LOAD:
+            self._buckets.insert(i + 1, bucket[self.LOAD:])
+            self._owned.insert(i + 1, True)
+            del bucket[self.LOAD:]
+            maxes.insert(i, bucket[-1])
+
+    def remove(self, key: str) -> None:
+        """Remove key, which must be present."""
+        self._len -= 1
+        i = bisect.bisect_left(self._maxes, key)
+        bucket = self._mutable(i)
+        del bucket[bisect.bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+        else:
+            del self._buckets[i]
+            del self._owned[i]
+            del self._maxes[i]
+
+    def irange(self, start: str, exclusive: bool = False) -> Iterator[str]:
+        """Keys from start on (after it if exclusive), in order."""
+        find = bisect.bisect_right if exclusive else bisect.bisect_left
+        i = find(self._maxes, start)
+        if i == len(self._buckets):
+            return
+        bucket = self._bucket(i)
+        yield from itertools.islice(bucket, find(bucket, start), None)
+        for j in range(i + 1, len(self._buckets)):
+            yield from self._bucket(j)
+
+
+class Overlay(MutableMapping):
+    """
+    A record map layered over a read-only base map: writes and removals go
+    to a dict of changes (None marks a key removed from the base), so the
+    database can run on a backup's map or a snapshot file without copying
+    it. copy() copies only the changes.
+    """
+
+    __slots__ = ("base", "changes", "_len")
+
+    def __init__(self, base: Mapping[str, Record], changes: dict[str, Record | None] | None = None,
+                 length: int | None = None):
+        self.base = base
+        self.changes = {} if changes is None else changes
+        self._len = len(base) if length is None else length
+
+    def get(self, key: str, default: Record | None = None) -> Record | None:
+        changes = self.changes
+        if key in changes:
+            rec = changes[key]
+            return default if rec is None else rec
+        return self.base.get(key, default)
+
+    def __getitem__(self, key: str) -> Record:
+        rec = self.get(key)
+        if rec is None:
+            raise KeyError(key)
+        return rec
+
+    def __contains__(self, key: object) -> bool:
+        changes = self.changes
+        if key in changes:
+            return changes[key] is not None
+        return key in self.base
+
+    def __setitem__(self, key: str, rec: Record) -> None:
+        if key not in self:
+            self._len += 1
+        self.changes[key] = rec
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        if key in self.base:
+            self.changes[key] = None
+        else:
+            del self.changes[key]
+        self._len -= 1
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[str]:
+        changes = self.changes
+        for key in self.base:
+            if key not in changes:
+                yield key
+        for key, rec in changes.items():
+            if rec is not None:
+                yield key
+
+    def copy(self) -> "Overlay":
+        return Overlay(self.base, self.changes.copy(), self._len)
+
+
+class Snapshot:
+    """
+    A backup of the database as it was at timestamp.
+
+    A base snapshot holds the whole record map and sorted key index, shared
+    copy-on-write with the live database. A delta holds only the records
+    changed since parent (None for a record that was removed); reading it
+    walks the chain back to a base.
+    """
+
+    def __init__(self, timestamp: int, data: dict[str, Record | None], keys: SortedKeys | None = None,
+                 parent: "Snapshot | None" = None, used_memory: int | None = None):
+        self.timestamp = timestamp
+        self.data = data
+        self.parent = parent
+        self.used_memory = used_memory  # Simulation.used_memory at the backup, if known
+        self.depth = 0 if parent is None else parent.depth + 1
+        self._keys = keys if keys is not None or parent is not None else SortedKeys(sorted(data))
+
+    @property
+    def keys(self) -> SortedKeys:
+        """Sorted keys of the whole backup (built on demand for a delta)."""
+        return self._keys if self.parent is None else SortedKeys(sorted(self.materialize()))
+
+    def get(self, key: str) -> Record | None:
+        snap = self
+        while snap.parent is not None:
+            if key in snap.data:
+                return snap.data[key]
+            snap = snap.parent
+        return snap.data.get(key)
+
+    def materialize(self) -> dict[str, Record]:
+        """The whole record map: a base's own, or its chain applied in order."""
+        if self.parent is None:
+            return self.data
+        chain = []
+        snap = self
+        while snap.parent is not None:
+            chain.append(snap.data)
+            snap = snap.parent
+        data = snap.data.copy()  # a dict or an Overlay, never a snapshot file
+        for changes in reversed(chain):
+            for key, rec in changes.items():
+                if rec is None:
+                    data.pop(key, None)
+                else:
+                    data[key] = rec
+        return data
+
+    def rebase(self) -> None:
+        """
+        Fold the chain into this snapshot, making it a base. The key index
+        is the base's with the chain's changes applied rather than a new
+        sort, so this costs O(changed keys) on top of materialize().
+        """
+        if self.parent is None:
+            return
+        changed = set()
+        base = self
+        while base.parent is not None:
+            changed.update(base.data)
+            base = base.parent
+        data = self.materialize()
+        keys, before = base._keys.copy(), base.data
+        for key in changed:
+            if key in data:
+                if key not in before:
+                    keys.add(key)
+            elif key in before:
+                keys.remove(key)
+        self.data, self._keys = data, keys
+        self.parent = None
+        self.depth = 0
+
+
+class BackupTimeline:
+    """
+    Backups ordered by timestamp, with optional retention.
+
+    Retention is applied whenever a backup is added; ages are measured
+    against the newest backup's timestamp:
+        keep_last: keep at most this many backups.
+        max_age: drop backups older than this.
+        thinning: (age, interval) rules; among backups older than age, keep
+            only the latest one in each interval-wide window.
+    """
+
+    def __init__(self, keep_last: int | None = None, max_age: int | None = None,
+                 thinning: list[tuple[int, int]] | None = None):
+        self.keep_last = keep_last
+        self.max_age = max_age
+        self.thinning = sorted(thinning or [])
+        self.timestamps: list[int] = []
+        self.snapshots: list[Snapshot] = []  # parallel to timestamps
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def add(self, snapshot: Snapshot) -> None:
+        ts = snapshot.timestamp
+        if not self.timestamps or ts > self.timestamps[-1]:
+            # Timestamps strictly increase, so this is the usual path.
+            self.timestamps.append(ts)
+            self.snapshots.append(snapshot)
+        else:
+            i = bisect.bisect_left(self.timestamps, ts)
+            if self.timestamps[i] == ts:
+                self.snapshots[i] = snapshot
+            else:
+                self.timestamps.insert(i, ts)
+                self.snapshots.insert(i, snapshot)
+        self._apply_retention()
+
+    def latest_at_or_before(self, timestamp: int) -> Snapshot | None:
+        """The latest backup taken at or before timestamp, if any."""
+        i = bisect.bisect_right(self.timestamps, timestamp)
+        return self.snapshots[i - 1] if i else None
+
+    def compact(self) -> bool:
+        """
+        Rebase the oldest backup if it is a delta, so that the chain behind
+        it, already dropped by retention, can be freed. This costs O(keys
+        changed along the chain), so it is left to callers with idle time
+        (the server runs it on its expiry timer) rather than done on backup.
+
+        Returns:
+            True if a chain was folded.
+        """
+        if not self.snapshots or self.snapshots[0].parent is None:
+            return False
+        self.snapshots[0].rebase()
+        return True
+
+    def _apply_retention(self) -> None:
+        newest = self.timestamps[-1]
+        drop = 0
+        if self.max_age is not None:
+            drop = bisect.bisect_left(self.timestamps, newest - self.max_age)
+        if self.keep_last is not None:
+            drop = max(drop, len(self.timestamps) - self.keep_last)
+        if drop:
+            del self.timestamps[:drop]
+            del self.snapshots[:drop]
+        for age, interval in self.thinning:
+            self._thin(newest - age, interval)
+
+    def _thin(self, cutoff: int, interval: int) -> None:
+        """Keep one backup per interval window among those before cutoff."""
+        end = bisect.bisect_left(self.timestamps, cutoff)
+        if end < 2:
+            return
+        keep_ts, keep_snap = [], []
+        for i in range(end):
+            ts = self.timestamps[i]
+            if i + 1 < end and self.timestamps[i + 1] // interval == ts // interval:
+                continue  # a later backup covers this window
+            keep_ts.append(ts)
+            keep_snap.append(self.snapshots[i])
+        self.timestamps[:end] = keep_ts
+        self.snapshots[:end] = keep_snap
+
+
+class ScanCache:
+    """
+    LRU cache of rendered scan results keyed by (key, prefix). An entry is
+    valid while the record's generation is the one it was rendered from.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries: OrderedDict[tuple[str, str], tuple[int, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def scan(self, key: str, prefix: str, rec: Record) -> str:
+        cache_key = (key, prefix)
+        entry = self.entries.get(cache_key)
+        if entry is not None and entry[0] == rec.gen:
+            self.hits += 1
+            self.entries.move_to_end(cache_key)
+            return entry[1]
+        self.misses += 1
+        result = rec.scan(prefix)
+        self.entries[cache_key] = (rec.gen, result)
+        self.entries.move_to_end(cache_key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return result
+
+
+class FieldHistory:
+    """
+    Timestamp-ordered versions of one field: parallel columns of version
+    timestamps, values (None marks a delete) and absolute expiries (-1 for
+    none). At most limit versions are kept; the oldest are dropped first,
+    and dropped is the timestamp of the newest one dropped so far.
+    """
+
+    __slots__ = ("times", "values", "expiries", "dropped")
 
-class Simulation:
     def __init__(self):
-        self.data=defaultdict(dict)
-        self.expire=defaultdict(dict)
-        self.back=defaultdict(dict)
+        self.times = array("q")
+        self.values: list[str | None] = []
+        self.expiries = array("q")
+        self.dropped: int | None = None
+
+    def add(self, timestamp: int, value: str | None, expiry: int | None, limit: int) -> None:
+        self.times.append(timestamp)
+        self.values.append(value)
+        self.expiries.append(-1 if expiry is None else expiry)
+        if len(self.times) > limit:
+            self.dropped = self.times[0]
+            del self.times[0]
+            del self.values[0]
+            del self.expiries[0]
+
+    def latest(self, timestamp: int) -> int:
+        """Index of the newest version at or before timestamp, or -1."""
+        return bisect.bisect_right(self.times, timestamp) - 1
+
+
+class Simulation:
+    def __init__(self, timeline: BackupTimeline | None = None, wal=None, history_limit: int = 0,
+                 scan_cache_size: int = 0, maxmemory: int = 0,
+                 maxmemory_policy: str = "allkeys-lru", active_expire_effort: int = 0,
+                 delta_chain: int = 0):
+        if maxmemory_policy not in MAXMEMORY_POLICIES:
+            raise ValueError(f"maxmemory_policy must be one of {MAXMEMORY_POLICIES}, got {maxmemory_policy!r}")
+        # Only non-empty records are kept, so len(self.data) is the record count.
+        self.data: dict[str, Record] = {}
+        self.keys = SortedKeys()  # keys of self.data
+        # Bumped by every backup. Records with an older version, and the
+        # top-level dict and key index while _data_shared is set, belong to
+        # a snapshot.
+        self.version = 0
+        self._data_shared = False
+        # Min-heap of (expiry, key, field). Entries are validated against
+        # the record's expiry when popped, so overwrites and deletes never
+        # need to search the heap.
+        self.expiry_heap: list[tuple[int, str, str]] = []
+        self.last_reaped = 0   # entries reaped by the most recent *_at call
+        self.total_reaped = 0
+        # Active expiry in bounded slices (0 reaps everything due on every
+        # *_at call): each call pops at most expire_slice heap entries, and
+        # the record it reads is checked passively. The slice adapts between
+        # active_expire_effort and 16 times that while a backlog remains.
+        # clock is the latest timestamp any *_at call has seen; expire_cycle()
+        # reaps up to it.
+        self.active_expire_effort = active_expire_effort
+        self.expire_slice = active_expire_effort
+        self.clock = 0
+        self.back = timeline if timeline is not None else BackupTimeline()
+        # Delta backups (delta_chain > 0): a backup stores only the keys
+        # changed since the previous one, and every delta_chain deltas the
+        # chain is folded into a new base. _changed is None when the next
+        # backup has to be a base (no previous backup, or after a restore).
+        self.delta_chain = delta_chain
+        self._changed: set[str] | None = None
+        self._last_backup: Snapshot | None = None
+        # Lazy restore: records older than _restore_version still carry the
+        # restored backup's expiries and are rebased by _restore_shift when
+        # first touched. _restore_pending is cleared once none are left.
+        self._restore_version = 0
+        self._restore_shift = 0
+        self._restore_pending = False
+        # Background save: pid of the saving child (0 when none is running)
+        # and the status of the latest save.
+        self._save_pid = 0
+        self._save_status: dict = {"status": "none", "path": None, "started": None, "duration": None}
+        # Optional persistence.WriteAheadLog; every mutation is appended to it.
+        self.wal = wal
+        # Time-travel reads: the last history_limit versions of every field
+        # written by a timestamped operation (0 disables history), plus the
+        # timestamp, snapshot and expiry shift of the last history_limit
+        # restores; see _prune_history(). _history_order lists the
+        # (key, field) pairs of history from least to most recently written.
+        self.history_limit = history_limit
+        self.history: dict[str, dict[str, FieldHistory]] = {}
+        self._history_order: OrderedDict[tuple[str, str], None] = OrderedDict()
+        self.restore_times: list[int] = []
+        self.restores: list[tuple[Snapshot | None, int]] = []
+        # Optional cache of rendered scans (scan_cache_size entries, 0 disables).
+        self.scan_cache = ScanCache(scan_cache_size) if scan_cache_size else None
+        # Approximate bytes held by the live records. Once a write takes it
+        # past maxmemory (0 means no limit), records or fields are evicted
+        # according to maxmemory_policy until it fits again.
+        self.used_memory = 0
+        self.maxmemory = maxmemory
+        self.maxmemory_policy = maxmemory_policy
+        self.evicted_keys = 0
+        self.evicted_fields = 0
+        # Keys from least to most recently used; only kept for allkeys-lru.
+        # After a restore it starts empty, and the restored keys not used
+        # since are evicted first, in the order _lru_cold yields them.
+        self._lru: OrderedDict[str, None] | None = (
+            OrderedDict() if maxmemory and maxmemory_policy == "allkeys-lru" else None)
+        self._lru_cold: Iterator[str] | None = None
+        self._rng = random.Random(0)
+        # Evictions made by the operation being applied, logged right after
+        # it as MDELETE/DELETE entries so that recovery replays them.
+        self._evictions: list[tuple] = []
 
     # ==================== LEVEL 1: Basic Operations ====================
 
@@ -27,7 +640,9 @@ class Simulation:
         Returns:
             An empty string "".
         """
-        self.data[key][field]=value
+        self._set_field(key, field, value)
+        if self.wal is not None:
+            self._log("SET", key, field, value)
         return ""
 
 
@@ -44,9 +659,11 @@ class Simulation:
         """
         if key not in self.data:
             return ""
+        if self._lru is not None:
+            self._touch(key)
         if field not in self.data[key]:
             return ""
-        return self.data[key][field]
+        return self.data[key].get(field)
 
     def delete(self, key: str, field: str) -> str:
         """
@@ -60,11 +677,10 @@ class Simulation:
             "true" if the field was successfully deleted.
             "false" if the key or field does not exist.
         """
-        if key not in self.data:
+        if not self._delete_field(key, field):
             return "false"
-        if field not in self.data[key]:
-            return "false"
-        self.data[key].pop(field)
+        if self.wal is not None:
+            self._log("DELETE", key, field)
         return "true"
 
     # ==================== LEVEL 2: Scan Operations ====================
@@ -81,12 +697,7 @@ class Simulation:
             Fields sorted lexicographically.
             Empty string "" if record doesn't exist.
         """
-        if key not in self.data:
-            return ""
-        res = []
-        for field in self.data[key]:
-            res.append(str(field)+"("+str(self.data[key][field])+")")
-        return ", ".join(sorted(res))
+        return self._scan(key, "")
 
     def scan_by_prefix(self, key: str, prefix: str) -> str:
         """
@@ -101,17 +712,7 @@ class Simulation:
             Fields sorted lexicographically.
             Empty string "" if record doesn't exist or no fields match.
         """
-        if key not in self.data:
-            return ""
-        res = []
-        l_p=len(list(prefix))
-        for field in self.data[key]:
-            l=len(list(field))
-            if l_p>l:
-                continue
-            if list(prefix)==list(field)[:l_p]:
-                res.append(str(field)+"("+str(self.data[key][field])+")")
-        return ", ".join(sorted(res))
+        return self._scan(key, prefix)
 
     # ==================== LEVEL 3: Timestamp & TTL ====================
 
@@ -128,7 +729,13 @@ class Simulation:
         Returns:
             An empty string "".
         """
-        self.data[key][field]=value
+        self._set_field(key, field, value)
+        if timestamp > self.clock:
+            self.clock = timestamp
+        if self.history_limit:
+            self._record_version(key, field, timestamp, value, None)
+        if self.wal is not None:
+            self._log("SET_AT", key, field, value, timestamp)
         return ""
 
     def set_at_with_ttl(self, key: str, field: str, value: str, timestamp: int, ttl: int) -> str:
@@ -147,8 +754,14 @@ class Simulation:
         Returns:
             An empty string "".
         """
-        self.data[key][field]=value
-        self.expire[key][field]=timestamp+ttl
+        heapq.heappush(self.expiry_heap, (timestamp + ttl, key, field))
+        self._set_field(key, field, value, timestamp + ttl)
+        if timestamp > self.clock:
+            self.clock = timestamp
+        if self.history_limit:
+            self._record_version(key, field, timestamp, value, timestamp + ttl)
+        if self.wal is not None:
+            self._log("SET_AT_WITH_TTL", key, field, value, timestamp, ttl)
         return ""
 
     def get_at(self, key: str, field: str, timestamp: int) -> str:
@@ -163,15 +776,14 @@ class Simulation:
         Returns:
             The value if found and not expired, empty string "" otherwise.
         """
-        for f, expiry in list(self.expire[key].items()):
-            if expiry<=timestamp:
-                self.data[key].pop(f)
-                self.expire[key].pop(f)
+        self._expire(key, timestamp, (field,))
         if key not in self.data:
             return ""
+        if self._lru is not None:
+            self._touch(key)
         if field not in self.data[key]:
             return ""
-        return self.data[key][field]
+        return self.data[key].get(field)
 
     def delete_at(self, key: str, field: str, timestamp: int) -> str:
         """
@@ -186,15 +798,13 @@ class Simulation:
             "true" if field existed and was deleted.
             "false" if key or field doesn't exist (including if expired).
         """
-        for f, expiry in list(self.expire[key].items()):
-            if expiry<=timestamp:
-                self.data[key].pop(f)
-                self.expire[key].pop(f)
-        if key not in self.data:
-            return "false"
-        if field not in self.data[key]:
+        self._expire(key, timestamp, (field,))
+        if not self._delete_field(key, field):
             return "false"
-        self.data[key].pop(field)
+        if self.history_limit:
+            self._record_version(key, field, timestamp, None, None)
+        if self.wal is not None:
+            self._log("DELETE_AT", key, field, timestamp)
         return "true"
         
 
@@ -209,16 +819,8 @@ class Simulation:
         Returns:
             Same format as scan(), excluding expired fields.
         """
-        for f, expiry in list(self.expire[key].items()):
-            if expiry<=timestamp:
-                self.data[key].pop(f)
-                self.expire[key].pop(f)
-        if key not in self.data:
-            return ""
-        res = []
-        for field in self.data[key]:
-            res.append(str(field)+"("+str(self.data[key][field])+")")
-        return ", ".join(sorted(res))
+        self._expire(key, timestamp)
+        return self._scan(key, "")
 
     def scan_by_prefix_at(self, key: str, prefix: str, timestamp: int) -> str:
         """
@@ -232,21 +834,356 @@ class Simulation:
         Returns:
             Same format as scan_by_prefix(), excluding expired fields.
         """
-        for f, expiry in list(self.expire[key].items()):
-            if expiry<=timestamp:
-                self.data[key].pop(f)
-                self.expire[key].pop(f)
-        if key not in self.data:
+        self._expire(key, timestamp, prefix=prefix)
+        return self._scan(key, prefix)
+
+    def _scan(self, key: str, prefix: str) -> str:
+        rec = self.data.get(key)
+        if rec is None:
             return ""
-        res = []
-        l_p=len(list(prefix))
-        for field in self.data[key]:
-            l=len(list(field))
-            if l_p>l:
-                continue
-            if list(prefix)==list(field)[:l_p]:
-                res.append(str(field)+"("+str(self.data[key][field])+")")
-        return ", ".join(sorted(res))
+        if self._lru is not None:
+            self._touch(key)
+        if self.scan_cache is None:
+            return rec.scan(prefix)
+        return self.scan_cache.scan(key, prefix, rec)
+
+    def _log(self, *entry) -> None:
+        due = self.wal.append(entry)
+        if self._evictions:
+            for evicted in self._evictions:
+                due = self.wal.append(evicted) or due
+            self._evictions.clear()
+        if due:
+            self.wal.checkpoint(self)
+
+    def _writable(self, key: str, create: bool = False) -> Record | None:
+        """
+        Return the record for key, safe to modify.
+
+        A record still shared with a backup is copied first, and so is the
+        top-level dict the first time it is changed after a backup. The
+        caller is about to modify the record, so its generation is bumped.
+        Returns None if the record does not exist and create is False.
+        """
+        rec = self.data.get(key)
+        if rec is not None and rec.version == self.version:
+            rec.gen = next(_generations)
+            return rec
+        if rec is None and not create:
+            return None
+        if self._data_shared:
+            self.data = self.data.copy()
+            self.keys = self.keys.copy()
+            self._data_shared = False
+        data = self.data
+        if type(data) is Overlay and type(data.base) is dict and len(data.changes) > len(data.base):
+            # The overlay has outgrown the map under it: fold both into one
+            # dict (amortized O(1) per change) so reads stop going through it.
+            self.data = dict(data)
+        if self._changed is not None:
+            self._changed.add(key)
+        if rec is None:
+            key = sys.intern(key)
+            rec = Record(self.version)
+            self.keys.add(key)
+        else:
+            pending = rec.version < self._restore_version
+            rec = rec.copy(self.version)
+            rec.gen = next(_generations)
+            if pending and rec.expire:
+                for field in rec.expire:
+                    rec.expire[field] += self._restore_shift
+                    heapq.heappush(self.expiry_heap, (rec.expire[field], key, field))
+        self.data[key] = rec
+        return rec
+
+    def _rebase(self, key: str) -> None:
+        """Give a record restored lazily its ttls relative to the restore."""
+        rec = self.data.get(key)
+        if rec is not None and rec.expire and rec.version < self._restore_version:
+            self._writable(key)
+
+    def _rebase_all(self) -> None:
+        """Rebase every restored record that is still pending (one full pass)."""
+        if not self._restore_pending:
+            return
+        restored = self._restore_version
+        for key in [key for key, rec in self.data.items() if rec.expire and rec.version < restored]:
+            self._writable(key)
+        self._restore_pending = False
+
+    def _set_field(self, key: str, field: str, value: str, expiry: int | None = None) -> None:
+        self._set_fields(key, ((field, value),), expiry)
+
+    def _set_fields(self, key: str, items: Iterable[tuple[str, str]], expiry: int | None = None) -> None:
+        """
+        Store fields, keeping used_memory current and evicting if over
+        maxmemory. Under the allkeys policies, a write that would leave the
+        record alone over maxmemory is rejected with ValueError before
+        anything changes, since eviction could only make room by dropping
+        the record just written.
+        """
+        rec = self.data.get(key)
+        before = rec.nbytes if rec is not None else 0
+        if self.maxmemory and self.maxmemory_policy != "volatile-ttl":
+            size = self._size_after(rec, items, expiry)
+            if size > self.maxmemory:
+                raise ValueError(f"OOM: record {key!r} would take {size} bytes, "
+                                 f"over maxmemory ({self.maxmemory})")
+        rec = self._writable(key, create=True)
+        for field, value in items:
+            rec.set(field, value, expiry)
+        self.used_memory += rec.nbytes - before
+        if self._lru is not None:
+            self._touch(key)
+        if self.maxmemory and self.used_memory > self.maxmemory:
+            self._evict()
+
+    @staticmethod
+    def _size_after(rec: Record | None, items: Iterable[tuple[str, str]], expiry: int | None) -> int:
+        """The nbytes rec would have once Record.set() stored items."""
+        size = sys.getsizeof
+        if rec is None:
+            nbytes, values, expire = RECORD_OVERHEAD, {}, {}
+        else:
+            nbytes, values, expire = rec.nbytes, rec.values, rec.expire or {}
+        for field, value in items:
+            old = values.get(field)
+            if old is None:
+                nbytes += size(field) + size(value) + FIELD_OVERHEAD
+            else:
+                nbytes += size(value) - size(old)
+            if expiry is not None:
+                nbytes += 0 if field in expire else EXPIRY_OVERHEAD
+            elif field in expire:
+                nbytes -= EXPIRY_OVERHEAD
+        return nbytes
+
+    def _touch(self, key: str) -> None:
+        """Make key, which must exist, the most recently used (allkeys-lru)."""
+        lru = self._lru
+        lru[key] = None
+        lru.move_to_end(key)
+
+    def _lru_victim(self) -> str:
+        """The least recently used key: restored keys not used since come first."""
+        cold = self._lru_cold
+        if cold is not None:
+            data, lru = self.data, self._lru
+            for key in cold:
+                if key in data and key not in lru:
+                    return key
+            self._lru_cold = None
+        return next(iter(self._lru))
+
+    def _delete_field(self, key: str, field: str) -> bool:
+        """Remove field, dropping the record once it is empty."""
+        rec = self.data.get(key)
+        if rec is None or field not in rec:
+            return False
+        if len(rec) == 1:
+            self._drop_record(key)
+            return True
+        before = rec.nbytes
+        rec = self._writable(key)
+        rec.delete(field)
+        self.used_memory += rec.nbytes - before
+        return True
+
+    def _delete_fields(self, key: str, fields: list[str]) -> list[str]:
+        """
+        Remove fields from one record with a single copy-on-write.
+
+        Returns:
+            "true" or "false" per field, as delete() would; a field listed
+            twice is only deleted once.
+        """
+        rec = self.data.get(key)
+        if rec is None:
+            return ["false"] * len(fields)
+        doomed = {}
+        results = []
+        for field in fields:
+            hit = field in rec and field not in doomed
+            if hit:
+                doomed[field] = None
+            results.append("true" if hit else "false")
+        if len(doomed) == len(rec):
+            self._drop_record(key)
+        elif doomed:
+            before = rec.nbytes
+            rec = self._writable(key)
+            for field in doomed:
+                rec.delete(field)
+            self.used_memory += rec.nbytes - before
+        return results
+
+    def _drop_record(self, key: str) -> None:
+        """Remove the whole record for key, which must exist."""
+        if self._data_shared:
+            self.data = self.data.copy()
+            self.keys = self.keys.copy()
+            self._data_shared = False
+        if self._changed is not None:
+            self._changed.add(key)
+        self.used_memory -= self.data.pop(key).nbytes
+        self.keys.remove(key)
+        if self._lru is not None:
+            self._lru.pop(key, None)
+
+    def _evict(self) -> None:
+        """
+        Free memory until used_memory fits in maxmemory:
+            allkeys-lru: drop the least recently used record.
+            allkeys-random: drop a random record.
+            volatile-ttl: delete the field closest to expiring; fields
+                without a ttl are never evicted, so this may stop short.
+        Which records go depends on reads and on the random generator, so
+        with a write-ahead log every eviction is queued to be logged.
+        """
+        heap = self.expiry_heap
+        logged = self.wal is not None
+        while self.used_memory > self.maxmemory and self.data:
+            if self.maxmemory_policy != "volatile-ttl":
+                if self.maxmemory_policy == "allkeys-lru":
+                    key = self._lru_victim()
+                else:
+                    key = self.keys[self._rng.randrange(len(self.keys))]
+                if logged:
+                    self._evictions.append(("MDELETE", key, list(self.data[key].index)))
+                self._drop_record(key)
+                self.evicted_keys += 1
+            else:
+                while heap:
+                    expiry, key, field = heapq.heappop(heap)
+                    rec = self.data.get(key)
+                    if rec is not None and rec.expiry(field) == expiry:
+                        if logged:
+                            self._evictions.append(("DELETE", key, field))
+                        self._delete_field(key, field)
+                        self.evicted_fields += 1
+                        break
+                else:
+                    return
+
+    def stats(self) -> dict[str, int | str]:
+        """Memory and eviction counters, in the spirit of Redis INFO."""
+        info = {
+            "used_memory": self.used_memory,
+            "maxmemory": self.maxmemory,
+            "maxmemory_policy": self.maxmemory_policy,
+            "records": len(self.data),
+            "evicted_keys": self.evicted_keys,
+            "evicted_fields": self.evicted_fields,
+            "expired_fields": self.total_reaped,
+        }
+        if self.scan_cache is not None:
+            info["scan_cache_hits"] = self.scan_cache.hits
+            info["scan_cache_misses"] = self.scan_cache.misses
+        return info
+
+    def _reset_memory(self, used_memory: int | None = None, cold_keys: Iterable[str] | None = None) -> None:
+        """
+        Reset used_memory (recomputed unless known) and the LRU order after
+        replacing self.data. With cold_keys, which nothing may modify, the
+        LRU starts empty and is not rebuilt from every key: cold_keys are
+        evicted first, skipping any used since.
+        """
+        if used_memory is None:
+            used_memory = sum(rec.nbytes for rec in self.data.values())
+        self.used_memory = used_memory
+        if self._lru is not None:
+            if cold_keys is None:
+                self._lru, self._lru_cold = OrderedDict.fromkeys(self.keys), None
+            else:
+                self._lru, self._lru_cold = OrderedDict(), iter(cold_keys)
+
+    def expire_cycle(self, budget: int | None = None) -> int:
+        """
+        Run one active-expiry slice at the logical clock, for callers with
+        idle time (e.g. the server between requests).
+
+        Args:
+            budget: Heap entries to look at; defaults to the current slice.
+
+        Returns:
+            The number of fields removed.
+        """
+        return self._reap_expired(self.clock, budget=budget or self.expire_slice or None)
+
+    def _expire(self, key: str, timestamp: int, fields: Iterable[str] | None = None, prefix: str = "") -> None:
+        """
+        Expiry work done by a *_at call about to read key: the fields
+        listed, or if fields is None, every field starting with prefix.
+        """
+        if self._restore_pending:
+            self._rebase(key)
+        self._reap_expired(timestamp)
+        heap = self.expiry_heap
+        if self.active_expire_effort and heap and heap[0][0] <= timestamp:
+            # The bounded slice left due entries behind, which may include
+            # some of the fields about to be read.
+            self.last_reaped += self._expire_fields(key, timestamp, fields, prefix)
+
+    def _expire_fields(self, key: str, timestamp: int, fields: Iterable[str] | None, prefix: str) -> int:
+        """
+        Passively remove the due fields among those a call reads; their
+        heap entries go stale. Only a full scan looks at every ttl.
+        """
+        rec = self.data.get(key)
+        if rec is None or not rec.expire:
+            return 0
+        if fields is None:
+            if prefix:
+                index = rec.index
+                fields = itertools.takewhile(
+                    lambda field: field.startswith(prefix),
+                    itertools.islice(index, bisect.bisect_left(index, prefix), None))
+            else:
+                fields = rec.expire
+        expire = rec.expire
+        due = {field: None for field in fields if expire.get(field, timestamp + 1) <= timestamp}
+        for field in due:
+            self._delete_field(key, field)
+        self.total_reaped += len(due)
+        return len(due)
+
+    def _reap_expired(self, timestamp: int, bounded: bool = True, budget: int | None = None) -> int:
+        """
+        Remove fields whose expiry is at or before timestamp.
+
+        Timestamps strictly increase, so only the heap entries that are due
+        have to be looked at; the cost scales with the number of expirations
+        rather than with the size of the records. With active_expire_effort
+        set and bounded true, at most expire_slice entries are popped, so a
+        mass expiry is spread over the following calls instead of stalling
+        one of them; the slice doubles while due entries are left over and
+        drops back once the backlog is gone.
+
+        Returns:
+            The number of fields removed (also stored in self.last_reaped).
+        """
+        if timestamp > self.clock:
+            self.clock = timestamp
+        if budget is None:
+            budget = self.expire_slice if bounded and self.active_expire_effort else -1
+        heap = self.expiry_heap
+        reaped = 0
+        while budget and heap and heap[0][0] <= timestamp:
+            budget -= 1
+            expiry, key, field = heapq.heappop(heap)
+            rec = self.data.get(key)
+            if rec is not None and rec.expiry(field) == expiry:
+                self._delete_field(key, field)
+                reaped += 1
+        if self.active_expire_effort:
+            if heap and heap[0][0] <= timestamp:
+                self.expire_slice = min(2 * self.expire_slice, 16 * self.active_expire_effort)
+            else:
+                self.expire_slice = self.active_expire_effort
+        self.last_reaped = reaped
+        self.total_reaped += reaped
+        return reaped
 
     # ==================== LEVEL 4: Backup & Restore ====================
 
@@ -263,14 +1200,51 @@ class Simulation:
         Returns:
             String representing the number of non-empty, non-expired records.
         """
-        for key in list(self.data.keys()):
-            for f, expiry in list(self.expire[key].items()):
-                if expiry<=timestamp:
-                    self.data[key].pop(f)
-                    self.expire[key].pop(f)
-        self.back[timestamp]={"data": copy.deepcopy(self.data), "expire": copy.deepcopy(self.expire)}
-        count = sum(1 for key in self.data if self.data[key])                                                              
-        return str(count)
+        self._rebase_all()
+        self._reap_expired(timestamp, bounded=False)
+        if self.delta_chain:
+            self.back.add(self._delta_backup(timestamp))
+        else:
+            # O(1): the snapshot shares every record with the live database,
+            # and whatever is modified later is copied on write.
+            self.back.add(Snapshot(timestamp, self.data, self.keys, used_memory=self.used_memory))
+            self._data_shared = True
+        self.version += 1
+        if self.restores:
+            self._prune_history()  # retention may have dropped a restored backup
+        if self.wal is not None:
+            self._log("BACKUP", timestamp)
+        return str(len(self.data))
+
+    def _delta_backup(self, timestamp: int) -> Snapshot:
+        """
+        A delta holding the records changed since the previous backup, or a
+        new base once the chain is delta_chain long. Records are shared with
+        the live database through the version bump that follows, so only
+        the changed keys are visited, and the live dict is never shared.
+        A new base is not a copy of the whole map either: the live database
+        goes on in an overlay over it, and a base taken while on an overlay
+        copies only that overlay's changes.
+        """
+        parent = self._last_backup
+        if self._changed is None or parent is None or parent.depth >= self.delta_chain:
+            data = self.data
+            if type(data) is Overlay:
+                data = data.copy()
+            else:
+                self.data = Overlay(data)
+            snapshot = Snapshot(timestamp, data, self.keys.copy(), used_memory=self.used_memory)
+        else:
+            data = self.data
+            snapshot = Snapshot(timestamp, {key: data.get(key) for key in self._changed}, parent=parent,
+                                used_memory=self.used_memory)
+        self._changed = set()
+        self._last_backup = snapshot
+        return snapshot
+
+    def compact_backups(self) -> bool:
+        """Run one step of backup compaction; see BackupTimeline.compact()."""
+        return self.back.compact()
 
     def restore(self, timestamp: int, timestamp_to_restore: int) -> str:
         """
@@ -285,8 +1259,407 @@ class Simulation:
         Returns:
             An empty string "".
         """
-        ix=bisect.bisect_left(sorted(list(self.back.keys())), timestamp_to_restore)
-        t=sorted(list(self.back.keys()))[ix-1]
-        self.data=self.back[t]["data"]
-        self.expire=self.back[t]["expire"]
+        snapshot = self.back.latest_at_or_before(timestamp_to_restore)
+        if snapshot is None:
+            return ""  # only possible once retention dropped the backup
+        # Fields keep their remaining ttl: expiry moves forward by the time
+        # elapsed since the backup. Rather than rewriting every expiry now,
+        # the database runs on an overlay over the backup's map (O(1) for a
+        # base backup, and a snapshot file is only decoded where it is read),
+        # so a write copies just the record it touches, and each record is
+        # rebased when first touched; see _writable(). A backup or key scan
+        # later rebases whatever is left in one pass.
+        shift = timestamp - snapshot.timestamp
+        if snapshot.parent is None:
+            base = snapshot.data
+            # A backup taken while on an overlay shares its base; copying
+            # its changes keeps overlays one level deep.
+            self.data = base.copy() if isinstance(base, Overlay) else Overlay(base)
+            self.keys = snapshot.keys.copy()
+            cold_keys = snapshot.keys  # unowned now, so never modified
+            self._data_shared = False
+        else:
+            self.data = snapshot.materialize()
+            self.keys = SortedKeys(sorted(self.data))
+            cold_keys = self.keys.copy()
+            self._data_shared = False
+        self.version += 1
+        self._restore_version = self.version
+        self._restore_shift = shift
+        self._restore_pending = True
+        self.expiry_heap = []
+        if snapshot.used_memory is None:
+            snapshot.used_memory = sum(rec.nbytes for rec in self.data.values())  # once per backup
+        self._reset_memory(snapshot.used_memory, cold_keys)
+        self._changed = None
+        if self.history_limit:
+            self.restore_times.append(timestamp)
+            self.restores.append((snapshot, shift))
+            self._prune_history()
+        if self.wal is not None:
+            self._log("RESTORE", timestamp, timestamp_to_restore)
+        return ""
+
+    # ==================== Background Save ====================
+
+    def bgsave(self, path: str, timestamp: int | None = None) -> str:
+        """
+        Save the live database to path in the snapshot file format, in the
+        background: the process forks, and the child writes the copy-on-write
+        image of the data it inherited while the parent keeps serving. The
+        file replaces path atomically once complete. Without fork the save
+        runs in the foreground.
+
+        Args:
+            path: The file to write.
+            timestamp: Remaining ttls are computed at this time; defaults
+                to the logical clock (the latest timestamp seen).
+
+        Returns:
+            "Background saving started". If the fork itself fails, the save
+            is recorded as "err" and the OSError is raised.
+        """
+        if self.last_save_status()["status"] == "in_progress":
+            raise RuntimeError("a background save is already in progress")
+        if timestamp is None:
+            timestamp = self.clock
+        self._save_status = {"status": "in_progress", "path": path, "started": time.time(), "duration": None}
+        if not hasattr(os, "fork"):
+            # Failures are reported through last_save_status(), as a
+            # forked child's would be.
+            ok = False
+            try:
+                self._save(path, timestamp)
+                ok = True
+            except Exception:
+                pass
+            finally:
+                self._finish_save(ok)
+            return "Background saving started"
+        try:
+            pid = os.fork()
+        except OSError:
+            self._finish_save(False)  # else no later save could start
+            raise
+        if pid == 0:
+            code = 1
+            try:
+                self._save(path, timestamp)
+                code = 0
+            finally:
+                os._exit(code)
+        self._save_pid = pid
+        return "Background saving started"
+
+    def last_save_status(self, wait: bool = False) -> dict:
+        """
+        Status of the latest background save: "none", "in_progress", "ok"
+        or "err", with its path, start time and duration in seconds.
+
+        Args:
+            wait: Block until a running save has finished.
+        """
+        if self._save_pid:
+            pid, status = os.waitpid(self._save_pid, 0 if wait else os.WNOHANG)
+            if pid:
+                self._save_pid = 0
+                self._finish_save(os.waitstatus_to_exitcode(status) == 0)
+        return dict(self._save_status)
+
+    def _finish_save(self, ok: bool) -> None:
+        self._save_status["status"] = "ok" if ok else "err"
+        self._save_status["duration"] = time.time() - self._save_status["started"]
+
+    def _save(self, path: str, timestamp: int) -> None:
+        from snapshot import dump  # snapshot imports this module
+
+        self._rebase_all()  # in the child, this only touches its own copy
+        tmp = path + ".tmp"
+        dump(Snapshot(timestamp, self.data, self.keys), tmp)
+        os.replace(tmp, path)
+
+    # ==================== Batch Operations ====================
+
+    def mset(self, key: str, fields: dict[str, str]) -> str:
+        """
+        Same as set() for every field-value pair, resolving the record once.
+
+        Args:
+            key: The record identifier.
+            fields: Field name -> value to store.
+
+        Returns:
+            An empty string "".
+        """
+        if fields:
+            self._set_fields(key, fields.items())
+            if self.wal is not None:
+                self._log("MSET", key, dict(fields))
+        return ""
+
+    def mget(self, key: str, fields: list[str]) -> list[str]:
+        """
+        Same as get() for every field, resolving the record once.
+
+        Returns:
+            The value of each field, "" where the record or field doesn't exist.
+        """
+        rec = self.data.get(key)
+        if rec is None:
+            return [""] * len(fields)
+        if self._lru is not None:
+            self._touch(key)
+        return [rec.get(field) for field in fields]
+
+    def mdelete(self, key: str, fields: list[str]) -> list[str]:
+        """
+        Same as delete() for every field, with a single copy-on-write.
+
+        Returns:
+            "true" or "false" per field, in order.
+        """
+        results = self._delete_fields(key, fields)
+        if self.wal is not None and "true" in results:
+            self._log("MDELETE", key, list(fields))
+        return results
+
+    def mset_at(self, key: str, fields: dict[str, str], timestamp: int) -> str:
+        """Same as mset(), but with timestamp specified."""
+        if fields:
+            self._set_fields(key, fields.items())
+            if timestamp > self.clock:
+                self.clock = timestamp
+            if self.history_limit:
+                for field, value in fields.items():
+                    self._record_version(key, field, timestamp, value, None)
+            if self.wal is not None:
+                self._log("MSET_AT", key, dict(fields), timestamp)
+        return ""
+
+    def mset_at_with_ttl(self, key: str, fields: dict[str, str], timestamp: int, ttl: int) -> str:
+        """Same as mset_at(), with every field living during [timestamp, timestamp + ttl)."""
+        if fields:
+            expiry = timestamp + ttl
+            heap = self.expiry_heap
+            for field in fields:
+                heapq.heappush(heap, (expiry, key, field))
+            self._set_fields(key, fields.items(), expiry)
+            if timestamp > self.clock:
+                self.clock = timestamp
+            if self.history_limit:
+                for field, value in fields.items():
+                    self._record_version(key, field, timestamp, value, expiry)
+            if self.wal is not None:
+                self._log("MSET_AT_WITH_TTL", key, dict(fields), timestamp, ttl)
         return ""
+
+    def mget_at(self, key: str, fields: list[str], timestamp: int) -> list[str]:
+        """Same as mget(), but with timestamp specified; expiry runs once."""
+        self._expire(key, timestamp, fields)
+        return self.mget(key, fields)
+
+    def mdelete_at(self, key: str, fields: list[str], timestamp: int) -> list[str]:
+        """Same as mdelete(), but with timestamp specified; expiry runs once."""
+        self._expire(key, timestamp, fields)
+        results = self._delete_fields(key, fields)
+        if "true" in results:
+            if self.history_limit:
+                for field, result in zip(fields, results):
+                    if result == "true":
+                        self._record_version(key, field, timestamp, None, None)
+            if self.wal is not None:
+                self._log("MDELETE_AT", key, list(fields), timestamp)
+        return results
+
+    # ==================== Key Namespace: Cursor Iteration ====================
+
+    def scan_keys_by_prefix(self, prefix: str, cursor: str = "0", count: int = 10) -> tuple[str, list[str]]:
+        """
+        Return one page of the record keys starting with prefix, in
+        lexicographic order.
+
+        The cursor is "0" to start, and the returned cursor is "0" once the
+        iteration is complete. Any other cursor continues after the last
+        key of the previous page, so a key present during the whole
+        iteration is returned exactly once even if other keys come and go.
+
+        Args:
+            prefix: The prefix to filter keys by.
+            cursor: "0" or the cursor returned by the previous call.
+            count: The maximum number of keys to return.
+
+        Returns:
+            (next_cursor, keys).
+        """
+        next_cursor, page, _ = self._scan_keys(prefix, cursor, count)
+        return next_cursor, page
+
+    def scan_keys_by_prefix_at(self, prefix: str, cursor: str, count: int, timestamp: int) -> tuple[str, list[str]]:
+        """
+        Same as scan_keys_by_prefix(), excluding records that have expired.
+
+        Only the usual expiry slice runs up front; records the slice has
+        not reached (or that a restore left pending) are checked as the
+        page passes them, and the expired ones are removed afterwards, so
+        a page costs what it reads rather than O(records).
+        """
+        self._reap_expired(timestamp)
+        next_cursor, page, expired = self._scan_keys(prefix, cursor, count,
+                                                     lambda key: self._expired(key, timestamp))
+        for key in expired:
+            if self._restore_pending:
+                self._rebase(key)
+            self.last_reaped += self._expire_fields(key, timestamp, None, "")
+        return next_cursor, page
+
+    def _scan_keys(self, prefix: str, cursor: str, count: int,
+                   skip: Callable[[str], bool] | None = None) -> tuple[str, list[str], list[str]]:
+        """
+        (next_cursor, page, skipped) for scan_keys_by_prefix(): keys for
+        which skip returns True are left out of the page and listed apart,
+        so the caller can remove them once the iteration is over.
+        """
+        if count < 1:
+            raise ValueError(f"count must be positive, got {count}")
+        start, exclusive = prefix, False
+        if cursor != "0" and cursor[1:] >= prefix:
+            start, exclusive = cursor[1:], True
+        page, skipped = [], []
+        for key in self.keys.irange(start, exclusive):
+            if not key.startswith(prefix):
+                break
+            if skip is not None and skip(key):
+                skipped.append(key)
+            elif len(page) == count:
+                return "@" + page[-1], page, skipped
+            else:
+                page.append(key)
+        return "0", page, skipped
+
+    def _expired(self, key: str, timestamp: int) -> bool:
+        """Whether every field of key has expired by timestamp."""
+        rec = self.data[key]
+        expire = rec.expire
+        if not expire or len(expire) < len(rec):
+            return False
+        # A record a restore left pending still has the backup's expiries.
+        shift = self._restore_shift if self._restore_pending and rec.version < self._restore_version else 0
+        return max(expire.values()) + shift <= timestamp
+
+    # ==================== History: Time-Travel Reads ====================
+
+    def get_as_of(self, key: str, field: str, timestamp: int) -> str:
+        """
+        Return what get_at(key, field, timestamp) would have returned at
+        that point of the timeline, without changing the database.
+
+        Only timestamped writes are versioned, and only the newest
+        history_limit versions of a field, and the newest history_limit
+        restores still in the backup timeline, are kept; older reads
+        return "".
+
+        Args:
+            key: The record identifier.
+            field: The field name.
+            timestamp: The point in time to read at.
+
+        Returns:
+            The value then, empty string "" if it did not exist or had expired.
+        """
+        value, expiry = self._version_as_of(key, field, timestamp)
+        if value is None or (expiry is not None and expiry <= timestamp):
+            return ""
+        return value
+
+    def scan_as_of(self, key: str, timestamp: int) -> str:
+        """
+        Same as get_as_of(), but for scan_at(key, timestamp).
+
+        Returns:
+            Same format as scan(), as the record was at timestamp.
+        """
+        fields = set(self.history.get(key, ()))
+        restored = self._restore_as_of(timestamp)
+        rec = restored[1].get(key) if restored is not None and restored[1] is not None else None
+        if rec is not None:
+            fields.update(rec.values)
+        res = []
+        for field in sorted(fields):
+            value = self.get_as_of(key, field, timestamp)
+            if value:
+                res.append(f"{field}({value})")
+        return ", ".join(res)
+
+    def _record_version(self, key: str, field: str, timestamp: int,
+                        value: str | None, expiry: int | None) -> None:
+        fields = self.history.setdefault(key, {})
+        versions = fields.get(field)
+        if versions is None:
+            versions = fields[field] = FieldHistory()
+            self._history_order[key, field] = None
+        else:
+            self._history_order.move_to_end((key, field))
+        versions.add(timestamp, value, expiry, self.history_limit)
+
+    def _prune_history(self) -> None:
+        """
+        Keep at most history_limit restores, and none whose backup has been
+        dropped by retention, so that history does not keep snapshots alive.
+        Forgotten restores are replaced by one placeholder at the latest of
+        their timestamps: reads before it, and reads after it of fields not
+        written since, return "". Field versions at or before it can never
+        be read again, so fields last written before it are dropped.
+        """
+        times, restores = self.restore_times, self.restores
+        forget = len(times) - self.history_limit
+        for i in range(len(times) - 1, max(forget, 0) - 1, -1):
+            snapshot = restores[i][0]
+            if snapshot is not None and self.back.latest_at_or_before(snapshot.timestamp) is not snapshot:
+                forget = i + 1
+                break
+        if forget <= 0 or (forget == 1 and restores[0][0] is None):
+            return
+        horizon = times[forget - 1]
+        times[:forget] = [horizon]
+        restores[:forget] = [(None, 0)]
+        history, order = self.history, self._history_order
+        while order:
+            key, field = next(iter(order))
+            fields = history[key]
+            if fields[field].times[-1] > horizon:
+                break
+            order.popitem(last=False)
+            del fields[field]
+            if not fields:
+                del history[key]
+
+    def _restore_as_of(self, timestamp: int) -> tuple[int, Snapshot | None, int] | None:
+        """
+        (restore timestamp, snapshot, shift) of the last restore by
+        timestamp; the snapshot is None for restores history has forgotten.
+        """
+        i = bisect.bisect_right(self.restore_times, timestamp) - 1
+        if i < 0 and self.restores and self.restores[0][0] is None:
+            i = 0  # nothing before a forgotten restore is known either
+        return (self.restore_times[i], *self.restores[i]) if i >= 0 else None
+
+    def _version_as_of(self, key: str, field: str, timestamp: int) -> tuple[str | None, int | None]:
+        """(value, absolute expiry) of field at timestamp; value None if absent."""
+        versions = self.history.get(key, {}).get(field)
+        i = versions.latest(timestamp) if versions is not None else -1
+        restored = self._restore_as_of(timestamp)
+        if i >= 0 and (restored is None or versions.times[i] > restored[0]):
+            expiry = versions.expiries[i]
+            return versions.values[i], (None if expiry < 0 else expiry)
+        if restored is None:
+            return None, None
+        restored_at, snapshot, shift = restored
+        if snapshot is None or (versions is not None and versions.dropped is not None
+                                and versions.dropped > restored_at):
+            return None, None  # the version then was forgotten
+        # Not written since the last restore: the restored backup decides.
+        rec = snapshot.get(key)
+        if rec is None or field not in rec:
+            return None, None
+        expiry = rec.expiry(field)
+        return rec.get(field), (None if expiry is None else expiry + shift)
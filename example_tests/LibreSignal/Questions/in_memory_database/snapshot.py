@@ -0,0 +1,220 @@
+"""
+Compact binary snapshot files for the in-memory database simulation.
+============================================================
+A snapshot file holds one backup, so it can be handed to another process
+or kept on disk. Fields store their remaining ttl rather than an absolute
+expiry, as level 4 requires, so the file does not depend on the clock of
+the process that wrote it.
+
+Layout (little endian):
+    header: magic, timestamp:i64, record count:u64, offset table position:u64,
+        approximate memory of the decoded records:u64
+    records, in key order: key, field count:varint, then per field in name
+        order: name, value, remaining ttl + 1:varint (0: never expires)
+    offset table: u64 file offset of every record, in key order
+Strings are a varint byte length followed by UTF-8.
+
+SnapshotFile maps the file and decodes nothing up front: opening costs the
+same for any size, a key lookup is a binary search over the offset table,
+and each record is decoded the first time it is read. A database restored
+from an attached file keeps its writes in an Overlay on top of it.
+
+Usage:
+    dump(db.back.latest_at_or_before(ts), "backup.snap")
+    with SnapshotFile("backup.snap") as snap:
+        snap["A"].get("B")
+    attach(db, "backup.snap")   # then db.restore(now, snapshot timestamp)
+"""
+import bisect
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Iterator, Mapping
+
+from simulation import EXPIRY_OVERHEAD, FIELD_OVERHEAD, RECORD_OVERHEAD, Record, Simulation, Snapshot, SortedKeys
+
+SNAPSHOT_MAGIC = b"IMDBSNP1"
+
+_HEADER = struct.Struct("<8sqQQQ")
+
+# Decoded records are shared with whatever database restores from the file,
+# so they carry a version no database ever has and are copied before any
+# write.
+_SNAPSHOT_VERSION = -1
+
+
+def _varint(out: bytearray, n: int) -> None:
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _string(out: bytearray, s: str) -> None:
+    data = s.encode()
+    _varint(out, len(data))
+    out += data
+
+
+def encode_record(rec: Record, timestamp: int) -> tuple[bytes, int]:
+    """
+    The fields of rec, with expiries stored relative to timestamp, and the
+    nbytes of the record they decode to (0 if no field is live).
+    """
+    out = bytearray()
+    live = []
+    for field in rec.index:
+        expiry = rec.expiry(field)
+        if expiry is None:
+            live.append((field, 0))
+        elif expiry > timestamp:
+            live.append((field, expiry - timestamp + 1))
+    if not live:
+        return b"\x00", 0
+    _varint(out, len(live))
+    nbytes = RECORD_OVERHEAD
+    size = sys.getsizeof
+    for field, ttl in live:
+        value = rec.values[field]
+        _string(out, field)
+        _string(out, value)
+        _varint(out, ttl)
+        nbytes += size(field) + size(value) + FIELD_OVERHEAD + (EXPIRY_OVERHEAD if ttl else 0)
+    return bytes(out), nbytes
+
+
+def dump(snapshot: Snapshot, path: str) -> None:
+    """Write snapshot to path. Records with no live fields are left out."""
+    offsets = array("Q")
+    count = used_memory = 0
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, snapshot.timestamp, 0, 0, 0))
+        pos = _HEADER.size
+        data = snapshot.materialize()
+        for key in snapshot.keys:
+            body, nbytes = encode_record(data[key], snapshot.timestamp)
+            if not nbytes:
+                continue
+            used_memory += nbytes
+            entry = bytearray()
+            _string(entry, key)
+            entry += body
+            offsets.append(pos)
+            f.write(entry)
+            pos += len(entry)
+            count += 1
+        padding = -pos % offsets.itemsize  # keep the table aligned for cast()
+        f.write(b"\x00" * padding)
+        f.write(offsets.tobytes())
+        f.seek(0)
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, snapshot.timestamp, count, pos + padding, used_memory))
+
+
+class SnapshotFile(Mapping):
+    """
+    A read-only key -> Record mapping over a memory-mapped snapshot file.
+    Records are decoded on first access and cached; their expiries are
+    absolute, relative to the snapshot's timestamp like a live backup's.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._mmap)
+        magic, self.timestamp, self._count, table, self.used_memory = _HEADER.unpack_from(self._buf)
+        if magic != SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a snapshot file")
+        self._offsets = self._buf[table:table + 8 * self._count].cast("Q")
+        self._records: dict[str, Record] = {}
+
+    def close(self) -> None:
+        if hasattr(self, "_offsets"):
+            self._offsets.release()
+        self._buf.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> "SnapshotFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _varint(self, pos: int) -> tuple[int, int]:
+        buf = self._buf
+        n = shift = 0
+        while True:
+            byte = buf[pos]
+            pos += 1
+            n |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return n, pos
+            shift += 7
+
+    def _string(self, pos: int) -> tuple[str, int]:
+        n, pos = self._varint(pos)
+        return str(self._buf[pos:pos + n], "utf-8"), pos + n
+
+    def _key(self, i: int) -> str:
+        return self._string(self._offsets[i])[0]
+
+    def _find(self, key: str) -> int:
+        """Offset table index of key, or -1."""
+        i = bisect.bisect_left(range(self._count), key, key=self._key)
+        return i if i < self._count and self._key(i) == key else -1
+
+    def _decode(self, i: int) -> Record:
+        _, pos = self._string(self._offsets[i])
+        rec = Record(_SNAPSHOT_VERSION)
+        expire = {}
+        fields, pos = self._varint(pos)
+        for _ in range(fields):
+            field, pos = self._string(pos)
+            field = sys.intern(field)
+            rec.values[field], pos = self._string(pos)
+            rec.index.append(field)  # written in sorted order
+            ttl, pos = self._varint(pos)
+            if ttl:
+                expire[field] = self.timestamp + ttl - 1
+        rec.expire = expire or None
+        rec.measure()
+        return rec
+
+    def __getitem__(self, key: str) -> Record:
+        rec = self._records.get(key)
+        if rec is None:
+            i = self._find(key)
+            if i < 0:
+                raise KeyError(key)
+            rec = self._records[key] = self._decode(i)
+        return rec
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._records or (isinstance(key, str) and self._find(key) >= 0)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._key(i) for i in range(self._count))
+
+    @property
+    def decoded(self) -> int:
+        """How many records have been decoded so far."""
+        return len(self._records)
+
+
+def attach(db: Simulation, path: str) -> SnapshotFile:
+    """
+    Add the snapshot in path to db's backups, so db.restore() can use it.
+    Only the last key of every key index bucket is decoded now; the rest
+    of the index is read from the offset table as it is needed. Restoring
+    the snapshot decodes records as they are read, and writes go to an
+    overlay, so the file is never copied as a whole.
+    """
+    snap = SnapshotFile(path)
+    keys = SortedKeys.lazy(len(snap), snap._key)
+    db.back.add(Snapshot(snap.timestamp, snap, keys, used_memory=snap.used_memory))
+    return snap
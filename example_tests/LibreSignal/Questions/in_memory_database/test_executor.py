@@ -0,0 +1,101 @@
+"""
+Tests for the batched query executor of the in-memory database.
+
+Run from LibreSignal root directory:
+    pytest Questions/in_memory_database/test_executor.py -v
+"""
+import pytest
+from executor import QueryExecutor, execute_batch
+
+
+class TestExecutor:
+    def test_level1_example(self):
+        queries = [
+            ["SET", "A", "B", "E"],
+            ["SET", "A", "C", "F"],
+            ["GET", "A", "B"],
+            ["GET", "A", "D"],
+            ["DELETE", "A", "B"],
+            ["DELETE", "A", "D"],
+        ]
+        assert execute_batch(queries) == ["", "", "E", "", "true", "false"]
+
+    def test_level3_example(self):
+        queries = [
+            ["SET_AT_WITH_TTL", "A", "BC", "E", "1", "9"],
+            ["SET_AT_WITH_TTL", "A", "BC", "E", "5", "10"],
+            ["SET_AT", "A", "BD", "F", "5"],
+            ["SCAN_BY_PREFIX_AT", "A", "B", "14"],
+            ["SCAN_BY_PREFIX_AT", "A", "B", "15"],
+        ]
+        assert execute_batch(queries) == ["", "", "", "BC(E), BD(F)", "BD(F)"]
+
+    def test_level4_example(self):
+        queries = [
+            ["SET_AT_WITH_TTL", "A", "B", "C", "1", "10"],
+            ["BACKUP", "3"],
+            ["SET_AT", "A", "D", "E", "4"],
+            ["BACKUP", "5"],
+            ["DELETE_AT", "A", "B", "8"],
+            ["BACKUP", "9"],
+            ["RESTORE", "10", "7"],
+            ["BACKUP", "11"],
+            ["SCAN_AT", "A", "15"],
+            ["SCAN_AT", "A", "16"],
+        ]
+        assert execute_batch(queries) == ["", "1", "", "1", "true", "1", "", "1", "B(C), D(E)", "D(E)"]
+
+    def test_stream_is_lazy(self):
+        consumed = []
+
+        def queries():
+            for i in range(3):
+                consumed.append(i)
+                yield ["SET", "A", str(i), "v"]
+
+        results = QueryExecutor().stream(queries())
+        assert consumed == []
+        assert next(results) == ""
+        assert consumed == [0]
+
+    def test_shares_database(self):
+        executor = QueryExecutor()
+        executor.execute(["SET", "A", "B", "C"])
+        assert executor.db.get("A", "B") == "C"
+
+    def test_unknown_operation(self):
+        with pytest.raises(ValueError):
+            execute_batch([["FLUSHALL"]])
+
+    def test_query_must_be_a_non_empty_list(self):
+        executor = QueryExecutor()
+        for query in ({"op": "GET"}, [], "GET", [["GET"]]):
+            with pytest.raises(ValueError):
+                executor.execute(query)
+            with pytest.raises(ValueError):
+                list(executor.stream([query]))
+
+    def test_wrong_argument_count(self):
+        with pytest.raises(ValueError):
+            execute_batch([["GET_AT", "A", "B"]])
+
+    def test_batch_operations(self):
+        queries = [
+            ["MSET", "A", "B", "1", "C", "2"],
+            ["MSET_AT_WITH_TTL", "A", "D", "3", "E", "4", "5", "10"],
+            ["MGET_AT", "A", "B", "D", "X", "14"],
+            ["MDELETE_AT", "A", "B", "B", "E", "14"],
+            ["MGET_AT", "A", "C", "D", "15"],
+            ["MSET_AT", "A", "F", "6", "16"],
+            ["MDELETE", "A", "C", "F"],
+            ["MGET", "A", "C"],
+        ]
+        assert execute_batch(queries) == [
+            "", "", ["1", "3", ""], ["true", "false", "true"], ["2", ""], "", ["true", "true"], [""],
+        ]
+
+    def test_batch_argument_errors(self):
+        with pytest.raises(ValueError):
+            execute_batch([["MSET", "A", "B"]])
+        with pytest.raises(ValueError):
+            execute_batch([["MGET_AT"]])
@@ -10,8 +10,11 @@ Run from LibreSignal root directory:
     pytest Questions/in_memory_database/test_in_memory_database.py::TestLevel3 -v
     pytest Questions/in_memory_database/test_in_memory_database.py::TestLevel4 -v
 """
+import itertools
+import random
+
 import pytest
-from simulation import Simulation
+from simulation import BackupTimeline, Overlay, Simulation, SortedKeys
 
 
 class TestLevel1:
@@ -131,6 +134,23 @@ class TestLevel2:
         result = db.scan_by_prefix("A", "")
         assert result == "B(1), C(2)"
 
+    def test_scan_by_prefix_range_boundaries(self):
+        db = Simulation()
+        for field in ["b", "ab", "a", "abc", "aa", "ac"]:
+            db.set("A", field, field.upper())
+        assert db.scan_by_prefix("A", "ab") == "ab(AB), abc(ABC)"
+        assert db.scan_by_prefix("A", "a") == "a(A), aa(AA), ab(AB), abc(ABC), ac(AC)"
+        assert db.scan_by_prefix("A", "abcd") == ""
+
+    def test_scan_after_delete_and_overwrite(self):
+        db = Simulation()
+        db.set("A", "x", "1")
+        db.set("A", "y", "2")
+        db.set("A", "x", "3")
+        db.delete("A", "y")
+        db.set("A", "w", "4")
+        assert db.scan("A") == "w(4), x(3)"
+
     def test_example_from_spec(self):
         db = Simulation()
         db.set("A", "BC", "E")
@@ -174,6 +194,33 @@ class TestLevel3:
         db.set_at("A", "BD", "F", 5)
         assert db.get_at("A", "BD", 1000000) == "F"
 
+    def test_set_at_clears_previous_ttl(self):
+        db = Simulation()
+        db.set_at_with_ttl("A", "B", "C", 1, 5)  # expires at 6
+        db.set_at("A", "B", "D", 2)  # no longer expires
+        assert db.get_at("A", "B", 100) == "D"
+
+    def test_reaped_counter(self):
+        db = Simulation()
+        db.set_at_with_ttl("A", "B", "1", 1, 5)  # expires at 6
+        db.set_at_with_ttl("X", "Y", "2", 2, 5)  # expires at 7
+        db.set_at_with_ttl("X", "Z", "3", 3, 50)  # expires at 53
+        db.delete_at("A", "B", 4)
+        assert db.get_at("A", "B", 5) == ""
+        assert db.last_reaped == 0
+        assert db.scan_at("A", 10) == ""
+        assert db.last_reaped == 1  # only X.Y; A.B was already deleted
+        assert db.scan_at("X", 11) == "Z(3)"
+        assert db.last_reaped == 0
+        assert db.total_reaped == 1
+
+    def test_expiry_storage_allocated_lazily(self):
+        db = Simulation()
+        db.set_at("A", "B", "C", 1)
+        assert db.data["A"].expire is None
+        db.set_at_with_ttl("A", "D", "E", 2, 5)
+        assert db.data["A"].expire == {"D": 7}
+
     def test_delete_at_basic(self):
         db = Simulation()
         db.set_at("A", "B", "C", 1)
@@ -295,3 +342,717 @@ class TestLevel4:
         assert db.backup(11) == "1"
         assert db.scan_at("A", 15) == "B(C), D(E)"
         assert db.scan_at("A", 16) == "D(E)"
+
+    def test_backup_unaffected_by_later_writes(self):
+        db = Simulation()
+        db.set_at("A", "B", "1", 1)
+        db.set_at("X", "Y", "2", 2)
+        db.backup(3)
+        db.set_at("A", "B", "changed", 4)
+        db.delete_at("X", "Y", 5)
+        db.restore(6, 3)
+        assert db.scan_at("A", 7) == "B(1)"
+        assert db.scan_at("X", 8) == "Y(2)"
+
+    def test_restore_same_backup_twice(self):
+        db = Simulation()
+        db.set_at_with_ttl("A", "B", "C", 1, 10)  # expires at 11
+        db.backup(2)  # remaining TTL = 9
+        db.restore(5, 2)  # expires at 14
+        db.set_at("A", "D", "E", 6)
+        db.delete_at("A", "B", 7)
+        db.restore(20, 2)  # expires at 29
+        assert db.scan_at("A", 28) == "B(C)"
+        assert db.scan_at("A", 29) == ""
+
+
+class TestBackupTimeline:
+    """Backup ordering and retention"""
+
+    def test_restore_at_exact_backup_timestamp(self):
+        db = Simulation()
+        db.set_at("A", "B", "1", 1)
+        db.backup(2)
+        db.set_at("A", "B", "2", 3)
+        db.backup(4)
+        db.restore(5, 4)
+        assert db.get_at("A", "B", 6) == "2"
+
+    def test_keep_last(self):
+        db = Simulation(BackupTimeline(keep_last=3))
+        for ts in range(1, 11):
+            db.set_at("A", "B", str(ts), ts * 10)
+            db.backup(ts * 10 + 1)
+        assert db.back.timestamps == [81, 91, 101]
+        db.restore(200, 95)
+        assert db.get_at("A", "B", 201) == "9"
+
+    def test_max_age(self):
+        timeline = BackupTimeline(max_age=25)
+        db = Simulation(timeline)
+        for ts in range(10, 101, 10):
+            db.backup(ts)
+        assert timeline.timestamps == [80, 90, 100]
+
+    def test_thinning(self):
+        # Backups older than 100 are kept at most once per 50 time units.
+        timeline = BackupTimeline(thinning=[(100, 50)])
+        db = Simulation(timeline)
+        for ts in range(10, 301, 10):
+            db.backup(ts)
+        assert timeline.timestamps == [40, 90, 140, 190, 200] + list(range(210, 301, 10))
+        assert timeline.latest_at_or_before(120).timestamp == 90
+        assert timeline.latest_at_or_before(5) is None
+
+
+class TestHistory:
+    """Time-travel reads: GET_AS_OF, SCAN_AS_OF"""
+
+    def test_get_as_of_versions(self):
+        db = Simulation(history_limit=10)
+        db.set_at("A", "B", "1", 1)
+        db.set_at("A", "B", "2", 5)
+        db.delete_at("A", "B", 8)
+        db.set_at("A", "B", "3", 10)
+        assert db.get_as_of("A", "B", 0) == ""
+        assert db.get_as_of("A", "B", 1) == "1"
+        assert db.get_as_of("A", "B", 4) == "1"
+        assert db.get_as_of("A", "B", 5) == "2"
+        assert db.get_as_of("A", "B", 8) == ""
+        assert db.get_as_of("A", "B", 12) == "3"
+
+    def test_get_as_of_respects_ttl(self):
+        db = Simulation(history_limit=10)
+        db.set_at_with_ttl("A", "B", "C", 1, 5)  # expires at 6
+        db.get_at("A", "B", 20)  # reaped from the live database
+        assert db.get_as_of("A", "B", 5) == "C"
+        assert db.get_as_of("A", "B", 6) == ""
+
+    def test_scan_as_of(self):
+        db = Simulation(history_limit=10)
+        db.set_at("A", "B", "1", 1)
+        db.set_at_with_ttl("A", "C", "2", 2, 5)  # expires at 7
+        db.set_at("A", "D", "3", 8)
+        assert db.scan_as_of("A", 3) == "B(1), C(2)"
+        assert db.scan_as_of("A", 9) == "B(1), D(3)"
+        assert db.scan_as_of("X", 9) == ""
+
+    def test_reads_across_restore(self):
+        db = Simulation(history_limit=10)
+        db.set_at_with_ttl("A", "B", "C", 1, 10)  # expires at 11
+        db.backup(3)  # remaining ttl 8
+        db.set_at("A", "D", "E", 4)
+        db.delete_at("A", "B", 5)
+        db.restore(10, 3)  # B back until 18, D gone
+        db.set_at("A", "F", "G", 12)
+        assert db.scan_as_of("A", 4) == "B(C), D(E)"
+        assert db.scan_as_of("A", 6) == "D(E)"
+        assert db.scan_as_of("A", 10) == "B(C)"
+        assert db.scan_as_of("A", 17) == "B(C), F(G)"
+        assert db.scan_as_of("A", 18) == "F(G)"
+        assert db.scan_at("A", 18) == "F(G)"
+
+    def test_history_limit(self):
+        db = Simulation(history_limit=2)
+        for ts in range(1, 6):
+            db.set_at("A", "B", str(ts), ts)
+        assert db.get_as_of("A", "B", 5) == "5"
+        assert db.get_as_of("A", "B", 4) == "4"
+        assert db.get_as_of("A", "B", 3) == ""  # no longer retained
+
+    def test_history_limit_after_restore(self):
+        db = Simulation(history_limit=2)
+        db.set_at("A", "B", "old", 1)
+        db.backup(2)
+        db.restore(10, 2)
+        for ts in (20, 30, 40):
+            db.set_at("A", "B", f"v{ts}", ts)
+        assert db.get_as_of("A", "B", 25) == ""  # v20 was dropped, not "old"
+        assert db.get_as_of("A", "B", 30) == "v30"
+        assert db.scan_as_of("A", 25) == ""
+
+    def test_restores_do_not_outlive_retention(self):
+        db = Simulation(BackupTimeline(keep_last=1), history_limit=2)
+        for ts in range(10, 500, 10):
+            db.set_at("A", "B", str(ts), ts)
+            db.backup(ts + 1)
+            db.restore(ts + 2, ts + 1)
+        assert len(db.restores) <= 3
+        retained = {id(snapshot) for snapshot in db.back.snapshots}
+        assert all(id(snapshot) in retained for snapshot, _ in db.restores if snapshot is not None)
+        assert db.get_as_of("A", "B", 495) == "490"
+        assert db.get_as_of("A", "B", 15) == ""  # before the forgotten restores
+
+    def test_histories_before_a_forgotten_restore_are_dropped(self):
+        db = Simulation(BackupTimeline(keep_last=1), history_limit=1)
+        db.set_at("A", "B", "1", 1)
+        db.delete_at("A", "B", 2)
+        db.set_at("C", "D", "1", 3)
+        db.backup(4)
+        db.restore(5, 4)
+        db.backup(6)  # drops the restored backup
+        assert db.history == {}
+        db.set_at("C", "D", "2", 7)
+        assert list(db.history) == ["C"]
+        assert db.get_as_of("C", "D", 7) == "2"
+        assert db.get_as_of("C", "D", 6) == ""
+
+    def test_history_disabled_by_default(self):
+        db = Simulation()
+        db.set_at("A", "B", "1", 1)
+        assert db.history == {}
+        assert db.get_as_of("A", "B", 1) == ""
+
+
+class TestScanCache:
+    """Rendered scan cache with generation-based invalidation"""
+
+    def test_repeated_scans_hit(self):
+        db = Simulation(scan_cache_size=10)
+        db.set("A", "B", "1")
+        db.set("A", "C", "2")
+        assert db.scan("A") == "B(1), C(2)"
+        assert db.scan("A") == "B(1), C(2)"
+        assert db.scan_by_prefix("A", "C") == "C(2)"
+        assert db.scan_by_prefix("A", "C") == "C(2)"
+        assert (db.scan_cache.hits, db.scan_cache.misses) == (2, 2)
+
+    def test_writes_invalidate(self):
+        db = Simulation(scan_cache_size=10)
+        db.set("A", "B", "1")
+        assert db.scan("A") == "B(1)"
+        db.set("A", "B", "2")
+        assert db.scan("A") == "B(2)"
+        db.delete("A", "B")
+        assert db.scan("A") == ""
+        assert db.scan_cache.hits == 0
+
+    def test_expiry_invalidates(self):
+        db = Simulation(scan_cache_size=10)
+        db.set_at("A", "B", "1", 1)
+        db.set_at_with_ttl("A", "C", "2", 2, 5)  # expires at 7
+        assert db.scan_at("A", 3) == "B(1), C(2)"
+        assert db.scan_at("A", 4) == "B(1), C(2)"
+        assert db.scan_at("A", 7) == "B(1)"
+        assert (db.scan_cache.hits, db.scan_cache.misses) == (1, 2)
+
+    def test_restore_invalidates(self):
+        db = Simulation(scan_cache_size=10)
+        db.set_at("A", "B", "1", 1)
+        db.backup(2)
+        db.set_at("A", "B", "2", 3)
+        assert db.scan_at("A", 4) == "B(2)"
+        db.restore(5, 2)
+        assert db.scan_at("A", 6) == "B(1)"
+        db.restore(7, 2)
+        assert db.scan_at("A", 8) == "B(1)"  # same contents: still cached
+        assert db.scan_cache.hits == 1
+
+    def test_lru_eviction(self):
+        db = Simulation(scan_cache_size=2)
+        for key in "XYZ":
+            db.set(key, "f", key)
+        db.scan("X")
+        db.scan("Y")
+        db.scan("X")
+        db.scan("Z")  # evicts Y, the least recently used
+        assert list(db.scan_cache.entries) == [("X", ""), ("Z", "")]
+
+
+class TestKeyScan:
+    """Key namespace: SCAN_KEYS_BY_PREFIX with cursors"""
+
+    def scan_all(self, db, prefix, count):
+        cursor, keys, pages = "0", [], 0
+        while True:
+            cursor, page = db.scan_keys_by_prefix(prefix, cursor, count)
+            keys += page
+            pages += 1
+            if cursor == "0":
+                return keys, pages
+
+    def test_pages(self):
+        db = Simulation()
+        for key in ["user:3", "user:1", "order:1", "user:2", "userx", "admin"]:
+            db.set(key, "f", "v")
+        assert db.scan_keys_by_prefix("user:", "0", 2) == ("@user:2", ["user:1", "user:2"])
+        assert db.scan_keys_by_prefix("user:", "@user:2", 2) == ("0", ["user:3"])
+        assert self.scan_all(db, "user", 10) == (["user:1", "user:2", "user:3", "userx"], 1)
+        assert self.scan_all(db, "", 1) == (sorted(db.data), 6)
+        assert db.scan_keys_by_prefix("zzz") == ("0", [])
+
+    def test_exact_last_page(self):
+        db = Simulation()
+        for i in range(4):
+            db.set(f"k{i}", "f", "v")
+        db.set("z", "f", "v")
+        assert db.scan_keys_by_prefix("k", "0", 4) == ("0", ["k0", "k1", "k2", "k3"])
+
+    def test_changes_during_iteration(self):
+        db = Simulation()
+        for i in range(10):
+            db.set(f"k{i}", "f", "v")
+        cursor, page = db.scan_keys_by_prefix("k", "0", 3)
+        db.delete("k0", "f")  # already returned
+        db.delete("k5", "f")  # removed before it was reached
+        db.set("k00", "f", "v")  # sorts before the cursor: not returned
+        cursor, rest = db.scan_keys_by_prefix("k", cursor, 100)
+        assert page + rest == ["k0", "k1", "k2", "k3", "k4", "k6", "k7", "k8", "k9"]
+
+    def test_empty_records_are_not_keys(self):
+        db = Simulation()
+        db.set_at_with_ttl("a", "f", "v", 1, 5)
+        db.set_at("b", "f", "v", 2)
+        assert db.scan_keys_by_prefix_at("", "0", 10, 3) == ("0", ["a", "b"])
+        assert db.scan_keys_by_prefix_at("", "0", 10, 6) == ("0", ["b"])
+
+    def test_page_after_lazy_restore_touches_only_its_keys(self):
+        db = Simulation()
+        for i in range(1000):
+            db.set_at_with_ttl(f"k{i:04}", "f", "v", 1, 10 if i % 2 else 100)
+        db.backup(2)  # remaining ttls 9 and 99
+        db.restore(10, 2)
+        writes = []
+        original = db._writable
+        db._writable = lambda key, create=False: writes.append(key) or original(key, create)
+        # k0001, k0003, ... expire at 19; the others at 109
+        assert db.scan_keys_by_prefix_at("k", "0", 3, 19) == ("@k0004", ["k0000", "k0002", "k0004"])
+        assert writes == ["k0001", "k0003", "k0005"]  # the expired records passed, nothing else
+        assert "k0001" not in db.data and "k0007" in db.data
+        cursor, page = db.scan_keys_by_prefix_at("k", "@k0004", 1000, 19)
+        assert cursor == "0" and len(page) == 497
+
+    def test_page_skips_expiry_backlog(self):
+        db = Simulation(active_expire_effort=2)
+        for i in range(100):
+            db.set_at_with_ttl(f"k{i:03}", "f", "v", 1, 5)
+        db.set_at("x", "f", "v", 2)
+        assert db.scan_keys_by_prefix_at("", "0", 10, 10) == ("0", ["x"])
+        assert db.data.keys() == {"x"}  # the records passed were removed
+
+    def test_restore_brings_keys_back(self):
+        db = Simulation()
+        db.set_at("a", "f", "v", 1)
+        db.backup(2)
+        db.delete_at("a", "f", 3)
+        db.set_at("b", "f", "v", 4)
+        assert db.scan_keys_by_prefix("") == ("0", ["b"])
+        db.restore(5, 2)
+        assert db.scan_keys_by_prefix("") == ("0", ["a"])
+
+
+class TestSortedKeys:
+    def test_matches_a_sorted_list(self, monkeypatch):
+        monkeypatch.setattr(SortedKeys, "LOAD", 4)  # many buckets and splits
+        rng = random.Random(3)
+        keys, expected = SortedKeys(), set()
+        for _ in range(3000):
+            key = f"k{rng.randrange(500)}"
+            if key in expected:
+                keys.remove(key)
+                expected.discard(key)
+            else:
+                keys.add(key)
+                expected.add(key)
+        ordered = sorted(expected)
+        assert list(keys) == ordered
+        assert len(keys) == len(ordered)
+        assert [keys[i] for i in range(0, len(ordered), 7)] == ordered[::7]
+        assert list(keys.irange("k3")) == [k for k in ordered if k >= "k3"]
+        assert list(keys.irange("k3", exclusive=True)) == [k for k in ordered if k > "k3"]
+        assert list(keys.irange("z")) == []
+
+    def test_copies_share_buckets_until_written(self, monkeypatch):
+        monkeypatch.setattr(SortedKeys, "LOAD", 2)
+        keys = SortedKeys([f"k{i}" for i in range(10)])
+        copy = keys.copy()
+        copy.add("k55")
+        keys.remove("k0")
+        assert list(keys) == [f"k{i}" for i in range(1, 10)]
+        assert list(copy) == sorted([f"k{i}" for i in range(10)] + ["k55"])
+
+    def test_lazy_buckets_are_read_on_demand(self, monkeypatch):
+        monkeypatch.setattr(SortedKeys, "LOAD", 10)
+        source = [f"k{i:03}" for i in range(100)]
+        read = []
+
+        def key_at(i):
+            read.append(i)
+            return source[i]
+
+        keys = SortedKeys.lazy(len(source), key_at)
+        assert len(read) == 10  # the last key of every bucket
+        read.clear()
+        keys.add("k0505")
+        assert list(itertools.islice(keys.irange("k050"), 3)) == ["k050", "k0505", "k051"]
+        assert len(read) == 10  # only the bucket written to
+        assert len(keys) == 101
+
+
+class TestMemory:
+    def test_used_memory_tracks_writes_and_deletes(self):
+        db = Simulation()
+        db.set("A", "B", "C")
+        one_field = db.used_memory
+        db.set_at_with_ttl("A", "D", "E", 1, 10)
+        assert db.used_memory > one_field
+        db.delete("A", "D")
+        assert db.used_memory == one_field
+        db.delete("A", "B")
+        assert db.used_memory == 0
+
+    def test_used_memory_matches_records_after_restore(self):
+        db = Simulation()
+        db.set_at("A", "B", "C", 1)
+        db.backup(2)
+        db.set_at("X", "Y", "Z", 3)
+        db.restore(4, 2)
+        assert db.used_memory == sum(rec.measure() for rec in db.data.values())
+
+    def test_allkeys_lru_evicts_least_recently_used(self):
+        db = Simulation()
+        db.set("k0", "f", "v")
+        record = db.used_memory
+        db = Simulation(maxmemory=3 * record)
+        for i in range(3):
+            db.set(f"k{i}", "f", "v")
+        db.get("k0", "f")
+        db.set("k3", "f", "v")
+        assert db.scan_keys_by_prefix("") == ("0", ["k0", "k2", "k3"])
+        assert db.evicted_keys == 1
+        assert db.used_memory <= db.maxmemory
+
+    def test_write_larger_than_maxmemory_is_rejected(self):
+        db = Simulation(maxmemory=2_000)
+        db.set("A", "B", "small")
+        with pytest.raises(ValueError, match="maxmemory"):
+            db.set("X", "Y", "v" * 5_000)
+        with pytest.raises(ValueError, match="maxmemory"):
+            db.mset("A", {"C": "v" * 5_000})
+        assert db.scan("A") == "B(small)" and "X" not in db.data
+        assert db.evicted_keys == 0
+
+    def test_lru_after_restore_evicts_restored_keys_not_used_since(self):
+        db = Simulation()
+        db.set("k0", "f", "v")
+        record = db.used_memory
+        db = Simulation(maxmemory=3 * record)
+        for i in range(3):
+            db.set_at(f"k{i}", "f", "v", 1)
+        db.backup(2)
+        db.restore(3, 2)
+        assert not db._lru  # not rebuilt from every key
+        db.get_at("k0", "f", 4)
+        db.set_at("k3", "f", "v", 5)
+        db.set_at("k4", "f", "v", 6)
+        assert db.scan_keys_by_prefix("") == ("0", ["k0", "k3", "k4"])
+        db.set_at("k5", "f", "v", 7)
+        assert db.scan_keys_by_prefix("") == ("0", ["k3", "k4", "k5"])
+
+    def test_volatile_ttl_evicts_soonest_expiring_field(self):
+        db = Simulation()
+        db.set_at_with_ttl("A", "late", "v", 1, 50)
+        db = Simulation(maxmemory=db.used_memory + 1, maxmemory_policy="volatile-ttl")
+        db.set_at_with_ttl("A", "late", "v", 1, 50)
+        db.set_at_with_ttl("A", "soon", "v", 1, 5)
+        assert db.scan_at("A", 2) == "late(v)"
+        assert db.stats()["evicted_fields"] == 1
+
+    def test_volatile_ttl_keeps_persistent_fields(self):
+        db = Simulation(maxmemory=1, maxmemory_policy="volatile-ttl")
+        db.set("A", "B", "C")
+        assert db.get("A", "B") == "C"
+        assert db.used_memory > db.maxmemory
+
+    def test_allkeys_random_stays_under_limit(self):
+        db = Simulation(maxmemory=5_000, maxmemory_policy="allkeys-random")
+        for i in range(100):
+            db.set(f"k{i}", "f", "v")
+        assert db.used_memory <= 5_000
+        assert db.evicted_keys + len(db.keys) == 100
+
+    def test_invalid_policy(self):
+        with pytest.raises(ValueError):
+            Simulation(maxmemory_policy="noeviction")
+
+
+class TestActiveExpiry:
+    def test_slices_are_bounded(self):
+        db = Simulation(active_expire_effort=4)
+        for i in range(100):
+            db.set_at_with_ttl(f"k{i}", "f", "v", 1, 5)
+        db.get_at("other", "f", 10)
+        assert db.last_reaped == 4
+        assert len(db.data) == 96
+        assert db.expire_slice == 8  # behind: the next slice is larger
+
+    def test_backlog_drains_and_slice_resets(self):
+        db = Simulation(active_expire_effort=4)
+        for i in range(100):
+            db.set_at_with_ttl(f"k{i}", "f", "v", 1, 5)
+        calls = 0
+        while db.data:
+            db.get_at("other", "f", 10 + calls)
+            calls += 1
+        assert calls < 100 // 4
+        assert db.expire_slice == 4
+        assert db.total_reaped == 100
+
+    def test_reads_never_see_expired_fields(self):
+        db = Simulation(active_expire_effort=1)
+        for i in range(10):
+            db.set_at_with_ttl(f"k{i}", "f", "v", 1, 5)
+        db.set_at("k9", "g", "w", 2)
+        assert db.get_at("k7", "f", 6) == ""
+        assert db.scan_at("k9", 7) == "g(w)"
+        assert db.delete_at("k8", "f", 8) == "false"
+        assert db.scan_by_prefix_at("k5", "f", 9) == ""
+
+    def test_backup_counts_after_full_reap(self):
+        db = Simulation(active_expire_effort=1)
+        for i in range(10):
+            db.set_at_with_ttl(f"k{i}", "f", "v", 1, 5)
+        db.set_at("x", "f", "v", 2)
+        assert db.backup(6) == "1"
+        assert db.scan_keys_by_prefix_at("", "0", 10, 7) == ("0", ["x"])
+
+    def test_expire_cycle_uses_logical_clock(self):
+        db = Simulation(active_expire_effort=2)
+        db.set_at_with_ttl("a", "f", "v", 1, 5)
+        db.set_at_with_ttl("b", "f", "v", 2, 5)
+        db.set_at("c", "f", "v", 7)
+        assert db.clock == 7
+        assert db.expire_cycle() == 2
+        assert list(db.keys) == ["c"]
+
+    def test_passive_check_reads_only_requested_fields(self):
+        db = Simulation(active_expire_effort=2)
+        for i in range(100):
+            db.set_at_with_ttl("A", f"f{i:02}", "v", 1, 5)
+        db.set_at_with_ttl("A", "p1", "v", 1, 5)
+        db.set_at("A", "keep", "v", 2)
+        assert db.get_at("A", "f50", 10) == ""
+        assert "f50" not in db.data["A"]
+        assert len(db.data["A"]) == 102 - 3  # the slice's two, plus f50
+        assert db.scan_by_prefix_at("A", "p", 11) == ""
+        assert db.scan_at("A", 12) == "keep(v)"
+
+    def test_no_passive_check_without_backlog(self, monkeypatch):
+        db = Simulation(active_expire_effort=4)
+        for i in range(1000):
+            db.set_at_with_ttl("A", f"f{i}", "v", 1, 100)
+        monkeypatch.setattr(db, "_expire_fields", None)  # would fail if called
+        assert db.get_at("A", "f1", 50) == "v"
+        assert db.mget_at("A", ["f2", "f3"], 51) == ["v", "v"]
+
+
+class TestDeltaBackups:
+    def test_delta_holds_only_changes(self):
+        db = Simulation(delta_chain=4)
+        for i in range(100):
+            db.set_at(f"k{i}", "f", "v", 1)
+        db.backup(2)
+        db.set_at("k1", "f", "new", 3)
+        db.delete_at("k2", "f", 4)
+        db.backup(5)
+        delta = db.back.latest_at_or_before(5)
+        assert delta.parent is db.back.latest_at_or_before(2)
+        assert delta.data.keys() == {"k1", "k2"}
+        assert delta.data["k2"] is None
+        db.restore(6, 5)
+        assert db.get_at("k1", "f", 6) == "new"
+        assert db.get_at("k2", "f", 6) == ""
+        assert len(db.keys) == 99
+        db.restore(7, 2)
+        assert db.get_at("k1", "f", 7) == "v"
+        assert len(db.keys) == 100
+
+    def test_chain_is_folded_into_a_new_base(self):
+        db = Simulation(delta_chain=2)
+        for ts in range(1, 8):
+            db.set_at("A", f"f{ts}", "v", ts * 10)
+            db.backup(ts * 10 + 1)
+        assert [s.depth for s in db.back.snapshots] == [0, 1, 2, 0, 1, 2, 0]
+
+    def test_matches_full_backups(self):
+        rng = random.Random(7)
+        full, delta = Simulation(), Simulation(delta_chain=3)
+        for ts in range(1, 400):
+            key, field = f"k{rng.randrange(20)}", f"f{rng.randrange(5)}"
+            r, ttl, target = rng.random(), rng.randrange(1, 50), rng.randrange(ts)
+            for db in (full, delta):
+                if r < 0.4:
+                    db.set_at(key, field, str(ts), ts)
+                elif r < 0.55:
+                    db.set_at_with_ttl(key, field, str(ts), ts, ttl)
+                elif r < 0.7:
+                    db.delete_at(key, field, ts)
+                elif r < 0.85:
+                    db.backup(ts)
+                elif r < 0.9:
+                    db.restore(ts, target)
+            assert delta.scan_at(key, ts + 1) == full.scan_at(key, ts + 1)
+        assert list(delta.keys) == list(full.keys)
+
+    def test_compaction_rebases_oldest_retained_backup(self):
+        db = Simulation(BackupTimeline(keep_last=2), delta_chain=10)
+        for ts in range(1, 6):
+            db.set_at("A", f"f{ts}", "v", ts * 10)
+            db.backup(ts * 10 + 1)
+        oldest = db.back.snapshots[0]
+        assert oldest.parent is not None
+        assert db.compact_backups()
+        assert oldest.parent is None
+        assert not db.compact_backups()
+        db.restore(100, 51)
+        assert db.scan_at("A", 100) == "f1(v), f2(v), f3(v), f4(v), f5(v)"
+
+    def test_compaction_updates_the_base_key_index(self):
+        db = Simulation(BackupTimeline(keep_last=1), delta_chain=10)
+        for key in ("a", "b", "c"):
+            db.set_at(key, "f", "v", 1)
+        db.backup(2)
+        db.delete_at("b", "f", 3)
+        db.set_at("d", "f", "v", 3)
+        db.backup(4)
+        oldest = db.back.snapshots[0]
+        db.compact_backups()
+        assert list(oldest.keys) == ["a", "c", "d"]
+        assert sorted(oldest.data) == ["a", "c", "d"]
+
+    def test_new_base_is_not_a_copy_of_the_map(self):
+        db = Simulation(delta_chain=1)
+        for i in range(100):
+            db.set_at(f"k{i}", "f", "v", 1)
+        db.backup(2)  # base
+        base = db.back.snapshots[0].data
+        assert type(db.data) is Overlay and db.data.base is base
+        db.set_at("k0", "f", "w", 3)
+        db.backup(4)  # delta
+        db.set_at("k1", "f", "w", 5)
+        db.backup(6)  # base again: the overlay's two changes, not 100 records
+        data = db.back.snapshots[-1].data
+        assert type(data) is Overlay and data.base is base and len(data.changes) == 2
+        db.set_at("k2", "f", "w", 7)
+        assert "k2" not in data.changes
+        db.restore(8, 6)
+        assert db.get_at("k1", "f", 8) == "w" and db.get_at("k2", "f", 8) == "v"
+
+
+class TestLazyRestore:
+    @staticmethod
+    def backed_up(records):
+        db = Simulation()
+        for i in range(records):
+            db.set_at_with_ttl(f"k{i}", "f", "v", 1, 10)
+        db.backup(4)  # 7 ttl left
+        return db
+
+    def test_restore_rebases_only_what_is_touched(self):
+        db = self.backed_up(100)
+        db.restore(20, 4)
+        assert db.expiry_heap == []
+        assert db.get_at("k5", "f", 26) == "v"
+        assert db.data["k5"].expiry("f") == 27
+        assert db.data["k6"].expiry("f") == 11  # untouched: still the backup's
+        assert db.get_at("k6", "f", 27) == ""
+
+    def test_backup_after_restore_sees_rebased_ttls(self):
+        db = self.backed_up(10)
+        db.restore(20, 4)
+        db.set_at("k0", "g", "w", 21)
+        assert db.backup(22) == "10"
+        db.restore(30, 22)  # 5 ttl left at 22
+        assert db.scan_at("k1", 34) == "f(v)"
+        assert db.scan_at("k1", 35) == ""
+        assert db.scan_at("k0", 35) == "g(w)"
+        assert db.backup(36) == "1"
+
+    def test_restored_backup_is_not_modified(self):
+        db = self.backed_up(3)
+        db.restore(20, 4)
+        db.delete_at("k0", "f", 21)
+        db.set_at("k1", "f", "new", 22)
+        db.restore(23, 4)
+        assert db.scan_keys_by_prefix_at("", "0", 10, 23) == ("0", ["k0", "k1", "k2"])
+        assert db.get_at("k1", "f", 24) == "v"
+
+    def test_first_write_copies_only_its_record(self):
+        db = self.backed_up(1000)
+        backup = db.back.latest_at_or_before(4).data
+        db.restore(20, 4)
+        db.set_at("k5", "g", "w", 21)
+        db.delete_at("k6", "f", 22)
+        db.set_at("new", "f", "v", 23)
+        assert isinstance(db.data, Overlay)
+        assert db.data.changes.keys() == {"k5", "k6", "new"}
+        assert len(db.data) == len(db.keys) == 1000
+        assert "k6" in backup and "new" not in backup
+        assert db.backup(24) == "1000"
+        db.set_at("k7", "g", "w", 25)  # copies the overlay's changes only
+        db.restore(26, 24)
+        assert db.data.base is backup
+        assert db.scan_at("k7", 26) == "f(v)"
+
+    def test_overlay_is_folded_once_it_outgrows_its_base(self):
+        db = self.backed_up(10)
+        db.restore(20, 4)
+        for i in range(12):
+            db.set_at(f"x{i}", "f", "v", 21)
+        assert type(db.data) is dict
+        assert len(db.data) == len(db.keys) == 22
+        assert db.get_at("k3", "f", 21) == "v"
+
+    def test_used_memory_is_carried_by_the_backup(self):
+        db = self.backed_up(10)
+        used = db.used_memory
+        db.set_at("more", "f", "v", 5)
+        db.restore(6, 4)
+        assert db.used_memory == used
+
+
+class TestBatchOperations:
+    def test_mset_and_mget(self):
+        db = Simulation()
+        assert db.mset("A", {"B": "1", "C": "2"}) == ""
+        assert db.mget("A", ["C", "B", "X"]) == ["2", "1", ""]
+        assert db.mget("missing", ["B"]) == [""]
+        assert db.scan("A") == "B(1), C(2)"
+
+    def test_empty_mset_creates_nothing(self):
+        db = Simulation()
+        db.mset("A", {})
+        assert list(db.keys) == []
+
+    def test_mdelete_reports_each_field(self):
+        db = Simulation()
+        db.mset("A", {"B": "1", "C": "2", "D": "3"})
+        assert db.mdelete("A", ["B", "X", "B", "C"]) == ["true", "false", "false", "true"]
+        assert db.scan("A") == "D(3)"
+        assert db.mdelete("A", ["D"]) == ["true"]
+        assert list(db.keys) == []
+        assert db.used_memory == 0
+
+    def test_ttl_variants(self):
+        db = Simulation()
+        db.mset_at_with_ttl("A", {"B": "1", "C": "2"}, 1, 5)
+        db.mset_at("A", {"D": "3"}, 2)
+        assert db.mget_at("A", ["B", "D"], 5) == ["1", "3"]
+        assert db.mget_at("A", ["B", "C", "D"], 6) == ["", "", "3"]
+        assert db.mdelete_at("A", ["C", "D"], 7) == ["false", "true"]
+        assert db.backup(8) == "0"
+
+    def test_matches_single_field_operations(self):
+        single, batch = Simulation(history_limit=4), Simulation(history_limit=4)
+        for field, value in (("B", "1"), ("C", "2")):
+            single.set_at_with_ttl("A", field, value, 1, 10)
+        batch.mset_at_with_ttl("A", {"B": "1", "C": "2"}, 1, 10)
+        single.delete_at("A", "B", 3)
+        batch.mdelete_at("A", ["B"], 3)
+        for db in (single, batch):
+            db.backup(4)
+            db.restore(8, 4)
+        assert batch.scan_at("A", 14) == single.scan_at("A", 14) == "C(2)"
+        assert batch.scan_at("A", 15) == single.scan_at("A", 15) == ""
+        assert batch.get_as_of("A", "B", 2) == single.get_as_of("A", "B", 2) == "1"
+        assert batch.used_memory == single.used_memory
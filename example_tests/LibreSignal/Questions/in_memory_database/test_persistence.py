@@ -0,0 +1,119 @@
+"""
+Tests for the write-ahead log and checkpoints of the in-memory database.
+
+Run from LibreSignal root directory:
+    pytest Questions/in_memory_database/test_persistence.py -v
+"""
+import os
+
+import pytest
+from persistence import WriteAheadLog, recover
+from simulation import Simulation
+
+
+def run_workload(db):
+    db.set_at_with_ttl("A", "B", "C", 1, 10)  # expires at 11
+    db.backup(3)
+    db.set_at("A", "D", "E", 4)
+    db.set_at("X", "Y", "Z", 5)
+    db.backup(5)
+    db.delete_at("A", "B", 8)
+    db.delete_at("A", "missing", 9)
+
+
+class TestWriteAheadLog:
+    def test_recover_replays_log(self, tmp_path):
+        db = Simulation(wal=WriteAheadLog(str(tmp_path)))
+        run_workload(db)
+        db.wal.close()
+
+        db = recover(str(tmp_path))
+        assert db.scan_at("A", 9) == "D(E)"
+        assert db.scan_at("X", 9) == "Y(Z)"
+        db.restore(10, 7)  # backups survive too; B has 6 ttl left
+        assert db.scan_at("A", 15) == "B(C), D(E)"
+        assert db.scan_at("A", 16) == "D(E)"
+
+    def test_recover_from_checkpoint_and_tail(self, tmp_path):
+        db = Simulation(wal=WriteAheadLog(str(tmp_path), checkpoint_every=3))
+        run_workload(db)
+        db.wal.close()
+        assert os.path.exists(tmp_path / "checkpoint.bin")
+        assert db.wal.generation == 2
+
+        recovered = recover(str(tmp_path))
+        assert recovered.scan_at("A", 9) == db.scan_at("A", 9)
+        recovered.restore(10, 4)
+        assert recovered.scan_at("A", 17) == "B(C)"
+        assert recovered.scan_at("A", 18) == ""
+
+    def test_recovered_database_keeps_logging(self, tmp_path):
+        db = Simulation(wal=WriteAheadLog(str(tmp_path)))
+        db.set("A", "B", "1")
+        db.wal.close()
+        db = recover(str(tmp_path))
+        db.set("A", "C", "2")
+        db.delete("A", "B")
+        db.wal.close()
+        assert recover(str(tmp_path)).scan("A") == "C(2)"
+
+    def test_torn_tail_is_discarded(self, tmp_path):
+        db = Simulation(wal=WriteAheadLog(str(tmp_path), fsync="always"))
+        db.set("A", "B", "1")
+        db.set("A", "C", "2")
+        db.wal.close()
+        log = tmp_path / "wal-0.log"
+        log.write_bytes(log.read_bytes()[:-3])
+
+        db = recover(str(tmp_path))
+        assert db.scan("A") == "B(1)"
+        db.set("A", "D", "3")
+        db.wal.close()
+        assert recover(str(tmp_path)).scan("A") == "B(1), D(3)"
+
+    def test_group_commit_buffers_until_batch_full(self, tmp_path):
+        wal = WriteAheadLog(str(tmp_path), batch_size=3)
+        db = Simulation(wal=wal)
+        db.set("A", "B", "1")
+        db.set("A", "C", "2")
+        assert os.path.getsize(tmp_path / "wal-0.log") == 0
+        db.set("A", "D", "3")
+        assert os.path.getsize(tmp_path / "wal-0.log") > 0
+
+    def test_invalid_fsync_policy(self, tmp_path):
+        with pytest.raises(ValueError):
+            WriteAheadLog(str(tmp_path), fsync="sometimes")
+
+    def test_batch_operations_are_logged(self, tmp_path):
+        db = Simulation(wal=WriteAheadLog(str(tmp_path)))
+        fields = {"B": "1", "C": "2"}
+        db.mset_at_with_ttl("A", fields, 1, 10)
+        fields["D"] = "not logged"
+        db.mdelete_at("A", ["B"], 2)
+        db.wal.close()
+        db = recover(str(tmp_path))
+        assert db.scan_at("A", 10) == "C(2)"
+        assert db.scan_at("A", 11) == ""
+
+    @pytest.mark.parametrize("policy", ["allkeys-lru", "allkeys-random", "volatile-ttl"])
+    def test_evictions_are_replayed(self, tmp_path, policy):
+        options = {"maxmemory": 3000, "maxmemory_policy": policy}
+        db = Simulation(wal=WriteAheadLog(str(tmp_path)), **options)
+        for ts in range(1, 21):
+            db.set_at_with_ttl(f"key{ts}", "field", "x" * 100, ts, 1000 - ts)
+            db.get_at("key1", "field", ts)  # reads reorder the LRU
+        db.wal.close()
+        assert db.evicted_keys + db.evicted_fields > 0
+
+        recovered = recover(str(tmp_path), **options)
+        assert sorted(recovered.data) == sorted(db.data)
+        assert recovered.maxmemory == 3000
+
+    def test_simulation_options_are_forwarded(self, tmp_path):
+        db = Simulation(wal=WriteAheadLog(str(tmp_path)), history_limit=5)
+        db.set_at("A", "B", "1", 1)
+        db.set_at("A", "B", "2", 2)
+        db.wal.close()
+        db = recover(str(tmp_path), history_limit=5, fsync="never")
+        assert db.get_as_of("A", "B", 1) == "1"
+        assert db.wal.fsync == "never"
@@ -0,0 +1,150 @@
+"""
+Tests for the asyncio server and client of the in-memory database.
+
+Run from LibreSignal root directory:
+    pytest Questions/in_memory_database/test_server.py -v
+"""
+import asyncio
+import json
+
+import pytest
+import server as server_module
+from server import DatabaseClient, DatabaseError, DatabaseServer
+from simulation import BackupTimeline, Simulation
+
+
+def with_server(test):
+    """Run an async test body against a fresh server on a free local port."""
+    async def run():
+        server = DatabaseServer()
+        await server.start()
+        try:
+            async with await DatabaseClient.connect(server.host, server.port) as client:
+                await test(server, client)
+        finally:
+            await server.close()
+    asyncio.run(run())
+
+
+class TestServer:
+    def test_execute(self):
+        async def body(server, client):
+            assert await client.execute(["SET", "A", "B", "E"]) == ""
+            assert await client.execute(["GET", "A", "B"]) == "E"
+            assert server.executor.db.get("A", "B") == "E"
+        with_server(body)
+
+    def test_pipeline_level4_example(self):
+        queries = [
+            ["SET_AT_WITH_TTL", "A", "B", "C", "1", "10"],
+            ["BACKUP", "3"],
+            ["SET_AT", "A", "D", "E", "4"],
+            ["BACKUP", "5"],
+            ["DELETE_AT", "A", "B", "8"],
+            ["BACKUP", "9"],
+            ["RESTORE", "10", "7"],
+            ["BACKUP", "11"],
+            ["SCAN_AT", "A", "15"],
+            ["SCAN_AT", "A", "16"],
+        ]
+
+        async def body(server, client):
+            results = await client.pipeline(queries)
+            assert results == ["", "1", "", "1", "true", "1", "", "1", "B(C), D(E)", "D(E)"]
+        with_server(body)
+
+    def test_large_pipeline(self):
+        async def body(server, client):
+            sets = [["SET", "A", f"field{i:05}", "x" * 50] for i in range(5000)]
+            assert await client.pipeline(sets) == [""] * 5000
+            gets = [["GET", "A", f"field{i:05}"] for i in range(5000)]
+            assert await client.pipeline(gets) == ["x" * 50] * 5000
+            scan = await client.execute(["SCAN", "A"])
+            assert scan.count("(") == 5000
+        with_server(body)
+
+    def test_values_with_spaces_and_newlines(self):
+        async def body(server, client):
+            await client.execute(["SET", "A", "B", "hello\nworld, (x)"])
+            assert await client.execute(["GET", "A", "B"]) == "hello\nworld, (x)"
+        with_server(body)
+
+    def test_errors_are_reported(self):
+        async def body(server, client):
+            with pytest.raises(DatabaseError):
+                await client.execute(["NOPE", "A"])
+            # the connection keeps working after an error
+            assert await client.execute(["GET", "A", "B"]) == ""
+        with_server(body)
+
+    def test_malformed_lines_do_not_drop_the_pipeline(self):
+        async def body(server, client):
+            client.writer.write(b'{"op": "GET"}\n[]\n[1]\nnot json\n["SET", "A", "B", "C"]\n')
+            replies = [json.loads(await client.reader.readline()) for _ in range(5)]
+            assert all("error" in reply for reply in replies[:4])
+            assert replies[4] == ""
+            assert await client.execute(["GET", "A", "B"]) == "C"
+        with_server(body)
+
+    def test_line_spanning_many_reads(self):
+        async def body(server, client):
+            value = "x" * (5 * server_module.READ_CHUNK)
+            assert await client.pipeline([["SET", "A", "B", value], ["GET", "A", "B"]]) == ["", value]
+        with_server(body)
+
+    def test_overlong_line_closes_the_connection(self, monkeypatch):
+        monkeypatch.setattr(server_module, "REQUEST_LIMIT", 1000)
+
+        async def body(server, client):
+            client.writer.write(b'["SET", "A", "B", "C"]\n["SET", "A", "B", "' + b"x" * 2000)  # never terminated
+            assert json.loads(await client.reader.readline()) == ""
+            assert "error" in json.loads(await client.reader.readline())
+            assert await client.reader.readline() == b""  # closed
+            assert server.executor.db.get("A", "B") == "C"
+        with_server(body)
+
+    def test_idle_timer_compacts_backups(self):
+        db = Simulation(BackupTimeline(keep_last=2), delta_chain=10)
+        for ts in range(1, 6):
+            db.set_at("A", f"f{ts}", "v", ts * 10)
+            db.backup(ts * 10 + 1)
+        oldest = db.back.snapshots[0]
+        assert oldest.parent is not None
+
+        async def run():
+            server = DatabaseServer(db, expire_interval=0.001)
+            await server.start()
+            try:
+                for _ in range(100):
+                    await asyncio.sleep(0.01)
+                    if oldest.parent is None:
+                        break
+            finally:
+                await server.close()
+        asyncio.run(run())
+        assert oldest.parent is None
+
+    def test_close_stops_connection_handlers(self):
+        async def run():
+            errors = []
+            asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+            server = DatabaseServer()
+            await server.start()
+            client = await DatabaseClient.connect(server.host, server.port)
+            await client.execute(["SET", "A", "B", "C"])
+            handlers = set(server._clients)
+            assert len(handlers) == 1
+            await server.close()
+            await asyncio.sleep(0)
+            assert all(task.done() for task in handlers)
+            assert not server._clients
+            assert errors == []
+            await client.close()
+        asyncio.run(run())
+
+    def test_clients_share_database(self):
+        async def body(server, client):
+            await client.execute(["SET", "A", "B", "C"])
+            async with await DatabaseClient.connect(server.host, server.port) as other:
+                assert await other.execute(["GET", "A", "B"]) == "C"
+        with_server(body)
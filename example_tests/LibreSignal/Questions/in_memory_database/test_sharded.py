@@ -0,0 +1,99 @@
+"""
+Tests for the sharded, thread-safe in-memory database.
+
+Run from LibreSignal root directory:
+    pytest Questions/in_memory_database/test_sharded.py -v
+"""
+import threading
+
+import pytest
+from sharded import ShardedSimulation
+from simulation import BackupTimeline
+
+
+class TestShardedSimulation:
+    def test_basic_operations(self):
+        with ShardedSimulation(shards=4) as db:
+            assert db.set("A", "BC", "E") == ""
+            db.set("A", "BD", "F")
+            db.set("B", "C", "G")
+            assert db.get("A", "BC") == "E"
+            assert db.scan_by_prefix("A", "B") == "BC(E), BD(F)"
+            assert db.delete("B", "C") == "true"
+            assert db.scan("B") == ""
+
+    def test_level4_example(self):
+        with ShardedSimulation(shards=4) as db:
+            db.set_at_with_ttl("A", "B", "C", 1, 10)
+            assert db.backup(3) == "1"
+            db.set_at("A", "D", "E", 4)
+            db.set_at("X", "Y", "Z", 4)
+            assert db.backup(5) == "2"
+            assert db.delete_at("A", "B", 8) == "true"
+            assert db.backup(9) == "2"
+            assert db.restore(10, 7) == ""
+            assert db.backup(11) == "2"
+            assert db.scan_at("A", 15) == "B(C), D(E)"
+            assert db.scan_at("A", 16) == "D(E)"
+
+    def test_backup_counts_across_shards(self):
+        with ShardedSimulation(shards=8) as db:
+            for i in range(100):
+                db.set_at(f"key{i}", "f", "v", i + 1)
+            assert db.backup(200) == "100"
+
+    def test_timeline_factory(self):
+        with ShardedSimulation(shards=2, timeline_factory=lambda: BackupTimeline(keep_last=1)) as db:
+            db.backup(1)
+            db.backup(2)
+            assert all(shard.back.timestamps == [2] for shard in db.shards)
+
+    def test_simulation_options_reach_every_shard(self):
+        options = {"maxmemory": 40_000, "maxmemory_policy": "allkeys-random", "history_limit": 3,
+                   "delta_chain": 5, "scan_cache_size": 10, "active_expire_effort": 20}
+        with ShardedSimulation(shards=4, **options) as db:
+            for shard in db.shards:
+                assert shard.maxmemory == 10_000
+                assert (shard.history_limit, shard.delta_chain, shard.active_expire_effort) == (3, 5, 20)
+                assert shard.scan_cache is not None
+            for i in range(1000):
+                db.set_at(f"key{i}", "f", str(i), i + 1)
+            stats = db.stats()
+            assert stats["maxmemory"] == 40_000
+            assert stats["used_memory"] <= 40_000
+            assert stats["evicted_keys"] + stats["records"] == 1000
+            db.set_at("key0", "f", "new", 2000)
+            assert db.get_as_of("key0", "f", 1999) == "0"
+            assert db.get_as_of("key0", "f", 2000) == "new"
+
+    def test_wal_is_rejected(self):
+        with pytest.raises(ValueError):
+            ShardedSimulation(shards=2, wal=object())
+
+    def test_concurrent_writers(self):
+        with ShardedSimulation(shards=8) as db:
+            def writer(t):
+                for i in range(500):
+                    db.set(f"t{t}-{i % 50}", f"f{i}", str(i))
+
+            threads = [threading.Thread(target=writer, args=(t,)) for t in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert db.backup(1) == str(8 * 50)
+            assert db.get("t3-7", "f457") == "457"
+
+    def test_scan_keys_by_prefix_across_shards(self):
+        with ShardedSimulation(shards=4) as db:
+            for i in range(50):
+                db.set(f"user:{i:02}", "f", "v")
+                db.set(f"order:{i:02}", "f", "v")
+            cursor, keys = "0", []
+            while True:
+                cursor, page = db.scan_keys_by_prefix("user:", cursor, 7)
+                assert len(page) <= 7
+                keys += page
+                if cursor == "0":
+                    break
+            assert keys == [f"user:{i:02}" for i in range(50)]
@@ -0,0 +1,178 @@
+"""
+Tests for the binary snapshot files of the in-memory database.
+
+Run from LibreSignal root directory:
+    pytest Questions/in_memory_database/test_snapshot.py -v
+"""
+import os
+
+import pytest
+from simulation import Simulation
+from snapshot import SnapshotFile, attach, dump
+
+
+def backed_up_db():
+    db = Simulation()
+    db.set_at_with_ttl("A", "B", "C", 1, 10)  # 7 ttl left at the backup
+    db.set_at("A", "D", "é", 1)
+    db.set_at("X", "Y", "Z", 2)
+    db.set_at_with_ttl("gone", "f", "v", 1, 2)
+    db.backup(4)
+    return db
+
+
+class TestSnapshotFile:
+    def test_round_trip(self, tmp_path):
+        db = backed_up_db()
+        path = str(tmp_path / "backup.snap")
+        dump(db.back.latest_at_or_before(4), path)
+        with SnapshotFile(path) as snap:
+            assert snap.timestamp == 4
+            assert list(snap) == ["A", "X"]
+            assert snap["A"].scan() == "B(C), D(é)"
+            assert snap["A"].expiry("B") == 11
+            assert snap["X"].expiry("Y") is None
+            assert "gone" not in snap
+            with pytest.raises(KeyError):
+                snap["missing"]
+
+    def test_records_decode_lazily(self, tmp_path):
+        db = Simulation()
+        for i in range(1000):
+            db.set(f"key{i:04}", "f", str(i))
+        db.backup(1)
+        path = str(tmp_path / "big.snap")
+        dump(db.back.latest_at_or_before(1), path)
+        with SnapshotFile(path) as snap:
+            assert len(snap) == 1000
+            assert snap.decoded == 0
+            assert snap["key0777"].get("f") == "777"
+            assert snap.decoded == 1
+
+    def test_restore_from_attached_file(self, tmp_path):
+        path = str(tmp_path / "backup.snap")
+        dump(backed_up_db().back.latest_at_or_before(4), path)
+
+        other = Simulation()
+        snap = attach(other, path)
+        other.restore(20, 4)  # remaining ttl 7: B lives until 27
+        assert other.scan_at("A", 26) == "B(C), D(é)"
+        assert other.scan_at("A", 27) == "D(é)"
+        other.set_at("X", "Y", "new", 28)
+        assert snap["X"].get("Y") == "Z"  # the mapped record stays unchanged
+        snap.close()
+
+    def test_rejects_other_files(self, tmp_path):
+        path = tmp_path / "not.snap"
+        path.write_bytes(b"\x00" * 64)
+        with pytest.raises(ValueError):
+            SnapshotFile(str(path))
+
+    def test_restore_decodes_only_what_is_read(self, tmp_path):
+        db = Simulation()
+        for i in range(100):
+            db.set(f"key{i:03}", "f", str(i))
+        db.backup(1)
+        path = str(tmp_path / "backup.snap")
+        dump(db.back.latest_at_or_before(1), path)
+
+        other = Simulation()
+        snap = attach(other, path)
+        other.restore(5, 1)
+        assert other.used_memory == db.used_memory
+        assert other.get_at("key042", "f", 6) == "42"
+        assert snap.decoded == 1
+        snap.close()
+
+
+    def test_writes_after_restore_decode_only_what_they_touch(self, tmp_path):
+        db = Simulation()
+        for i in range(2000):
+            db.set_at_with_ttl(f"key{i:04}", "f", str(i), 1, 100)
+        db.backup(1)
+        path = str(tmp_path / "backup.snap")
+        dump(db.back.latest_at_or_before(1), path)
+
+        other = Simulation()
+        snap = attach(other, path)
+        other.restore(10, 1)  # remaining ttl 100: fields live until 110
+        other.set_at("key0500", "g", "x", 11)
+        other.set_at("new", "f", "v", 12)
+        assert other.delete_at("key1999", "f", 13) == "true"
+        assert snap.decoded == 2
+        assert other.scan_at("key0500", 109) == "f(500), g(x)"
+        assert other.scan_at("key0500", 110) == "g(x)"
+        assert other.scan_keys_by_prefix("key199", "0", 20) == (
+            "0", [f"key{i}" for i in range(1990, 1999)])
+        assert len(other.keys) == len(other.data) == 2000
+        assert other.scan_keys_by_prefix("n") == ("0", ["new"])
+        assert snap.decoded == 2  # key scans read only the offset table
+        snap.close()
+
+
+class TestBackgroundSave:
+    def test_bgsave_writes_remaining_ttls(self, tmp_path):
+        db = Simulation()
+        assert db.last_save_status()["status"] == "none"
+        db.set_at_with_ttl("A", "B", "C", 1, 10)
+        db.set_at("A", "D", "E", 4)
+        path = str(tmp_path / "dump.snap")
+        assert db.bgsave(path) == "Background saving started"
+        db.set_at("A", "F", "not saved", 5)  # the child saved the state at the fork
+        status = db.last_save_status(wait=True)
+        assert status["status"] == "ok"
+        assert status["path"] == path
+        assert status["duration"] >= 0
+
+        with SnapshotFile(path) as snap:
+            assert snap.timestamp == 4  # the logical clock
+            assert snap["A"].scan() == "B(C), D(E)"
+            assert snap["A"].expiry("B") == 11
+
+    def test_failed_save_is_reported(self, tmp_path):
+        db = Simulation()
+        db.set("A", "B", "C")
+        db.bgsave(str(tmp_path / "missing" / "dump.snap"))
+        assert db.last_save_status(wait=True)["status"] == "err"
+
+    def test_failed_fork_is_reported(self, tmp_path, monkeypatch):
+        db = Simulation()
+        db.set("A", "B", "C")
+
+        def fork():
+            raise BlockingIOError(11, "Resource temporarily unavailable")
+
+        with monkeypatch.context() as patch:
+            patch.setattr(os, "fork", fork, raising=False)
+            with pytest.raises(OSError):
+                db.bgsave(str(tmp_path / "a.snap"))
+        assert db.last_save_status()["status"] == "err"
+        db.bgsave(str(tmp_path / "b.snap"))  # a later save can still start
+        assert db.last_save_status(wait=True)["status"] == "ok"
+
+    def test_failed_save_without_fork_is_reported(self, tmp_path, monkeypatch):
+        db = Simulation()
+        db.set("A", "B", "C")
+
+        def save(path, timestamp):
+            raise TypeError("cannot serialize")
+
+        with monkeypatch.context() as patch:
+            patch.delattr(os, "fork", raising=False)
+            patch.setattr(db, "_save", save)
+            db.bgsave(str(tmp_path / "a.snap"))
+            assert db.last_save_status()["status"] == "err"
+            db.bgsave(str(tmp_path / "b.snap"))  # not stuck in progress
+            assert db.last_save_status()["status"] == "err"
+        db.bgsave(str(tmp_path / "c.snap"))
+        assert db.last_save_status(wait=True)["status"] == "ok"
+
+    def test_one_save_at_a_time(self, tmp_path):
+        db = Simulation()
+        for i in range(10_000):
+            db.set(f"k{i}", "f", "v")
+        db.bgsave(str(tmp_path / "a.snap"))
+        if db.last_save_status()["status"] == "in_progress":
+            with pytest.raises(RuntimeError):
+                db.bgsave(str(tmp_path / "b.snap"))
+        assert db.last_save_status(wait=True)["status"] == "ok"
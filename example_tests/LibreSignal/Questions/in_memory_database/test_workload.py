@@ -0,0 +1,46 @@
+"""
+Tests for the workload generator and replay benchmark of the in-memory database.
+
+Run from LibreSignal root directory:
+    pytest Questions/in_memory_database/test_workload.py -v
+"""
+from collections import Counter
+
+from workload import generate_workload, regressions, replay
+
+
+class TestWorkload:
+    def test_reproducible(self):
+        assert list(generate_workload(500, seed=3)) == list(generate_workload(500, seed=3))
+        assert list(generate_workload(500, seed=3)) != list(generate_workload(500, seed=4))
+
+    def test_zipf_keys_are_skewed(self):
+        keys = Counter(q[1] for q in generate_workload(5_000, keys=1_000, zipf=1.2, backup_every=0))
+        top = keys.most_common(1)[0][1]
+        assert top > 10 * 5_000 / 1_000
+
+    def test_mix_options(self):
+        queries = list(generate_workload(2_000, ttl_ratio=1.0, scan_ratio=0.5, backup_every=100,
+                                         restore_every=250, field_width=12))
+        ops = Counter(q[0] for q in queries)
+        assert ops["SET_AT"] == 0 and ops["SET_AT_WITH_TTL"] > 0
+        assert 800 < ops["SCAN_AT"] + ops["SCAN_BY_PREFIX_AT"] < 1_200
+        assert ops["BACKUP"] == 20
+        assert ops["RESTORE"] > 0
+        assert all(len(q[2]) == 12 for q in queries if q[0] == "GET_AT")
+
+    def test_replay_report(self):
+        report = replay(generate_workload(1_000, backup_every=100))
+        assert report["total"]["queries"] == 1_000
+        assert report["total"]["throughput"] > 0
+        assert set(report["ops"]) >= {"BACKUP", "GET_AT", "SET_AT"}
+        stats = report["ops"]["GET_AT"]
+        assert stats["p50_us"] <= stats["p99_us"] <= stats["max_us"]
+        assert report["memory"]["used_memory"] > 0
+
+    def test_regressions(self):
+        baseline = {"total": {"throughput": 1000.0}, "ops": {"GET_AT": {"p50_us": 1.0, "p99_us": 5.0}}}
+        same = {"total": {"throughput": 950.0}, "ops": {"GET_AT": {"p50_us": 1.1, "p99_us": 5.5}}}
+        worse = {"total": {"throughput": 700.0}, "ops": {"GET_AT": {"p50_us": 1.0, "p99_us": 9.0}}}
+        assert regressions(same, baseline) == []
+        assert len(regressions(worse, baseline)) == 2
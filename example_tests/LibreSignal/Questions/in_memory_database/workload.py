@@ -0,0 +1,252 @@
+"""
+Synthetic workloads and a replay benchmark for the in-memory database.
+============================================================
+generate_workload() produces a reproducible stream of level 1-4 queries:
+zipf-distributed keys, a configurable operation mix, field and value
+widths, ttl mix and backup/restore frequency. replay() runs a stream
+through QueryExecutor and reports per-operation latency percentiles,
+throughput and memory as a JSON-friendly dict.
+
+Usage:
+    python workload.py --queries 1000000 --output report.json
+    python workload.py --zipf 1.3 --ttl-ratio 0.5 --scan-ratio 0.2
+    python workload.py --save queries.jsonl       # replay later with executor.py
+    python workload.py --baseline report.json     # exit 1 on a regression
+"""
+import argparse
+import itertools
+import json
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from collections.abc import Iterable, Iterator
+
+from executor import QueryExecutor
+from simulation import Simulation
+
+# Share of each timestamped operation in the generated stream, before
+# BACKUP and RESTORE, which are issued every backup_every / restore_every
+# queries. scan_ratio and ttl_ratio rebalance these at generation time.
+DEFAULT_MIX = {
+    "SET_AT": 0.35,
+    "GET_AT": 0.45,
+    "DELETE_AT": 0.05,
+    "SCAN_AT": 0.05,
+    "SCAN_BY_PREFIX_AT": 0.10,
+}
+
+
+def zipf_weights(n: int, s: float) -> list[float]:
+    """Cumulative zipf(s) weights over ranks 1..n, for random.choices."""
+    return list(itertools.accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+
+def _name(prefix: str, i: int, width: int) -> str:
+    return f"{prefix}{i}".ljust(width, "_")
+
+
+def generate_workload(count: int, keys: int = 10_000, zipf: float = 1.1, fields: int = 100,
+                      field_width: int = 8, value_width: int = 16, ttl_ratio: float = 0.1,
+                      max_ttl: int = 1_000, scan_ratio: float | None = None, backup_every: int = 10_000,
+                      restore_every: int = 0, mix: dict[str, float] | None = None,
+                      seed: int = 0) -> Iterator[list[str]]:
+    """
+    A lazy, reproducible stream of queries with one timestamp per query.
+
+    Args:
+        count: Number of queries.
+        keys: Number of distinct record keys; key popularity follows zipf.
+        zipf: Zipf exponent (0 is uniform).
+        fields: Number of distinct field names per record (uniform).
+        field_width: Field names are padded to this many characters.
+        value_width: Values are this many characters long.
+        ttl_ratio: Share of SET_AT turned into SET_AT_WITH_TTL.
+        max_ttl: ttls are uniform in [1, max_ttl].
+        scan_ratio: Share of SCAN_AT + SCAN_BY_PREFIX_AT, taken from GET_AT
+            (None keeps the mix as it is).
+        backup_every: Issue a BACKUP every this many queries (0: never).
+        restore_every: Issue a RESTORE to an earlier backup every this many
+            queries (0: never).
+        mix: Operation shares; DEFAULT_MIX if not given.
+        seed: Random seed.
+    """
+    rng = random.Random(seed)
+    mix = dict(mix or DEFAULT_MIX)
+    if scan_ratio is not None:
+        scans = mix.get("SCAN_AT", 0) + mix.get("SCAN_BY_PREFIX_AT", 0)
+        mix["GET_AT"] = max(0.0, mix.get("GET_AT", 0) + scans - scan_ratio)
+        for op in ("SCAN_AT", "SCAN_BY_PREFIX_AT"):
+            mix[op] = scan_ratio * (mix.get(op, 0) / scans if scans else 0.5)
+    ops = list(mix)
+    op_weights = list(itertools.accumulate(mix.values()))
+    key_names = [_name("key", i, 0) for i in range(keys)]
+    rng.shuffle(key_names)  # popularity is unrelated to key order
+    key_weights = zipf_weights(keys, zipf)
+    field_names = [_name("f", i, field_width) for i in range(fields)]
+    value = "v" * value_width
+    backups: list[int] = []
+
+    for ts in range(1, count + 1):
+        if backup_every and ts % backup_every == 0:
+            backups.append(ts)
+            yield ["BACKUP", str(ts)]
+            continue
+        if restore_every and ts % restore_every == 0 and backups:
+            yield ["RESTORE", str(ts), str(rng.choice(backups))]
+            continue
+        op = rng.choices(ops, cum_weights=op_weights)[0]
+        key = rng.choices(key_names, cum_weights=key_weights)[0]
+        if op == "SET_AT":
+            field = rng.choice(field_names)
+            if rng.random() < ttl_ratio:
+                yield ["SET_AT_WITH_TTL", key, field, value, str(ts), str(rng.randint(1, max_ttl))]
+            else:
+                yield ["SET_AT", key, field, value, str(ts)]
+        elif op == "SCAN_AT":
+            yield ["SCAN_AT", key, str(ts)]
+        elif op == "SCAN_BY_PREFIX_AT":
+            yield ["SCAN_BY_PREFIX_AT", key, rng.choice(field_names)[:2], str(ts)]
+        else:
+            yield [op, key, rng.choice(field_names), str(ts)]
+
+
+def _summary(latencies: list[int]) -> dict[str, float]:
+    """Latency statistics in microseconds from nanosecond samples."""
+    latencies.sort()
+    n = len(latencies)
+
+    def pct(q: float) -> float:
+        return latencies[min(n - 1, int(q * n))] / 1e3
+
+    return {
+        "count": n,
+        "mean_us": sum(latencies) / n / 1e3,
+        "p50_us": pct(0.50),
+        "p99_us": pct(0.99),
+        "max_us": latencies[-1] / 1e3,
+    }
+
+
+def replay(queries: Iterable[list[str]], db: Simulation | None = None, trace_memory: bool = False) -> dict:
+    """
+    Run queries and time every one of them.
+
+    Args:
+        queries: Query lists as accepted by QueryExecutor.
+        db: The database to run against (a fresh Simulation by default).
+        trace_memory: Also report the peak of Python allocations traced by
+            tracemalloc, which slows the replay down several times.
+
+    Returns:
+        {"total": {...}, "ops": {name: latency summary}, "memory": {...}}.
+    """
+    executor = QueryExecutor(db)
+    dispatch = executor.dispatch
+    clock = time.perf_counter_ns
+    samples: dict[str, list[int]] = {}
+    if trace_memory:
+        tracemalloc.start()
+    start = clock()
+    for query in queries:
+        handler = dispatch[query[0]]
+        t0 = clock()
+        handler(query)
+        t1 = clock()
+        op_samples = samples.get(query[0])
+        if op_samples is None:
+            op_samples = samples[query[0]] = []
+        op_samples.append(t1 - t0)
+    elapsed = (clock() - start) / 1e9
+    memory = {
+        "used_memory": executor.db.used_memory,
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+    if trace_memory:
+        memory["traced_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    total = sum(len(s) for s in samples.values())
+    # Throughput counts time spent in the database only: a lazily generated
+    # stream would otherwise charge its own cost to every operation.
+    busy = sum(sum(s) for s in samples.values()) / 1e9
+    return {
+        "total": {"queries": total, "seconds": busy, "wall_seconds": elapsed,
+                  "throughput": total / busy if busy else 0.0},
+        "ops": {op: _summary(s) for op, s in sorted(samples.items())},
+        "memory": memory,
+    }
+
+
+def regressions(report: dict, baseline: dict, tolerance: float = 0.2) -> list[str]:
+    """
+    Describe every metric of report that is worse than baseline by more
+    than tolerance: lower throughput, or higher p50/p99 of an operation.
+    """
+    found = []
+    limit = 1 + tolerance
+    old, new = baseline["total"]["throughput"], report["total"]["throughput"]
+    if new * limit < old:
+        found.append(f"throughput {new:,.0f} queries/s, was {old:,.0f}")
+    for op, stats in report["ops"].items():
+        before = baseline["ops"].get(op)
+        if before is None:
+            continue
+        for metric in ("p50_us", "p99_us"):
+            if stats[metric] > before[metric] * limit:
+                found.append(f"{op} {metric} {stats[metric]:.1f}, was {before[metric]:.1f}")
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=1_000_000)
+    parser.add_argument("--keys", type=int, default=10_000)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--fields", type=int, default=100)
+    parser.add_argument("--field-width", type=int, default=8)
+    parser.add_argument("--value-width", type=int, default=16)
+    parser.add_argument("--ttl-ratio", type=float, default=0.1)
+    parser.add_argument("--max-ttl", type=int, default=1_000)
+    parser.add_argument("--scan-ratio", type=float, default=None)
+    parser.add_argument("--backup-every", type=int, default=10_000)
+    parser.add_argument("--restore-every", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="report the traced allocation peak (slow)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--save", help="write the queries as JSON lines here instead of replaying them")
+    parser.add_argument("--baseline", help="JSON report to compare against; exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    config = {name: value for name, value in vars(args).items()
+              if name not in ("trace_memory", "output", "save", "baseline", "tolerance")}
+    workload = generate_workload(
+        args.queries, keys=args.keys, zipf=args.zipf, fields=args.fields, field_width=args.field_width,
+        value_width=args.value_width, ttl_ratio=args.ttl_ratio, max_ttl=args.max_ttl,
+        scan_ratio=args.scan_ratio, backup_every=args.backup_every, restore_every=args.restore_every,
+        seed=args.seed)
+    if args.save:
+        with open(args.save, "w") as f:
+            for query in workload:
+                f.write(json.dumps(query) + "\n")
+        return
+
+    report = {"config": config, **replay(workload, trace_memory=args.trace_memory)}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"regression: {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()